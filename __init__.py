@@ -130,6 +130,18 @@ WARNING! Above 10, this gets slow and eats LOTS of memory!""", min=1, max=50, st
 
     mcGenTexturesOnly = bpy.props.BoolProperty(name='Gen textures only', description='', default=False)
 
+    mcUpdateImport = bpy.props.BoolProperty(name='Update existing import', description='Re-import only the chunks that changed since an earlier import of this world (same area and settings) in this scene, patching its blocks in place.  Needs the new voxel approach', default=False)
+
+    mcInflateThreads = bpy.props.IntProperty(name='Inflate threads', description='How many threads decompress chunk data while chunks are being loaded', min=1, max=32, step=1, default=4, subtype='UNSIGNED')
+
+    mcDecodeProcesses = bpy.props.IntProperty(name='Decode processes', description='Decode chunks on this many worker processes (0 to decode in Blender itself).  Needs the new voxel approach and Omit Mobs', min=0, max=64, step=1, default=0, subtype='UNSIGNED')
+
+    mcChunkCacheMB = bpy.props.IntProperty(name='Chunk cache (MB)', description='Keep decoded chunks on disk, up to this size in all (over every world imported), for later imports of the same world (0 for no cache).  Needs the new voxel approach and Omit Mobs', min=0, max=65536, step=1, default=0, subtype='UNSIGNED')
+
+    mcWorldURL = bpy.props.StringProperty(name='World URL', description='Import the world at this URL instead of the selected save: a world directory on a web server or object store that supports range requests.  Only the parts needed are downloaded', default='')
+
+    mcMmapRegions = bpy.props.BoolProperty(name='Memory-map regions', description='Read region files through memory maps instead of file reads.  Faster for big loads that need most of each region.', default=False)
+
     mcHollow = bpy.props.BoolProperty(name='Hollowing', description='Omit interior blocks.  Significantly smaller scenes resulting in better performance. You most likely REALLY want this enabled unless you know what you are doing.', default=True) # FIXME - not yet
 
     # TODO
@@ -203,7 +215,13 @@ WARNING! Above 10, this gets slow and eats LOTS of memory!""", min=1, max=50, st
             "fasterViewport": self.mcFasterViewport,
             "newVoxel": self.mcNewVoxel, #"genTexturesOnly": self.mcGenTexturesOnly
             "hollow": self.mcHollow,
-            "hideSides": self.mcHideSides}
+            "hideSides": self.mcHideSides,
+            "mmapRegions": self.mcMmapRegions,
+            "inflateThreads": self.mcInflateThreads,
+            "decodeProcesses": self.mcDecodeProcesses,
+            "chunkCacheMB": self.mcChunkCacheMB,
+            "worldURL": self.mcWorldURL.strip(),
+            "updateImport": self.mcUpdateImport}
         #print(str(opts))
         #get selected world name instead via bpy.ops.mcraft.worldselected -- the enumeration as a property/operator...?
         if self.mcGenTexturesOnly:
@@ -233,6 +251,8 @@ WARNING! Above 10, this gets slow and eats LOTS of memory!""", min=1, max=50, st
         row = layout.row()
         row.prop(self, "mcWorldSelectList")
         #row.operator("mcraft.worldlist", icon='')
+        row = layout.row()
+        row.prop(self, "mcWorldURL")
         #col = layout.column()
 
         row = layout.row()
@@ -255,6 +275,7 @@ WARNING! Above 10, this gets slow and eats LOTS of memory!""", min=1, max=50, st
         cont.label(text="General")
         cont.prop(self, "mcLoadAtCursor")
         cont.prop(self, "mcShowSlimeSpawns")
+        cont.prop(self, "mcUpdateImport")
 
         cycles = None
         if hasattr(bpy.context.scene, 'cycles'):
@@ -290,6 +311,10 @@ WARNING! Above 10, this gets slow and eats LOTS of memory!""", min=1, max=50, st
             cont.label(text="***DEVELOPMENT***")
             cont.prop(self,"mcNewVoxel")
             cont.prop(self,"mcGenTexturesOnly")
+            cont.prop(self,"mcMmapRegions")
+            cont.prop(self,"mcInflateThreads")
+            cont.prop(self,"mcDecodeProcesses")
+            cont.prop(self,"mcChunkCacheMB")
         #row = col.row()
         #row = col.row()
 
@@ -0,0 +1,131 @@
+# Decoded chunk cache module.
+# Inflating and parsing a chunk's NBT costs far more than what comes out of it: its
+# sections' block id and data arrays. DecodedChunkCache keeps those on disk, one
+# compressed NumPy file per chunk, so later imports (or a bigger load radius) of the
+# same world read them back instead of decoding again. No bpy in here.
+#
+# Entries are stamped with the chunk's region header timestamp: a chunk saved since
+# it was cached is a miss. The cache is kept under a size limit by evicting the
+# least recently used entries (file mtimes are bumped on every hit). The limit can
+# cover every world dimension's cache at once (see chunkCacheRoot), so that the disk
+# used doesn't grow with each new world imported.
+
+import hashlib, os, zipfile
+
+import numpy as npy
+
+try:
+    from . import chunkdecode, regionfile
+except ImportError:    #imported as a top-level module, outside Blender
+    import chunkdecode, regionfile
+
+_LOAD_ERRORS = (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile)
+
+
+def chunkCacheRoot(cacheRoot):
+    """The directory, under cacheRoot, holding every world dimension's DecodedChunkCache."""
+    return os.path.join(cacheRoot, 'chunks')
+
+
+def chunkCachePath(directory, cacheRoot):
+    """Where the DecodedChunkCache for a region directory (a world dimension: a local path, or a
+WorldStorage location) lives, under cacheRoot."""
+    if '://' not in directory:
+        directory = os.path.abspath(directory)
+    key = hashlib.sha1(directory.encode('utf-8')).hexdigest()[:20]
+    return os.path.join(chunkCacheRoot(cacheRoot), key)
+
+
+class DecodedChunkCache:
+    """Decoded chunks (chunkdecode.SectionBatch of one chunk's sections) of one world dimension,
+stored under directory. The cache files under budgetRoot (default: directory; eg. chunkCacheRoot,
+for one budget over every dimension's cache) are kept to at most about maxBytes of disk."""
+
+    def __init__(self, directory, maxBytes, budgetRoot=None):
+        self.directory = directory
+        self.budgetRoot = directory if budgetRoot is None else budgetRoot
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._files = None    #path: [size, last used], read from budgetRoot on first use
+        self._total = 0
+
+    def _path(self, chunkX, chunkZ):
+        regionX, regionZ = regionfile.regionCoords(chunkX, chunkZ)
+        return os.path.join(self.directory, "r.%d.%d" % (regionX, regionZ), "c.%d.%d.npz" % (chunkX, chunkZ))
+
+    def _index(self):
+        if self._files is None:
+            self._files = {}
+            for dirpath, dirnames, filenames in os.walk(self.budgetRoot):
+                for name in filenames:
+                    if name.endswith('.npz'):
+                        path = os.path.join(dirpath, name)
+                        try:
+                            st = os.stat(path)
+                        except OSError:
+                            continue
+                        self._files[path] = [st.st_size, st.st_mtime]
+            self._total = sum(size for size, used in self._files.values())
+        return self._files
+
+    def get(self, chunkX, chunkZ, timestamp):
+        """The cached SectionBatch for chunk x, z if it was cached at this region timestamp, else None."""
+        path = self._path(chunkX, chunkZ)
+        try:
+            with npy.load(path) as entry:
+                if int(entry['timestamp']) != timestamp:
+                    raise ValueError("stale")
+                sectionY = entry['sectionY']
+                blocks = entry['blocks']
+                data = entry['data']
+        except _LOAD_ERRORS:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            os.utime(path)    #most recently used
+            self._index()[path][1] = os.stat(path).st_mtime
+        except (OSError, KeyError):
+            pass
+        n = len(sectionY)
+        return chunkdecode.SectionBatch(blocks, data, npy.full(n, chunkX, dtype=npy.int32),
+            npy.full(n, chunkZ, dtype=npy.int32), sectionY)
+
+    def put(self, chunkX, chunkZ, timestamp, batch):
+        """Caches batch (one chunk's sections) for chunk x, z at this region timestamp. Failing to
+write is reported, not raised: it's only a cache."""
+        path = self._path(chunkX, chunkZ)
+        files = self._index()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tempPath = path + '.tmp'
+            with open(tempPath, 'wb') as cacheFile:
+                npy.savez_compressed(cacheFile, timestamp=npy.array(timestamp, dtype=npy.int64),
+                    sectionY=batch.sectionY, blocks=batch.blocks, data=batch.data)
+            os.replace(tempPath, path)
+            st = os.stat(path)
+        except OSError as e:
+            print("Couldn't cache chunk %d,%d: %s" % (chunkX, chunkZ, e))
+            return
+        if path in files:
+            self._total -= files[path][0]
+        files[path] = [st.st_size, st.st_mtime]
+        self._total += st.st_size
+        if self._total > self.maxBytes:
+            self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache is within maxBytes."""
+        files = self._index()
+        for path in sorted(files, key=lambda p: files[p][1]):
+            if self._total <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self._total -= files.pop(path)[0]
+            self.evictions += 1
+
@@ -0,0 +1,231 @@
+# Chunk decoding module.
+# Turns inflated Anvil chunk NBT into NumPy block/data arrays. No bpy in here, so it
+# can also be used outside Blender (batch tools, benchmarks, worker processes).
+
+import importlib, importlib.util, multiprocessing, os, site
+
+import numpy as npy
+
+try:
+    from . import nbtreader, regionfile
+except ImportError:    #imported as a top-level module, outside Blender
+    import nbtreader, regionfile
+
+SECTION_BLOCKS = 4096    #16x16x16 block ids per section, YZX order: (y * 16 + z) * 16 + x
+SECTION_NIBBLES = 2048   #4 bits of extra data per block, two per byte (even index in the low nibble)
+
+#Everything the batch decoder looks at in a chunk.
+SECTION_SELECT = nbtreader.compileSelect(['Level/xPos', 'Level/zPos',
+    'Level/Sections/*/Y', 'Level/Sections/*/Blocks', 'Level/Sections/*/Data'])
+
+
+class SectionBatch:
+    """Columnar sections of many chunks: row i of blocks/data is the section at
+(chunkX[i], sectionY[i], chunkZ[i]). Arrays are:
+    blocks   (n, 4096) uint8   block ids, YZX order
+    data     (n, 2048) uint8   packed extra data nibbles
+    chunkX, chunkZ (n,) int32  chunk coordinates
+    sectionY (n,) int8         section index (block y = 16 * sectionY + y within section)"""
+
+    def __init__(self, blocks, data, chunkX, chunkZ, sectionY):
+        self.blocks = blocks
+        self.data = data
+        self.chunkX = chunkX
+        self.chunkZ = chunkZ
+        self.sectionY = sectionY
+
+    def __len__(self):
+        return len(self.sectionY)
+
+    def nibbles(self):
+        """The extra data unpacked to one value per block: (n, 4096) uint8, same order as blocks."""
+        extra = npy.empty((len(self.data), SECTION_BLOCKS), dtype=npy.uint8)
+        extra[:, 0::2] = self.data & 0x0f
+        extra[:, 1::2] = self.data >> 4
+        return extra
+
+
+def batchSections(payloads, layout=None):
+    """Decodes a batch of inflated chunk NBT payloads into one SectionBatch.
+layout is an nbtreader.ChunkLayout for SECTION_SELECT; if not given, one is learned from the first payload."""
+    blockRows = []
+    dataRows = []
+    chunkXs = []
+    chunkZs = []
+    sectionYs = []
+    for payload in payloads:
+        if layout is None:
+            layout = nbtreader.ChunkLayout(payload, SECTION_SELECT)
+        lvl = layout.decode(payload).value['Level'].value
+        cx = lvl['xPos'].value
+        cz = lvl['zPos'].value
+        for section in lvl['Sections'].value:
+            sec = section.value
+            blocks = sec['Blocks'].value
+            data = sec['Data'].value
+            if len(blocks) != SECTION_BLOCKS or len(data) != SECTION_NIBBLES:
+                raise ValueError("chunk %d,%d has a malformed section %d" % (cx, cz, sec['Y'].value))
+            blockRows.append(blocks)
+            dataRows.append(data)
+            chunkXs.append(cx)
+            chunkZs.append(cz)
+            sectionYs.append(sec['Y'].value)
+
+    #one join (copy) per column, rather than a Python loop per section downstream
+    n = len(sectionYs)
+    blocks = npy.frombuffer(b''.join(blockRows), dtype=npy.uint8).reshape(n, SECTION_BLOCKS)
+    data = npy.frombuffer(b''.join(dataRows), dtype=npy.uint8).reshape(n, SECTION_NIBBLES)
+    return SectionBatch(blocks, data, npy.array(chunkXs, dtype=npy.int32),
+        npy.array(chunkZs, dtype=npy.int32), npy.array(sectionYs, dtype=npy.int8))
+
+
+def blockFilter(keepIDs, excludeIDs=()):
+    """Lookup table for fillVoxels: True for the block ids to keep (air, id 0, is never kept)."""
+    keep = npy.zeros(256, dtype=bool)
+    keep[[i for i in keepIDs if 0 < i < 256]] = True
+    keep[[i for i in excludeIDs if 0 < i < 256]] = False
+    return keep
+
+
+def fillVoxels(batch, blockBuffer, extraBuffer, zeroAdjX, zeroAdjZ, keep=None, lowLimit=0, highLimit=255):
+    """Writes a SectionBatch into the [x][y][z] voxel buffers the way processChunk2 does: only blocks
+allowed by keep (see blockFilter; default: anything but air) between lowLimit and highLimit are written.
+zeroAdjX/Z shift chunk coordinates to buffer coordinates.
+Returns (the set of (non-air, in range) block ids that keep rejected, the number of blocks written)."""
+    if len(batch) == 0:
+        return set(), 0
+    blocks = batch.blocks
+    if keep is None:
+        keep = npy.ones(256, dtype=bool)
+        keep[0] = False
+
+    #masks for all sections at once
+    blockY = batch.sectionY.astype(npy.int32)[:, None] * 16 + (npy.arange(SECTION_BLOCKS) >> 8)[None, :]
+    inRange = (blockY >= lowLimit) & (blockY <= highLimit)
+    kept = keep[blocks]
+    rejected = set(npy.unique(blocks[inRange & ~kept]).tolist())
+    rejected.discard(0)
+    mask = kept & inRange
+
+    #YZX section order -> [x][y][z] buffer order
+    blocks = blocks.reshape(-1, 16, 16, 16).transpose(0, 3, 1, 2)
+    extra = batch.nibbles().reshape(-1, 16, 16, 16).transpose(0, 3, 1, 2)
+    mask = mask.reshape(-1, 16, 16, 16).transpose(0, 3, 1, 2)
+    for i in npy.flatnonzero(mask.any(axis=(1, 2, 3))):
+        baseX = (int(batch.chunkX[i]) + zeroAdjX) * 16
+        baseY = int(batch.sectionY[i]) * 16
+        baseZ = (int(batch.chunkZ[i]) + zeroAdjZ) * 16
+        m = mask[i]
+        blockBuffer[baseX:baseX+16, baseY:baseY+16, baseZ:baseZ+16][m] = blocks[i][m]
+        extraBuffer[baseX:baseX+16, baseY:baseY+16, baseZ:baseZ+16][m] = extra[i][m]
+    return rejected, int(npy.count_nonzero(mask))
+
+
+# Multiprocess decoding.
+# Chunk decoding is pure Python and CPU bound, so fillVoxelsParallel spreads it over
+# worker processes. Each worker reads, inflates and decodes its share of the chunks
+# itself and writes them straight into voxel buffers in shared memory (SharedVoxels):
+# nothing but chunk coordinates and a few counts is pickled. Workers are spawned
+# (Blender can't safely be forked) and import this module as a top-level one, so they
+# never import the addon package, or bpy.
+
+def sharedMemoryAvailable():
+    """Whether SharedVoxels (and so fillVoxelsParallel) can be used: shared memory needs Python 3.8."""
+    return importlib.util.find_spec('multiprocessing.shared_memory') is not None
+
+
+class SharedVoxels:
+    """blockBuffer and extraBuffer voxel arrays of the given shape, in shared memory (see sharedMemoryAvailable).
+Drop every other reference to the arrays before calling close()."""
+
+    def __init__(self, shape, dtype=npy.float64):
+        from multiprocessing import shared_memory
+        self.shape = tuple(shape)
+        self.dtype = npy.dtype(dtype)
+        size = max(1, int(npy.prod(self.shape)) * self.dtype.itemsize)
+        #new shared memory is zero filled, like npy.zeros
+        self._blockMem = shared_memory.SharedMemory(create=True, size=size)
+        self._extraMem = shared_memory.SharedMemory(create=True, size=size)
+        self.blockBuffer = npy.ndarray(self.shape, self.dtype, buffer=self._blockMem.buf)
+        self.extraBuffer = npy.ndarray(self.shape, self.dtype, buffer=self._extraMem.buf)
+
+    def close(self):
+        """Frees the shared memory."""
+        self.blockBuffer = self.extraBuffer = None
+        for mem in (self._blockMem, self._extraMem):
+            try:
+                mem.close()
+            except BufferError:
+                pass    #the arrays are still in use (eg. by a traceback): unmapped once they're dropped
+            mem.unlink()
+
+
+def _fillTask(task):
+    """Worker process side of fillVoxelsParallel: decodes one list of chunks into the shared voxels."""
+    (blockName, extraName, shape, dtype, directory, extension, mmapped,
+        chunks, zeroAdjX, zeroAdjZ, keep, lowLimit, highLimit) = task
+    from multiprocessing import shared_memory
+    blockMem = shared_memory.SharedMemory(blockName)
+    extraMem = shared_memory.SharedMemory(extraName)
+    try:
+        blockBuffer = npy.ndarray(shape, dtype, buffer=blockMem.buf)
+        extraBuffer = npy.ndarray(shape, dtype, buffer=extraMem.buf)
+        with regionfile.RegionFilePool(directory, extension, mmapped=mmapped) as pool:
+            payloads = [payload for x, z, payload in regionfile.inflateChunks(pool.readChunks(chunks), 1)
+                if payload is not None]
+        rejected, written = fillVoxels(batchSections(payloads), blockBuffer, extraBuffer,
+            zeroAdjX, zeroAdjZ, keep, lowLimit, highLimit)
+        del blockBuffer, extraBuffer
+    finally:
+        blockMem.close()
+        extraMem.close()
+    return len(payloads), rejected, written
+
+
+class _TopLevel:
+    """Pickles as this module (or, given a name, that attribute of it) imported as a top-level module.
+That's how worker processes get at _fillTask without importing the package it's part of (which needs
+bpy): they have this module's directory on their path, and only they do (see fillVoxelsParallel)."""
+
+    def __init__(self, name=None):
+        self.name = name
+
+    def __reduce__(self):
+        if self.name is None:
+            return importlib.import_module, (__name__.rpartition('.')[2],)
+        return getattr, (_TopLevel(), self.name)
+
+
+def fillVoxelsParallel(voxels, directory, extension, chunkList, zeroAdjX, zeroAdjZ, keep=None,
+        lowLimit=0, highLimit=255, processes=None, mmapped=False, chunksPerTask=32, executable=None):
+    """Decodes the chunks in chunkList (x, z pairs) from the region files in directory (r.x.z.extension)
+into voxels, a SharedVoxels, the way fillVoxels does, on a pool of processes (default: one per core).
+Chunks are handed out a region at a time, chunksPerTask at once. The processes run the Python
+interpreter executable (default sys.executable, which inside an application embedding Python isn't one).
+Yields (chunks decoded, rejected block ids, blocks written) as each task finishes."""
+    byRegion = {}
+    for chunkX, chunkZ in chunkList:
+        byRegion.setdefault(regionfile.regionCoords(chunkX, chunkZ), []).append((chunkX, chunkZ))
+    tasks = []
+    for key in sorted(byRegion):
+        chunks = byRegion[key]
+        for i in range(0, len(chunks), chunksPerTask):
+            tasks.append((voxels._blockMem.name, voxels._extraMem.name, voxels.shape, voxels.dtype.str,
+                directory, extension, mmapped, chunks[i:i + chunksPerTask], zeroAdjX, zeroAdjZ,
+                keep, lowLimit, highLimit))
+    if not tasks:
+        return
+
+    context = multiprocessing.get_context('spawn')
+    if executable is not None:
+        context.set_executable(executable)
+    if __package__:
+        #this module's directory goes on the workers' path, never on this process's
+        worker = _TopLevel('_fillTask')
+        pool = context.Pool(processes, site.addsitedir, (os.path.dirname(os.path.abspath(__file__)),))
+    else:
+        worker = _fillTask
+        pool = context.Pool(processes)
+    with pool:
+        for result in pool.imap_unordered(worker, tasks):
+            yield result
@@ -0,0 +1,117 @@
+# Chunk iterator module.
+# iterChunks streams the chunks of a world dimension as ChunkRecords: a generator
+# rather than the readers' processFunc callbacks, so chunks can be filtered, batched
+# or fed to other tools with a plain for loop, outside Blender as well (no bpy in here).
+# It's built from the same pieces the addon's import uses: the load plan from region
+# header presence bitmaps, coalesced sector-order reads and the section batch decoder.
+#
+# Records are light: coordinates, the region header timestamp and the inflated NBT.
+# Nothing is parsed until asked for, and only one record is held by the iterator at a
+# time, so memory stays bounded by what the consumer keeps.
+
+import os
+
+try:
+    from . import chunkdecode, nbtreader, regionfile
+except ImportError:    #imported as a top-level module, outside Blender
+    import chunkdecode, nbtreader, regionfile
+
+#Region directory of each dimension (by Minecraft dimension id), within the world directory
+DIMENSION_DIRS = {0: 'region', -1: os.path.join('DIM-1', 'region'), 1: os.path.join('DIM1', 'region')}
+
+ORDER_DISK = 'disk'    #a region at a time, in sector order within it: mostly sequential reads
+ORDER_ROWS = 'rows'    #z-major rows across the box, as the addon lays out its load square
+
+
+def regionDirectory(worldDir, dimension=0):
+    """The region directory of a dimension (0 overworld, -1 nether, 1 the end) of the world in worldDir."""
+    try:
+        return os.path.join(worldDir, DIMENSION_DIRS[dimension])
+    except KeyError:
+        raise ValueError("unknown dimension %r" % (dimension,))
+
+
+class ChunkRecord:
+    """One chunk from iterChunks: chunk x, z, its region header timestamp and payload (the inflated
+chunk NBT). Parsing is left to sections() and level(), on demand."""
+    __slots__ = ('x', 'z', 'timestamp', 'payload', '_sections', '_layouts')
+
+    def __init__(self, x, z, timestamp, payload, layouts=None):
+        self.x = x
+        self.z = z
+        self.timestamp = timestamp
+        self.payload = payload
+        self._sections = None
+        self._layouts = {} if layouts is None else layouts    #shared ChunkLayouts, see iterChunks
+
+    def sections(self):
+        """The chunk's sections as a chunkdecode.SectionBatch (Anvil chunks only), decoded on first use."""
+        if self._sections is None:
+            layout = self._layouts.get('sections')
+            if layout is None:
+                layout = self._layouts['sections'] = nbtreader.ChunkLayout(self.payload, chunkdecode.SECTION_SELECT)
+            self._sections = chunkdecode.batchSections([self.payload], layout)
+        return self._sections
+
+    def level(self, select=None):
+        """The chunk's parsed Level compound (as the chunk readers get it). With select (see
+nbtreader.compileSelect) only those tag paths are built; without, tags decode as they're used."""
+        return nbtreader.readNBTBuffer(self.payload, lazy=True, select=select).value['Level'].value
+
+
+def _dimensionPlans(pool, order):
+    """Load plans for every generated chunk of pool's regions, from their header presence bitmaps: one
+per region for ORDER_DISK, one per row of regions (in z-major order) for ORDER_ROWS. However big and
+sparse the dimension, a plan only ever covers the regions that exist, and a row of them at most."""
+    side = regionfile.REGION_CHUNKS
+    rows = {}
+    for regionX, regionZ in pool.listRegions():
+        rows.setdefault(regionZ, []).append(regionX)
+    for regionZ in sorted(rows):
+        rowChunks = []
+        for regionX in sorted(rows[regionZ]):
+            region = pool.region(regionX, regionZ)
+            if region is None:
+                continue
+            presence = region.header.presence()
+            chunks = [(regionX * side + i % side, regionZ * side + i // side) for i in range(side * side) if presence[i]]
+            if order == ORDER_DISK:
+                yield chunks
+            else:
+                rowChunks.extend(chunks)
+        if order == ORDER_ROWS:
+            rowChunks.sort(key=lambda chunk: (chunk[1], chunk[0]))
+            yield rowChunks
+
+
+def iterChunks(worldDir, dimension=0, bbox=None, order=ORDER_DISK, extension=None, mmapped=False, headerCache=None):
+    """Yields a ChunkRecord for every generated chunk of a world dimension (see regionDirectory) within
+bbox, (minChunkX, minChunkZ, maxChunkX, maxChunkZ) inclusive; the whole dimension if bbox is None.
+order is ORDER_DISK or ORDER_ROWS. extension picks the region format ('mca' or 'mcr'): by default
+Anvil if there are any Anvil region files. mmapped and headerCache are as for regionfile.RegionFilePool."""
+    if order not in (ORDER_DISK, ORDER_ROWS):
+        raise ValueError("unknown chunk order %r" % (order,))
+    directory = regionDirectory(worldDir, dimension)
+    if extension is None:
+        anvil = regionfile.RegionFilePool(directory, 'mca').listRegions()
+        extension = 'mca' if anvil else 'mcr'
+
+    pool = regionfile.RegionFilePool(directory, extension, mmapped=mmapped, headerCache=headerCache)
+    try:
+        if bbox is None:
+            plans = _dimensionPlans(pool, order)
+        else:
+            minX, minZ, maxX, maxZ = bbox
+            plans = [pool.generatedChunks([(x, z) for z in range(minZ, maxZ + 1) for x in range(minX, maxX + 1)])]
+
+        layouts = {}
+        for chunks in plans:
+            if order == ORDER_DISK:
+                stream = pool.readChunks(chunks)
+            else:
+                stream = ((x, z, pool.readSectors(x, z)) for x, z in chunks)
+            for x, z, sectors in stream:
+                if sectors is not None:
+                    yield ChunkRecord(x, z, pool.chunkTimestamp(x, z), regionfile.inflateChunk(sectors), layouts)
+    finally:
+        pool.close()
@@ -1,107 +1,105 @@
-import os, bpy
+import sys, bpy
 
-from struct import unpack   #, error as StructError
-from . import nbtreader, mcregionreader
+from . import nbtreader, mcregionreader, regionfile, chunkdecode
 from .mineregion import OPTIONS, EXCLUDED_BLOCKS, BLOCKDATA, REPORTING, unknownBlockIDs, WORLD_ROOT
 ##..yuck: they're immutable and don't return properly except for the dict-type ones. Get rid of this in next cleanup.
 
-from math import floor
+#The only parts of a chunk's NBT the block readers look at. Everything else
+#(light arrays, heightmap, tile entities...) is skipped without being parsed.
+CHUNK_SELECT = nbtreader.compileSelect(['Level/xPos', 'Level/zPos', 'Level/Biomes',
+    'Level/Sections/*/Y', 'Level/Sections/*/Blocks', 'Level/Sections/*/Data'])
+CHUNK_SELECT_MOBS = nbtreader.compileSelect(['Level/xPos', 'Level/zPos', 'Level/Biomes',
+    'Level/Sections/*/Y', 'Level/Sections/*/Blocks', 'Level/Sections/*/Data', 'Level/Entities'])
+
+def pythonExecutable():
+    """The Python interpreter Blender runs, for worker processes: before 2.91, sys.executable is Blender itself."""
+    return getattr(bpy.app, 'binary_path_python', None) or sys.executable
 
 class AnvilChunkReader(mcregionreader.ChunkReader):
 
+    REGION_EXTENSION = 'mca'
+
+    def __init__(self, mmapRegions=False, headerCache=None, storage=None, regionDir='.'):
+        mcregionreader.ChunkReader.__init__(self, mmapRegions, headerCache, storage, regionDir)
+        #Chunk layouts (see nbtreader.ChunkLayout) learned from the first chunk read with each selection.
+        #Per reader, so per import: every world gets its own.
+        self.chunkLayouts = {}
+
     #readBlock( bX, bZ (by?) ...  ignoring 'region' boundaries and chunk boundaries? We need an ignore-chunk-boundaries level of abstraction
 
-    def getSingleBlock(chunkXZ, blockXYZ):   #returns the value and extradata bits for a single block of given absolute x,y,z block coords within chunk cx,cz. or None if area not generated.
+    def getSingleBlock(self, chunkXZ, blockXYZ):   #returns the value and extradata bits for a single block of given absolute x,y,z block coords within chunk cx,cz. or None if area not generated.
         #y is value from 0..255
-        cx, cy = chunkXZ
-        bX,bY,bZ = blockXYZ
-        rX = floor(cx / 32) # is this the same as >> 8 ??
-        rZ = floor(cz / 32)
-        rHdrOffset = ((cx % 32) + (cz % 32) * 32) * 4
-        rFile = "r.%d.%d.mca" % (rx, rz)
-        if not os.path.exists(rFile):
-            return None
-        with open(rFile, 'rb') as regionfile:
-            regionfile.seek(rheaderoffset)
-            cheadr = regionfile.read(4)
-            dataoffset = unpack(">i", b'\x00'+cheadr[0:3])[0]
-            chunksectorcount = cheadr[3]
-            if dataoffset == 0 and chunksectorcount == 0:
-                return None #Region exists, but the chunk we're after was never created within it.
+        cx, cz = chunkXZ
+        dX,dY,dZ = blockXYZ
+        sectorData = self.regionPool.readSectors(cx, cz)
+        if sectorData is None:
+            return None #Region or chunk never generated.
+        chunkData = regionfile.inflateChunk(sectorData)
+        layoutKey = id(chunkdecode.SECTION_SELECT)
+        if layoutKey not in self.chunkLayouts:
+            self.chunkLayouts[layoutKey] = nbtreader.ChunkLayout(chunkData, chunkdecode.SECTION_SELECT)
+        batch = chunkdecode.batchSections([chunkData], self.chunkLayouts[layoutKey])
+        rows = (batch.sectionY == (dY >> 4)).nonzero()[0]
+        if len(rows) == 0:
+            return None #No section there.
+        blockIndex = ((dY & 15) * 16 + dZ) * 16 + dX
+        return int(batch.blocks[rows[0], blockIndex])    #, extravalue)
+
+    def decodeChunks(self, chunks):
+        """Yields (chunkX, chunkZ, chunkLvl) for each (chunkX, chunkZ, chunkData) in chunks (see readChunks),
+chunkLvl being the chunk's parsed Level compound (None where chunkData is None). Pass chunkLvl on to
+readChunk (or processChunk...) to skip parsing the chunk again."""
+        chunkSelect = CHUNK_SELECT if OPTIONS['omitmobs'] else CHUNK_SELECT_MOBS
+        for chunkX, chunkZ, chunkData in chunks:
+            if chunkData is None:
+                yield chunkX, chunkZ, None
             else:
-                #possibly check for cached chunk data here, under the cx,cz in a list of already-loaded sets.
-                chunkdata = AnvilChunkReader._readChunkData(regionfile, dataoffset, chunksectorcount)
-                chunkLvl = chunkdata.value['Level'].value
-                sections = chunkLvl['Sections'].value
-                #each section is a 16x16x16 piece of chunk, with a Y-byte from 0-15, so that the 'y' value is 16*that + in-section-Y-value
-                #some sections can be skipped, so we must iterate to find the right one with the 'Y' we expect.
-                bSection = bY / 16
-                sect = None
-                for section in sections:
-                    secY = section.value['Y'].value
-                    if secY == bSection:
-                        sect = section.value
-                if sect is None:
-                    return None
-                blockData = sec['Blocks'].value    #a TAG_Byte_Array value (bytes object). Blocks is 16x16 bytes
-                extraData = sec['Data'].value      #BlockLight, Data and SkyLight are 16x16 "4-bit cell" additional data arrays.
-                sY = dY % 16
-                blockIndex = (sY * 16 + dZ) * 16 + dX
-                blockID = blockData[ blockIndex ]
-                return blockID    #, extravalue)
-                #NB: this can be made massively more efficient by storing 4 'neighbour chunk' data reads for every chunk properly processed.
-                #Don't need to do diagonals, even.
-
-    
+                yield chunkX, chunkZ, AnvilChunkReader._readChunkData(chunkData, chunkSelect, self.chunkLayouts).value['Level'].value
+
     #def readChunk(self, chunkPosX, chunkPosZ, vertexBuffer, processFunc):  # aka "readChunkFromRegion" ...
-    def readChunk(self, chunkPosX, chunkPosZ, processFunc):  # aka "readChunkFromRegion" ...
-        """Loads chunk located at the X,Z chunk location provided."""
+    def readChunk(self, chunkPosX, chunkPosZ, processFunc, chunkData=None, chunkLvl=None):  # aka "readChunkFromRegion" ...
+        """Loads chunk located at the X,Z chunk location provided (from its inflated chunkData, if it's already
+been read, or its parsed chunkLvl, if it's already been decoded)."""
 
         global REPORTING
 
-        #region containing a given chunk is found thusly: floor of c over 32
-        regionX = floor(chunkPosX / 32)
-        regionZ = floor(chunkPosZ / 32)
-
-        rheaderoffset = ((chunkPosX % 32) + (chunkPosZ % 32) * 32) * 4
-
-        #print("Reading chunk %d,%d from region %d,%d" %(chunkPosX, chunkPosZ, regionX,regionZ))
-
-        rfileName = "r.%d.%d.mca" % (regionX, regionZ)
-        if not os.path.exists(rfileName):
-            #Can't load: it doesn't exist!
-            print("No such region generated.")
+        if chunkLvl is not None:
+            processFunc(chunkLvl)
+            REPORTING['totalchunks'] += 1
             return
 
-        with open(rfileName, 'rb') as regfile:
-            # header for the chunk we want is at...
-            #The location in the region file of a chunk at (x, z) (in chunk coordinates) can be found at byte offset 4 * ((x mod 32) + (z mod 32) * 32) in its McRegion file.
-            #Its timestamp can be found 4096 bytes later in the file
-            regfile.seek(rheaderoffset)
-            cheadr = regfile.read(4)
-            dataoffset = unpack(">i", b'\x00'+cheadr[0:3])[0]
-            chunksectorcount = cheadr[3]
-            
-            if dataoffset == 0 and chunksectorcount == 0:
-                pass
-                #print("Region exists, but chunk has never been created within it.")
-            else:
-                chunkdata = AnvilChunkReader._readChunkData(regfile, dataoffset, chunksectorcount)  #todo: rename that function!
-                #Geometry creation! etc... If surface only, can get heights etc from lightarray?
+        if chunkData is None:
+            #region containing a given chunk is found thusly: floor of c over 32 (the pool does that)
+            region = self.regionPool.regionForChunk(chunkPosX, chunkPosZ)
+            if region is None:
+                return    #Can't load: it doesn't exist!
+
+            #The location in the region file of a chunk at (x, z) (in chunk coordinates) is in the region's (cached) header.
+            sectorData = region.readSectors(chunkPosX, chunkPosZ)
+            if sectorData is not None:
+                chunkData = regionfile.inflateChunk(sectorData)
+        
+        if chunkData is None:
+            pass
+            #print("Region exists, but chunk has never been created within it.")
+        else:
+            chunkSelect = CHUNK_SELECT if OPTIONS['omitmobs'] else CHUNK_SELECT_MOBS
+            chunkdata = AnvilChunkReader._readChunkData(chunkData, chunkSelect, self.chunkLayouts)  #todo: rename that function!
+            #Geometry creation! etc... If surface only, can get heights etc from lightarray?
 
-                #top level tag in NBT is an unnamed TAG_Compound, for some reason, containing a named TAG_Compound "Level"
-                chunkLvl = chunkdata.value['Level'].value
-                #chunkXPos = chunkLvl['xPos'].value
-                #chunkZPos = chunkLvl['zPos'].value
-                #print("Reading blocks for chunk: (%d, %d)\n" % (chunkXPos, chunkZPos))
-                #AnvilChunkReader._readBlocks(chunkLvl, vertexBuffer)
-                processFunc(chunkLvl)
-                #print("Loaded chunk %d,%d" % (chunkPosX,chunkPosZ))
+            #top level tag in NBT is an unnamed TAG_Compound, for some reason, containing a named TAG_Compound "Level"
+            chunkLvl = chunkdata.value['Level'].value
+            #chunkXPos = chunkLvl['xPos'].value
+            #chunkZPos = chunkLvl['zPos'].value
+            #print("Reading blocks for chunk: (%d, %d)\n" % (chunkXPos, chunkZPos))
+            #AnvilChunkReader._readBlocks(chunkLvl, vertexBuffer)
+            processFunc(chunkLvl)
+            #print("Loaded chunk %d,%d" % (chunkPosX,chunkPosZ))
 
-                REPORTING['totalchunks'] += 1
+            REPORTING['totalchunks'] += 1
 
 
-    def processChunk2(self, chunkPosX, chunkPosZ, blockBuffer, extraBuffer, zeroAdjX, zeroAdjZ):
+    def processChunk2(self, chunkPosX, chunkPosZ, blockBuffer, extraBuffer, zeroAdjX, zeroAdjZ, chunkData=None, chunkLvl=None):
         # FIXME - implement me!
         #print("reading chunk: "+str(chunkPosX)+","+str(chunkPosZ)+" offset: "+str(zeroAdjX)+", "+str(zeroAdjZ)+" array chunk index: "+str(chunkPosX+zeroAdjX)+", "+str(chunkPosZ+zeroAdjZ))
         def _internalProcessChunk2(lvl): # handle chunk
@@ -115,51 +113,85 @@ class AnvilChunkReader(mcregionreader.ChunkReader):
             #pass
             AnvilChunkReader._processBlocks(lvl, _internalProcessBlock2)
 
-        self.readChunk(chunkPosX, chunkPosZ, _internalProcessChunk2)
-
-    def processChunk(self, chunkPosX, chunkPosY, vertexBuffer):
+        self.readChunk(chunkPosX, chunkPosZ, _internalProcessChunk2, chunkData, chunkLvl)
+
+    def fillVoxelsParallel(self, chunkList, voxels, zeroAdjX, zeroAdjZ, processes=None):
+        """processChunk2 for a whole list of chunks at once, decoded on a pool of worker processes that write
+straight into voxels (a chunkdecode.SharedVoxels holding the block and extra buffers). Entities aren't
+loaded this way, and the region files must be local (see RegionFilePool.localDirectory).
+Yields the number of chunks decoded as each worker task finishes."""
+        global unknownBlockIDs, REPORTING
+        keep = chunkdecode.blockFilter(BLOCKDATA, EXCLUDED_BLOCKS)
+        for chunks, rejected, written in chunkdecode.fillVoxelsParallel(voxels, self.regionPool.localDirectory(),
+                self.REGION_EXTENSION, chunkList, zeroAdjX, zeroAdjZ, keep, OPTIONS['lowlimit'], OPTIONS['highlimit'],
+                processes, self.regionPool.mmapped, executable=pythonExecutable()):
+            unknownBlockIDs.update(rejected.difference(EXCLUDED_BLOCKS))
+            REPORTING['totalchunks'] += chunks
+            REPORTING['blocksread'] += written
+            yield chunks
+
+    def fillVoxelsCached(self, chunkList, cache, blockBuffer, extraBuffer, zeroAdjX, zeroAdjZ, inflateThreads=1):
+        """processChunk2 for a whole list of chunks through cache (a chunkcache.DecodedChunkCache): cached
+chunks are filled from it, the rest are read, decoded and cached. Entities aren't loaded this way.
+Yields once per chunk (generated or not)."""
+        keep = chunkdecode.blockFilter(BLOCKDATA, EXCLUDED_BLOCKS)
+        timestamps = {}
+        for x, z in chunkList:
+            timestamp = self.regionPool.chunkTimestamp(x, z)
+            if timestamp is not None:
+                batch = cache.get(x, z, timestamp)
+                if batch is None:
+                    timestamps[(x, z)] = timestamp    #read and decode it below
+                    continue
+                self._fillBatch(batch, blockBuffer, extraBuffer, zeroAdjX, zeroAdjZ, keep)
+            yield 1
+
+        def decodeMisses():
+            layoutKey = id(chunkdecode.SECTION_SELECT)
+            for x, z, chunkData in self.readChunks(list(timestamps), inflateThreads):
+                if chunkData is None:
+                    yield None
+                    continue
+                if layoutKey not in self.chunkLayouts:
+                    self.chunkLayouts[layoutKey] = nbtreader.ChunkLayout(chunkData, chunkdecode.SECTION_SELECT)
+                batch = chunkdecode.batchSections([chunkData], self.chunkLayouts[layoutKey])
+                cache.put(x, z, timestamps[(x, z)], batch)
+                yield batch
+
+        #misses are decoded (and cached) on a thread of their own, ahead of being filled in
+        for batch in regionfile.pipelineStage(decodeMisses()):
+            if batch is not None:
+                self._fillBatch(batch, blockBuffer, extraBuffer, zeroAdjX, zeroAdjZ, keep)
+            yield 1
+
+    @staticmethod
+    def _fillBatch(batch, blockBuffer, extraBuffer, zeroAdjX, zeroAdjZ, keep):
+        global unknownBlockIDs, REPORTING
+        rejected, written = chunkdecode.fillVoxels(batch, blockBuffer, extraBuffer, zeroAdjX, zeroAdjZ, keep,
+            OPTIONS['lowlimit'], OPTIONS['highlimit'])
+        unknownBlockIDs.update(rejected.difference(EXCLUDED_BLOCKS))
+        REPORTING['totalchunks'] += 1
+        REPORTING['blocksread'] += written
+
+    def processChunk(self, chunkPosX, chunkPosY, vertexBuffer, chunkData=None, chunkLvl=None):
         def _internalProcessChunk(lvl):
             AnvilChunkReader._readBlocks(lvl, vertexBuffer) # once _processBlocks above is done, migrate to this and eliminate _readBlocks
 
-        self.readChunk(chunkPosX, chunkPosY, _internalProcessChunk)
-
-
-    def _readChunkData(bstream, chunkOffset, chunkSectorCount): #rename this!
-        #get the datastring out of the file...
-        import io, zlib
-
-        #cf = open(fname, 'rb')
-        initialPos = bstream.tell()
-
-        cstart = chunkOffset * 4096    #4 kiB
-        clen = chunkSectorCount * 4096
-        bstream.seek(cstart)    #this bstream is the region file
+        self.readChunk(chunkPosX, chunkPosY, _internalProcessChunk, chunkData, chunkLvl)
 
-        chunkHeaderAndData = bstream.read(clen)
 
-        #chunk header stuff is:
-        # 4 bytes: length (of remaining data)
-        # 1 byte : compression type (1 - gzip - unused; 2 - zlib: it should always be this in actual fact)
-        # then the rest, is length-1 bytes of compressed (zlib) NBT data.
-
-        chunkDLength = unpack(">i", chunkHeaderAndData[0:4])[0]
-        chunkDCompression = chunkHeaderAndData[4]
-        if chunkDCompression != 2:
-            print("Not a zlib-compressed chunk!?")
-            raise StringError()    #MinecraftSomethingError, perhaps.
-
-        chunkZippedBytes = chunkHeaderAndData[5:]
-
-        #could/should check that chunkZippedBytes is same length as chunkDLength-1.
-
-        #put the regionfile byte stream back to where it started:
-        bstream.seek(initialPos)
-
-        #Read the compressed chunk data
-        zipper = zlib.decompressobj()
-        chunkData = zipper.decompress(chunkZippedBytes)
-        chunkDataAsFile = io.BytesIO(chunkData)
-        chunkNBT = nbtreader.readNBT(chunkDataAsFile)
+    def _readChunkData(chunkData, select=None, layouts=None): #rename this!
+        #chunkData is the inflated NBT (see regionfile.inflateChunk for the chunk header and compression)
+        #Parse the chunk straight out of memory (no BytesIO stream).
+        #Only the selected tag paths are built; with no selection, tags are decoded lazily as they're used.
+        if select is not None and layouts is not None:
+            #keyed on the selection object itself: they're the module-level constants above
+            layout = layouts.get(id(select))
+            if layout is None:
+                layout = layouts[id(select)] = nbtreader.ChunkLayout(chunkData, select)
+            chunkNBT = layout.decode(chunkData)
+        else:
+            chunkNBT = nbtreader.readNBTBuffer(chunkData, lazy=True, select=select)
 
         return chunkNBT
 
@@ -285,9 +317,9 @@ class AnvilChunkReader(mcregionreader.ChunkReader):
         #heightmap = chunkLevelData['HeightMap'].value
         #'TileEntities' -- surely need this for piston data and stuff, no?
         
-        entities = chunkLevelData['Entities'].value    # load ze sheeps!! # a list of tag-compounds.
         #omitmobs = OPTIONS['omitmobs']
         if not OPTIONS['omitmobs']:
+            entities = chunkLevelData['Entities'].value    # load ze sheeps!! # a list of tag-compounds.
             AnvilChunkReader._loadEntities(entities)
 
         skyHighLimit = OPTIONS['highlimit']
@@ -415,9 +447,9 @@ class AnvilChunkReader(mcregionreader.ChunkReader):
         #heightmap = chunkLevelData['HeightMap'].value
         #'TileEntities' -- surely need this for piston data and stuff, no?
         
-        entities = chunkLevelData['Entities'].value    # load ze sheeps!! # a list of tag-compounds.
         #omitmobs = OPTIONS['omitmobs']
         if not OPTIONS['omitmobs']:
+            entities = chunkLevelData['Entities'].value    # load ze sheeps!! # a list of tag-compounds.
             AnvilChunkReader._loadEntities(entities)
 
         skyHighLimit = OPTIONS['highlimit']
@@ -1,99 +1,93 @@
 # FIXME - obsolete and likely no longer working as of 1.6.3... any reason to keep around?
 
-import os
-
-from struct import unpack   #, error as StructError
-from . import nbtreader
+from . import nbtreader, regionfile
 from mathutils import Vector
 from .mineregion import OPTIONS, EXCLUDED_BLOCKS, BLOCKDATA, REPORTING, unknownBlockIDs, getMCBlockType, mcToBlendCoord #yuck!
 ##..yuck: they're immutable and don't return properly except for the dict-type ones. Get rid of this in next cleanup.
 
+#The parts of a (pre-Anvil) chunk's NBT that readBlocks uses.
+CHUNK_SELECT = nbtreader.compileSelect(['Level/xPos', 'Level/zPos', 'Level/Blocks', 'Level/HeightMap', 'Level/Data'])
+
 class ChunkReader:
 
+    REGION_EXTENSION = 'mcr'
+
+    def __init__(self, mmapRegions=False, headerCache=None, storage=None, regionDir='.'):
+        #Region files are opened once per reader (so per import, from regionDir: by default the current directory),
+        #with their headers cached, and shared by every chunk read. mmapRegions maps them instead of seek/reading.
+        #headerCache (a regionfile.RegionHeaderCache) keeps the headers from one import to the next.
+        #With a storage (a worldstorage.WorldStorage, eg. a remote world) regionDir is within it.
+        self.regionPool = regionfile.RegionFilePool(regionDir, self.REGION_EXTENSION, mmapped=mmapRegions,
+            headerCache=headerCache, storage=storage)
+
+    def close(self):
+        """Closes the region files this reader has open."""
+        self.regionPool.close()
+
+    def readChunks(self, chunkList, inflateThreads=1):
+        """Yields (chunkX, chunkZ, chunkData) for every x, z in chunkList, chunkData being the inflated chunk
+NBT (None where there's no such chunk). Each region's chunks are read in sector order with adjacent sectors
+read together, on a thread of their own that reads ahead, then inflated on inflateThreads threads: chunks
+come back in the order they finish. Until it's done, the region files are the reading thread's.
+Pass chunkData on to readChunk (or processChunk...) to skip reading the chunk again."""
+        return regionfile.inflateChunks(regionfile.pipelineStage(self.regionPool.readChunks(chunkList)), inflateThreads)
+
+    def decodeChunks(self, chunks):
+        """Yields (chunkX, chunkZ, chunkLvl) for each (chunkX, chunkZ, chunkData) in chunks (see readChunks),
+chunkLvl being the chunk's parsed Level compound (None where chunkData is None). Pass chunkLvl on to
+readChunk to skip parsing the chunk again."""
+        for chunkX, chunkZ, chunkData in chunks:
+            if chunkData is None:
+                yield chunkX, chunkZ, None
+            else:
+                yield chunkX, chunkZ, self._readChunkData(chunkData, CHUNK_SELECT).value['Level'].value
+
     #readBlock( cX,cZ,(sY?), (bX,bY,bZ) ... )  ignoring 'region' boundaries and chunk boundaries? We need an ignore-chunk-boundaries level of abstraction
 
-    def readChunk(self, chunkPosX, chunkPosZ, vertexBuffer):  # aka "readChunkFromRegion" ...
-        """Loads chunk located at the X,Z chunk location provided."""
-        from math import floor
+    def readChunk(self, chunkPosX, chunkPosZ, vertexBuffer, chunkData=None, chunkLvl=None):  # aka "readChunkFromRegion" ...
+        """Loads chunk located at the X,Z chunk location provided (from its inflated chunkData, if it's already
+been read, or its parsed chunkLvl, if it's already been decoded)."""
         global REPORTING
 
-        #region containing a given chunk is found thusly: floor of c over 32
-        regionX = floor(chunkPosX / 32)
-        regionZ = floor(chunkPosZ / 32)
-
-        rheaderoffset = ((chunkPosX % 32) + (chunkPosZ % 32) * 32) * 4
-
-        #print("Reading chunk %d,%d from region %d,%d" %(chunkPosX, chunkPosZ, regionX,regionZ))
-
-        rfileName = "r.%d.%d.mcr" % (regionX, regionZ)
-        if not os.path.exists(rfileName):
-            #Can't load: it doesn't exist!
-            print("No such region generated.")
+        if chunkLvl is not None:
+            ChunkReader.readBlocks(chunkLvl, vertexBuffer)
+            REPORTING['totalchunks'] += 1
             return
 
-        with open(rfileName, 'rb') as regfile:
-            # header for the chunk we want is at...
-            #The location in the region file of a chunk at (x, z) (in chunk coordinates) can be found at byte offset 4 * ((x mod 32) + (z mod 32) * 32) in its McRegion file.
-            #Its timestamp can be found 4096 bytes later in the file
-            regfile.seek(rheaderoffset)
-            cheadr = regfile.read(4)
-            dataoffset = unpack(">i", b'\x00'+cheadr[0:3])[0]
-            chunksectorcount = cheadr[3]
-
-            if dataoffset == 0 and chunksectorcount == 0:
-                pass
-                #print("Region exists, but chunk has never been created within it.")
-            else:
-                chunkdata = self._readChunkData(regfile, dataoffset, chunksectorcount)  #todo: rename that function!
-                #Geometry creation! etc... If surface only, can get heights etc from lightarray?
-
-                #top level tag in NBT is an unnamed TAG_Compound, for some reason, containing a named TAG_Compound "Level"
-                chunkLvl = chunkdata.value['Level'].value
-                #chunkXPos = chunkLvl['xPos'].value
-                #chunkZPos = chunkLvl['zPos'].value
-                #print("Reading blocks for chunk: (%d, %d)\n" % (chunkXPos, chunkZPos))
-                ChunkReader.readBlocks(chunkLvl, vertexBuffer)
-                #print("Loaded chunk %d,%d" % (chunkPosX,chunkPosZ))
-
-                REPORTING['totalchunks'] += 1
-
-
-    def _readChunkData(self, bstream, chunkOffset, chunkSectorCount): #rename this!
-        #get the datastring out of the file...
-        import io, zlib
+        if chunkData is None:
+            #region containing a given chunk is found thusly: floor of c over 32 (the pool does that)
+            region = self.regionPool.regionForChunk(chunkPosX, chunkPosZ)
+            if region is None:
+                return    #Can't load: it doesn't exist!
 
-        #cf = open(fname, 'rb')
-        initialPos = bstream.tell()
+            #The location in the region file of a chunk at (x, z) (in chunk coordinates) is in the region's (cached) header.
+            sectorData = region.readSectors(chunkPosX, chunkPosZ)
+            if sectorData is not None:
+                chunkData = regionfile.inflateChunk(sectorData)
 
-        cstart = chunkOffset * 4096    #4 kiB
-        clen = chunkSectorCount * 4096
-        bstream.seek(cstart)    #this bstream is the region file
-
-        chunkHeaderAndData = bstream.read(clen)
-
-        #chunk header stuff is:
-        # 4 bytes: length (of remaining data)
-        # 1 byte : compression type (1 - gzip - unused; 2 - zlib: it should always be this in actual fact)
-        # then the rest, is length-1 bytes of compressed (zlib) NBT data.
-
-        chunkDLength = unpack(">i", chunkHeaderAndData[0:4])[0]
-        chunkDCompression = chunkHeaderAndData[4]
-        if chunkDCompression != 2:
-            print("Not a zlib-compressed chunk!?")
-            raise StringError()    #MinecraftSomethingError, perhaps.
+        if chunkData is None:
+            pass
+            #print("Region exists, but chunk has never been created within it.")
+        else:
+            chunkdata = self._readChunkData(chunkData, CHUNK_SELECT)  #todo: rename that function!
+            #Geometry creation! etc... If surface only, can get heights etc from lightarray?
 
-        chunkZippedBytes = chunkHeaderAndData[5:]
+            #top level tag in NBT is an unnamed TAG_Compound, for some reason, containing a named TAG_Compound "Level"
+            chunkLvl = chunkdata.value['Level'].value
+            #chunkXPos = chunkLvl['xPos'].value
+            #chunkZPos = chunkLvl['zPos'].value
+            #print("Reading blocks for chunk: (%d, %d)\n" % (chunkXPos, chunkZPos))
+            ChunkReader.readBlocks(chunkLvl, vertexBuffer)
+            #print("Loaded chunk %d,%d" % (chunkPosX,chunkPosZ))
 
-        #could/should check that chunkZippedBytes is same length as chunkDLength-1.
+            REPORTING['totalchunks'] += 1
 
-        #put the regionfile byte stream back to where it started:
-        bstream.seek(initialPos)
 
-        #Read the compressed chunk data
-        zipper = zlib.decompressobj()
-        chunkData = zipper.decompress(chunkZippedBytes)
-        chunkDataAsFile = io.BytesIO(chunkData)
-        chunkNBT = nbtreader.readNBT(chunkDataAsFile)
+    def _readChunkData(self, chunkData, select=None): #rename this!
+        #chunkData is the inflated NBT (see regionfile.inflateChunk for the chunk header and compression)
+        #Parse the chunk straight out of memory (no BytesIO stream).
+        #Only the selected tag paths are built; with no selection, tags are decoded lazily as they're used.
+        chunkNBT = nbtreader.readNBTBuffer(chunkData, lazy=True, select=select)
 
         return chunkNBT
 
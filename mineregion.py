@@ -43,10 +43,10 @@ from . import sysutil
 #faceindices order: (bottom, top, right, front, left, back)
 #NB: this should probably change, as it was started by some uv errors.
 
-from . import nbtreader
+from . import nbtreader, regionfile, worldstorage, voxelmesh
 #level.dat, .mcr McRegion, .mca Anvil: all different formats, but all are NBT.
 
-import sys, os, gzip
+import sys, os, urllib.parse
 import datetime
 #from struct import calcsize, unpack, error as StructError
 
@@ -61,6 +61,11 @@ wseed = None	#store chosen world's worldseed, handy for slimechunk calcs.
 
 MCREGION_VERSION_ID = 0x4abc;	# Check world's level.dat 'version' property for these.
 ANVIL_VERSION_ID = 0x4abd;		# 
+
+#The bits of level.dat we actually use, for the world list and for loading.
+LEVELDAT_LIST_SELECT = nbtreader.compileSelect(['Data/LevelName', 'Data/SizeOnDisk'])
+LEVELDAT_LOAD_SELECT = nbtreader.compileSelect(['Data/Player/Pos', 'Data/Player/Dimension',
+    'Data/SpawnX', 'Data/SpawnY', 'Data/SpawnZ', 'Data/version', 'Data/RandomSeed'])
     
 #TODO: Retrieve these from bpy.props properties stuck in the scene RNA.
 EXCLUDED_BLOCKS = [1, 3, 87]    #(1,3,87) # hack to reduce loading / slowdown: (1- Stone, 3- Dirt, 87 netherrack). Other usual suspects are Grass,Water, Leaves, Sand,StaticLava
@@ -423,13 +428,8 @@ BLOCKVARIANTS = {
 
 def readLevelDat():
     """Reads the level.dat for info like the world name, player inventory..."""
-    lvlfile = gzip.open('level.dat', 'rb')
-
     #first byte must be a 10 (TAG_Compound) containing all else.
-    #read a TAG_Compound...
-    #rootTag = Tag(lvlfile)
-
-    rootTag = nbtreader.TagReader.readNamedTag(lvlfile)[1]    #don't care about the name... or do we? Argh, it's a named tag but we throw the blank name away.
+    rootTag = nbtreader.readNBTFile('level.dat')
 
     print(rootTag.printTree(0))    #give it repr with an indent param...?
 
@@ -441,19 +441,17 @@ def readRegion(fname, vertexBuffer):
     print('== Reading region %s ==' % fname)
 
     rfile = open(fname, 'rb')
-    regionheader = rfile.read(8192)
+    #all 1024 locations (and timestamps) decoded at once, see regionfile.RegionHeader
+    regionheader = regionfile.RegionHeader(rfile.read(regionfile.HEADER_BYTES))
 
     chunklist = []
     chunkcount = 0
-    cio = 0    #chunk index offset
-    while cio+4 <= 4096:    #only up to end of the locations! (After that is timestamps)
-        cheadr = regionheader[cio:cio+4]
+    for cio in range(1024):    #chunk index
         # 3 bytes "offset"         -- how many 4kiB disk sectors away the chunk data is from the start of the file.
         # 1 byte "sector count"    -- how many 4kiB disk sectors long the chunk data is.
         #(sector count is rounded up during save, so gives the last disk sector in which there's data for this chunk)
-
-        offset = unpack(">i", b'\x00'+cheadr[0:3])[0]
-        chunksectorcount = cheadr[3]    #last of the 4 bytes is the size (in 4k sectors) of the chunk
+        offset = int(regionheader.offsets[cio])
+        chunksectorcount = int(regionheader.sectorCounts[cio])    #the size (in 4k sectors) of the chunk
         
         chunksLoaded = 0
         if offset != 0 and chunksectorcount != 0:    #chunks not generated as those coordinates yet will be blank!
@@ -463,8 +461,6 @@ def readRegion(fname, vertexBuffer):
 
             chunklist.append((offset,chunksectorcount))
 
-        cio += 4
-
     rfile.close()
 
     print("Region file %s contains %d chunks." % (fname, chunkcount))
@@ -481,6 +477,63 @@ def batchBuild(meshBuffer):
         me.update()
 
 
+#"Update existing import": an import records on its world root what it loaded and each chunk's
+#region timestamp, so a later run can re-decode just the chunks that changed and patch their blocks.
+IMPORT_WORLD_PROP = 'mbWorld'
+IMPORT_SETTINGS_PROP = 'mbImportSettings'
+IMPORT_CENTRE_PROP = 'mbLoadCentre'
+CHUNK_TIMESTAMPS_PROP = 'mbChunkTimestamps'
+
+def importSettings(loadRadius):
+    """Everything besides chunk contents that an import's blocks depend on. An update only patches an import made with the same."""
+    dimension = -1 if OPTIONS['loadnether'] else (1 if OPTIONS['loadend'] else 0)
+    return [dimension, loadRadius, OPTIONS['lowlimit'], OPTIONS['highlimit'],
+        int(OPTIONS['omitstone']), int(OPTIONS['hollow']), int(OPTIONS['hideSides'])]
+
+def findUpdatableImport(worldName, settings):
+    """The world root of an earlier (voxel) import of worldName with the same settings, or None."""
+    for ob in bpy.data.objects:
+        if ob.get(IMPORT_WORLD_PROP) == worldName and IMPORT_SETTINGS_PROP in ob and list(ob[IMPORT_SETTINGS_PROP]) == settings:
+            return ob
+    return None
+
+def recordImport(root, worldName, settings, centre, chunkTimestamps):
+    """Stores what was imported on the world root. chunkTimestamps: {(x, z): timestamp, or None if not generated}."""
+    root[IMPORT_WORLD_PROP] = worldName
+    root[IMPORT_SETTINGS_PROP] = settings
+    root[IMPORT_CENTRE_PROP] = list(centre)
+    recorded = root[CHUNK_TIMESTAMPS_PROP].to_dict() if CHUNK_TIMESTAMPS_PROP in root else {}
+    for (x, z), timestamp in chunkTimestamps.items():
+        recorded["%d,%d" % (x, z)] = 0 if timestamp is None else timestamp
+    root[CHUNK_TIMESTAMPS_PROP] = recorded
+
+def changedChunks(root, chunkTimestamps):
+    """The chunks whose timestamps differ from those recorded on root (see recordImport)."""
+    recorded = root[CHUNK_TIMESTAMPS_PROP].to_dict() if CHUNK_TIMESTAMPS_PROP in root else {}
+    return [(x, z) for (x, z), timestamp in chunkTimestamps.items()
+        if recorded.get("%d,%d" % (x, z)) != (0 if timestamp is None else timestamp)]
+
+def patchBuild(root, meshBuffer, rebuilt):
+    """batchBuild for an update: in each of root's duplivert meshes, the vertices within rebuilt (the
+[x][z] block mask of what was rescanned, see voxelmesh.rebuildMask) are replaced by those in meshBuffer."""
+    for landob in [ob for ob in root.children if ob.type == 'MESH']:
+        me = landob.data
+        coords = npy.empty(len(me.vertices) * 3)
+        me.vertices.foreach_get('co', coords)
+        coords = coords.reshape(-1, 3)
+        kept = voxelmesh.keptVerts(coords, rebuilt)
+        verts = [tuple(v) for v in kept] + list(meshBuffer.pop(me.name, []))
+        name = me.name
+        newMesh = bpy.data.meshes.new(name)
+        newMesh.from_pydata(verts, [], [])
+        newMesh.update()
+        landob.data = newMesh
+        if me.users == 0:
+            bpy.data.meshes.remove(me)
+        newMesh.name = name
+    batchBuild(meshBuffer)    #block types new to this import
+
+
 def mcToBlendCoord(chunkPos, blockPos):
     """Converts a Minecraft chunk X,Z pair and a Minecraft ordered X,Y,Z block
 location triple into a Blender coordinate vector Vx,Vy,Vz.
@@ -650,9 +703,8 @@ def getWorldSelectList():
                 #Read the actual world name (not just folder name)
                 wData = None
                 try:
-                    with gzip.open(sf + '/level.dat', 'rb') as levelDat:
-                        wData = nbtreader.readNBT(levelDat)
-                        #catch errors if level.dat wasn't a gzip...
+                    #catches errors if level.dat wasn't a gzip (or zlib, or plain) NBT file too
+                    wData = nbtreader.readNBTFile(sf + '/level.dat', select=LEVELDAT_LIST_SELECT)
                 except IOError:
                     print("Unknown problem with level.dat format for %s" % sf)
                     continue
@@ -736,7 +788,7 @@ def readMinecraftWorld(self, worldFolder, loadRadius, toggleOptions):
     #timing/profiling:
     global tChunkReadTimes
 
-    if worldFolder == "":
+    if worldFolder == "" and not OPTIONS['worldURL']:
         #World selected was blank. No saves. i.e. only when world list is empty
         print("No valid saved worlds were available to load.")
         return
@@ -755,227 +807,306 @@ def readMinecraftWorld(self, worldFolder, loadRadius, toggleOptions):
         #wherever os was before, save it, and restore it after this completes.
         os.chdir(MCSAVEPATH)
 
-    worldSelected = worldFolder
-
-    os.chdir(os.path.join(MCSAVEPATH, worldSelected))
-
-    # If there's a folder DIM-1 in the world folder, you've been to the Nether!
-    # ...And generated Nether regions.
-    if os.path.exists('DIM-1'):
-        if OPTIONS['loadnether']:
-            print('nether LOAD!')
-        else:
-            print('Nether is present, but not chosen to load.')
+    #All world files are read through a storage: the local save, or a world URL (read with HTTP range
+    #requests, fetching only the headers and chunks needed: nothing is copied locally first).
+    if OPTIONS['worldURL']:
+        storage = worldstorage.HTTPStorage(OPTIONS['worldURL'])
+        worldSelected = urllib.parse.unquote(OPTIONS['worldURL'].rstrip('/').rsplit('/', 1)[-1])
+    else:
+        worldSelected = worldFolder
+        os.chdir(os.path.join(MCSAVEPATH, worldSelected))
+        storage = worldstorage.LocalStorage(os.getcwd())
+
+    #Everything the import opens (region files, the storage, shared voxels, progress) is closed in the
+    #finally below, however it ends: early, or with an exception.
+    regionreader = sharedVoxels = wm = chunkStream = None
+    try:
+        # If there's a folder DIM-1 in the world folder, you've been to the Nether!
+        # ...And generated Nether regions.
+        if storage.exists('DIM-1'):
+            if OPTIONS['loadnether']:
+                print('nether LOAD!')
+            else:
+                print('Nether is present, but not chosen to load.')
     
-    if os.path.exists('DIM1'):
-        if OPTIONS['loadend']:
-            print('load The End...')
+        if storage.exists('DIM1'):
+            if OPTIONS['loadend']:
+                print('load The End...')
+            else:
+                print('The End is present, but not chosen to load.')
+
+        #if the player didn't save out in those dimensions, we HAVE TO load at 3D cursor (or 0,0,0)
+
+        worldData = None
+        pSaveDim = None
+        worldFormat = 'mcregion'	#assume initially
+
+        worldData = nbtreader.readNBTBuffer(nbtreader.inflateNBT(storage.read('level.dat')), select=LEVELDAT_LOAD_SELECT)
+        #print(worlddata.printTree(0))
+
+        #Check if it's a multiplayer saved game (that's been moved into saves dir)
+        #These don't have the Player tag.
+        if 'Player' in worldData.value['Data'].value:
+            #It's singleplayer
+            pPos = [posFloat.value for posFloat in worldData.value['Data'].value['Player'].value['Pos'].value ]     #in NBT, there's a lot of value...
+            pSaveDim = worldData.value['Data'].value['Player'].value['Dimension'].value
+            print('Player: '+str(pSaveDim)+', ppos: '+str(pPos))
         else:
-            print('The End is present, but not chosen to load.')
-
-    #if the player didn't save out in those dimensions, we HAVE TO load at 3D cursor (or 0,0,0)
-
-    worldData = None
-    pSaveDim = None
-    worldFormat = 'mcregion'	#assume initially
-
-    with gzip.open('level.dat', 'rb') as levelDat:
-        worldData = nbtreader.readNBT(levelDat)
-    #print(worlddata.printTree(0))
-
-    #Check if it's a multiplayer saved game (that's been moved into saves dir)
-    #These don't have the Player tag.
-    if 'Player' in worldData.value['Data'].value:
-        #It's singleplayer
-        pPos = [posFloat.value for posFloat in worldData.value['Data'].value['Player'].value['Pos'].value ]     #in NBT, there's a lot of value...
-        pSaveDim = worldData.value['Data'].value['Player'].value['Dimension'].value
-        print('Player: '+str(pSaveDim)+', ppos: '+str(pPos))
-    else:
-        #It's multiplayer.
-        #Get SpawnX, SpawnY, SpawnZ and centre around those. OR
-        #TODO: Check for another subfolder: 'players'. Read each NBT .dat in
-        #there, create empties for all of them, but load around the first one.
-        spX = worldData.value['Data'].value['SpawnX'].value
-        spY = worldData.value['Data'].value['SpawnY'].value
-        spZ = worldData.value['Data'].value['SpawnZ'].value
-        pPos = [float(spX), float(spY), float(spZ)]
+            #It's multiplayer.
+            #Get SpawnX, SpawnY, SpawnZ and centre around those. OR
+            #TODO: Check for another subfolder: 'players'. Read each NBT .dat in
+            #there, create empties for all of them, but load around the first one.
+            spX = worldData.value['Data'].value['SpawnX'].value
+            spY = worldData.value['Data'].value['SpawnY'].value
+            spZ = worldData.value['Data'].value['SpawnZ'].value
+            pPos = [float(spX), float(spY), float(spZ)]
         
-        #create empty markers for each player.
-        #and: could it load multiplayer nether/end based on player loc?
-
-    if 'version' in worldData.value['Data'].value:
-        fmtVersion = worldData.value['Data'].value['version'].value
-        #19133 for Anvil. 19132 is McRegion.
-        if fmtVersion == MCREGION_VERSION_ID:
-            print("World is in McRegion format")
-        elif fmtVersion == ANVIL_VERSION_ID:
-            print("World is in Anvil format")
-            worldFormat = "anvil"
-
-    wseed = worldData.value['Data'].value['RandomSeed'].value	#it's a Long
-    print("World Seed : %d" % (wseed))	# or self.report....
-
-    #NB: we load at cursor if player location undefined loading into Nether
-    if OPTIONS['atcursor'] or (OPTIONS['loadnether'] and (pSaveDim is None or int(pSaveDim) != -1)):
-        cursorPos = bpy.context.scene.cursor_location
-        #that's an x,y,z vector (in Blender coords)
-        #convert to insane Minecraft coords! (Minecraft pos = -Y, Z, -X)
-        pPos = [ -cursorPos[1], cursorPos[2], -cursorPos[0]]
-
-    if OPTIONS['loadnether']:
-        os.chdir(os.path.join("DIM-1", "region"))
-    elif OPTIONS['loadend']:
-        os.chdir(os.path.join("DIM1", "region"))
-    else:
-        os.chdir("region")
-
-    meshBuffer = {}
-    blockBuffer = {}
+            #create empty markers for each player.
+            #and: could it load multiplayer nether/end based on player loc?
+
+        if 'version' in worldData.value['Data'].value:
+            fmtVersion = worldData.value['Data'].value['version'].value
+            #19133 for Anvil. 19132 is McRegion.
+            if fmtVersion == MCREGION_VERSION_ID:
+                print("World is in McRegion format")
+            elif fmtVersion == ANVIL_VERSION_ID:
+                print("World is in Anvil format")
+                worldFormat = "anvil"
+
+        wseed = worldData.value['Data'].value['RandomSeed'].value	#it's a Long
+        print("World Seed : %d" % (wseed))	# or self.report....
+
+        #NB: we load at cursor if player location undefined loading into Nether
+        if OPTIONS['atcursor'] or (OPTIONS['loadnether'] and (pSaveDim is None or int(pSaveDim) != -1)):
+            cursorPos = bpy.context.scene.cursor_location
+            #that's an x,y,z vector (in Blender coords)
+            #convert to insane Minecraft coords! (Minecraft pos = -Y, Z, -X)
+            pPos = [ -cursorPos[1], cursorPos[2], -cursorPos[0]]
 
-    #Initialise the world root - an empty to parent all land objects to.
-    WORLD_ROOT = bpy.data.objects.new(worldSelected, None)	#,None => EMPTY!
-    bpy.context.scene.objects.link(WORLD_ROOT)
-    WORLD_ROOT.empty_draw_size = 2.0
-    WORLD_ROOT.empty_draw_type = 'SPHERE'
+        if OPTIONS['loadnether']:
+            regionDir = worldstorage.joinPath("DIM-1", "region")
+        elif OPTIONS['loadend']:
+            regionDir = worldstorage.joinPath("DIM1", "region")
+        else:
+            regionDir = "region"
+        if storage.localPath(regionDir) is not None:
+            os.chdir(storage.localPath(regionDir))
+
+        meshBuffer = {}
+        blockBuffer = {}
+
+        settings = importSettings(loadRadius)
+        updateRoot = None
+        if OPTIONS['updateImport']:
+            if not OPTIONS['newVoxel'] or worldFormat != 'anvil':
+                print("Updating an import needs the new voxel approach and an Anvil world: doing a full import.")
+            else:
+                updateRoot = findUpdatableImport(worldSelected, settings)
+                if updateRoot is None:
+                    print("No earlier import of %s with these settings to update: doing a full import." % worldSelected)
+
+        if updateRoot is not None:
+            WORLD_ROOT = updateRoot
+        else:
+            #Initialise the world root - an empty to parent all land objects to.
+            WORLD_ROOT = bpy.data.objects.new(worldSelected, None)	#,None => EMPTY!
+            bpy.context.scene.objects.link(WORLD_ROOT)
+            WORLD_ROOT.empty_draw_size = 2.0
+            WORLD_ROOT.empty_draw_type = 'SPHERE'
     
-    regionfiles = []
-    regionreader = None
-    if worldFormat == 'mcregion':
-        regionfiles = [f for f in os.listdir() if f.endswith('.mcr')]
-        from .mcregionreader import ChunkReader
-        regionreader = ChunkReader()  #work it with the class, not an instance?
-        #all this importing is now very messy.
-
-    elif worldFormat == 'anvil':
-        regionfiles = [f for f in os.listdir() if f.endswith('.mca')]
-        from .mcanvilreader import AnvilChunkReader
-        regionreader = AnvilChunkReader()
-
-    #except when loading nether...
-    playerChunk = toChunkPos(pPos[0], pPos[2])  # x, z
+        #region headers from earlier imports of this world dimension (if their files haven't changed since)
+        headerCache = regionfile.RegionHeaderCache(regionfile.headerCachePath(storage.location(regionDir), sysutil.getCachePath()))
+        if worldFormat == 'mcregion':
+            from .mcregionreader import ChunkReader
+            regionreader = ChunkReader(OPTIONS['mmapRegions'], headerCache, storage, regionDir)  #work it with the class, not an instance?
+            #all this importing is now very messy.
+
+        elif worldFormat == 'anvil':
+            from .mcanvilreader import AnvilChunkReader
+            regionreader = AnvilChunkReader(OPTIONS['mmapRegions'], headerCache, storage, regionDir)
+
+        #except when loading nether...
+        playerChunk = toChunkPos(pPos[0], pPos[2])  # x, z
     
-    print("Loading %d blocks around centre." % loadRadius)
-    #loadRadius = 10 #Sane amount: 5 or 4.
-
-    if not OPTIONS['atcursor']:	#loading at player
-        #Add an Empty to show where the player is. (+CENTRE CAMERA ON!)
-        playerpos = bpy.data.objects.new('PlayerLoc', None)
-        #set its coordinates...
-        #convert Minecraft coordinate position of player into Blender coords:
-        playerpos.location[0] = -pPos[2]
-        playerpos.location[1] = -pPos[0]
-        playerpos.location[2] = pPos[1]
-        bpy.context.scene.objects.link(playerpos)
-        playerpos.parent = WORLD_ROOT
-
-    #total chunk count across region files:
-    REPORTING['totalchunks'] = 0
+        print("Loading %d blocks around centre." % loadRadius)
+        #loadRadius = 10 #Sane amount: 5 or 4.
+
+        if not OPTIONS['atcursor'] and updateRoot is None:	#loading at player
+            #Add an Empty to show where the player is. (+CENTRE CAMERA ON!)
+            playerpos = bpy.data.objects.new('PlayerLoc', None)
+            #set its coordinates...
+            #convert Minecraft coordinate position of player into Blender coords:
+            playerpos.location[0] = -pPos[2]
+            playerpos.location[1] = -pPos[0]
+            playerpos.location[2] = pPos[1]
+            bpy.context.scene.objects.link(playerpos)
+            playerpos.parent = WORLD_ROOT
+
+        #total chunk count across region files:
+        REPORTING['totalchunks'] = 0
     
-    pX = int(playerChunk[0])
-    pZ = int(playerChunk[1])
+        pX = int(playerChunk[0])
+        pZ = int(playerChunk[1])
+        if updateRoot is not None:
+            pX, pZ = updateRoot[IMPORT_CENTRE_PROP]    #same square as before, wherever the player is now
     
-    print('Loading a square halfwidth of %d chunks around load position, so creating chunks: %d,%d to %d,%d' % (loadRadius, pX-loadRadius, pZ-loadRadius, pX+loadRadius, pZ+loadRadius))
-
-    if (OPTIONS['showslimes']):
-        slimeOn()
-        from . import slimes
-        slimeBuffer = []
-
-    # FIXME - need deltaX/Y/Z to get array index
-    zeroAdjX = -1 * (pX-loadRadius)
-    zeroAdjZ = -1 * (pZ-loadRadius)
-    #zeroAdjY = -1 * OPTIONS['lowlimit']
-    #sizeY = OPTIONS['highlimit']-OPTIONS['lowlimit']+1
-    sizeY = 256
-
-    # for newVoxel and other approaches that process the entire world section as a whole
-    numElements=(loadRadius*2+1)*16 # chunks * blocks
-    #numElements=(loadRadius*2)*16 # chunks * blocks
-    #print("block buffer size: "+str(numElements)+", "+str(sizeY)+", "+str(numElements))
-    print("block buffer size: "+str(numElements)+", "+str(sizeY)+", "+str(numElements))
-    blockBuffer = npy.zeros((numElements,sizeY,numElements))
-    extraBuffer = npy.zeros((numElements,sizeY,numElements))
-
-    wm = bpy.context.window_manager
-    wm.progress_begin(0,99)
-    progCounter = 0
-    progMax = (pZ+loadRadius+1)-(pZ-loadRadius)
-    for z in range(pZ-loadRadius, pZ+loadRadius+1):
-        wm.progress_update(((progCounter/progMax)/2)*100)
-        progCounter+=1
-        for x in range(pX-loadRadius, pX+loadRadius+1):
-
-            tChunk0 = datetime.datetime.now()
+        print('Loading a square halfwidth of %d chunks around load position, so creating chunks: %d,%d to %d,%d' % (loadRadius, pX-loadRadius, pZ-loadRadius, pX+loadRadius, pZ+loadRadius))
+
+        if (OPTIONS['showslimes']) and updateRoot is None:
+            slimeOn()
+            from . import slimes
+            slimeBuffer = []
+
+        # FIXME - need deltaX/Y/Z to get array index
+        zeroAdjX = -1 * (pX-loadRadius)
+        zeroAdjZ = -1 * (pZ-loadRadius)
+        #zeroAdjY = -1 * OPTIONS['lowlimit']
+        #sizeY = OPTIONS['highlimit']-OPTIONS['lowlimit']+1
+        sizeY = 256
+
+        # for newVoxel and other approaches that process the entire world section as a whole
+        numElements=(loadRadius*2+1)*16 # chunks * blocks
+        #numElements=(loadRadius*2)*16 # chunks * blocks
+        #print("block buffer size: "+str(numElements)+", "+str(sizeY)+", "+str(numElements))
+        print("block buffer size: "+str(numElements)+", "+str(sizeY)+", "+str(numElements))
+        wm = bpy.context.window_manager
+        wm.progress_begin(0,99)
+        #The whole load square, read a region at a time in on-disk order (not z/x order) with adjacent chunks
+        #read together: mostly sequential reads rather than jumping between and around region files.
+        #Chunks are inflated on a few threads, and processed here in the order they're ready.
+        loadChunks = [(x, z) for z in range(pZ-loadRadius, pZ+loadRadius+1) for x in range(pX-loadRadius, pX+loadRadius+1)]
+        #Planned from one listing of the region directory and the region headers: only generated chunks are read.
+        readChunkList = regionreader.regionPool.generatedChunks(loadChunks)
+        print("%d of %d chunks in the load square are generated." % (len(readChunkList), len(loadChunks)))
+        chunkTimestamps = {(x, z): regionreader.regionPool.chunkTimestamp(x, z) for x, z in loadChunks}
+        changed = loadChunks
+        if updateRoot is not None:
+            changed = changedChunks(updateRoot, chunkTimestamps)
+            print("%d of %d chunks changed since the last import." % (len(changed), len(loadChunks)))
+            if not changed:
+                return
+            #and their neighbours, so the blocks at the edges of changed chunks are hollowed against the right ones
+            needed = {(x+dx, z+dz) for x, z in changed for dx in (-1, 0, 1) for dz in (-1, 0, 1)}
+            readChunkList = [c for c in readChunkList if c in needed]
+        #Decoding on worker processes needs the voxel buffers in shared memory. Those can't load mobs (bpy),
+        #and read the region files themselves, so they need to be local.
+        from . import chunkdecode
+        parallel = OPTIONS['newVoxel'] and OPTIONS['omitmobs'] and OPTIONS['decodeProcesses'] > 0 and worldFormat == 'anvil' \
+            and storage.localPath(regionDir) is not None
+        if parallel and not chunkdecode.sharedMemoryAvailable():
+            print("Decoding on worker processes needs Python 3.8 or later: decoding in Blender instead.")
+            parallel = False
+        if parallel:
+            sharedVoxels = chunkdecode.SharedVoxels((numElements,sizeY,numElements))
+            blockBuffer = sharedVoxels.blockBuffer
+            extraBuffer = sharedVoxels.extraBuffer
+        else:
+            blockBuffer = npy.zeros((numElements,sizeY,numElements))
+            extraBuffer = npy.zeros((numElements,sizeY,numElements))
+        progMax = len(readChunkList)
+        tChunk0 = datetime.datetime.now()
+        if sharedVoxels is not None:
+            progCounter = 0
+            for chunksDone in regionreader.fillVoxelsParallel(readChunkList, sharedVoxels, zeroAdjX, zeroAdjZ, OPTIONS['decodeProcesses']):
+                progCounter += chunksDone
+                wm.progress_update(((progCounter/progMax)/2)*100)
+                tChunk1 = datetime.datetime.now()
+                if chunksDone > 0:
+                    chunkTime = (tChunk1 - tChunk0) / chunksDone    #wall clock per chunk, across all the workers
+                    tChunkReadTimes.extend([chunkTime.total_seconds()] * chunksDone)
+                tChunk0 = tChunk1
+            readChunkList = []    #all done
+        elif OPTIONS['newVoxel'] and OPTIONS['omitmobs'] and OPTIONS['chunkCacheMB'] > 0 and worldFormat == 'anvil':
+            #decoded chunks from earlier imports of this world dimension, kept on disk
+            from . import chunkcache
+            #one budget over every world's cache, not one each
+            chunkCache = chunkcache.DecodedChunkCache(chunkcache.chunkCachePath(storage.location(regionDir), sysutil.getCachePath()),
+                OPTIONS['chunkCacheMB'] * 1024 * 1024, chunkcache.chunkCacheRoot(sysutil.getCachePath()))
+            for progCounter, chunksDone in enumerate(regionreader.fillVoxelsCached(readChunkList, chunkCache,
+                    blockBuffer, extraBuffer, zeroAdjX, zeroAdjZ, OPTIONS['inflateThreads'])):
+                if progCounter % 16 == 0:
+                    wm.progress_update(((progCounter/progMax)/2)*100)
+                tChunk1 = datetime.datetime.now()
+                chunkTime = tChunk1 - tChunk0
+                tChunk0 = tChunk1
+                tChunkReadTimes.append(chunkTime.total_seconds())
+            print("Chunk cache: %d hits, %d misses, %d evicted." % (chunkCache.hits, chunkCache.misses, chunkCache.evictions))
+            readChunkList = []    #all done
+        #Pipelined: chunks are read on one thread, inflated on a few more and parsed on another, each stage
+        #a bounded queue ahead of the next, while the ones already parsed are filled in here.
+        chunkStream = regionreader.readChunks(readChunkList, OPTIONS['inflateThreads'])
+        chunkStream = regionfile.pipelineStage(regionreader.decodeChunks(chunkStream))
+        for progCounter, (x, z, chunkLvl) in enumerate(chunkStream):
+            if progCounter % 16 == 0:
+                wm.progress_update(((progCounter/progMax)/2)*100)
+
             #print('processing '+str(x)+', '+str(z))
-            if (OPTIONS['newVoxel']): # new method
+            if chunkLvl is None:
+                pass    #not generated (or its whole region isn't)
+            elif (OPTIONS['newVoxel']): # new method
 
                 # FIXME - currently only supported by anvil reader
                 #regionreader.processChunk2(x,z, blockBuffer, zeroAdjX, zeroAdjY, zeroAdjZ)
-                regionreader.processChunk2(x,z, blockBuffer, extraBuffer, zeroAdjX, zeroAdjZ)
+                regionreader.processChunk2(x,z, blockBuffer, extraBuffer, zeroAdjX, zeroAdjZ, chunkLvl=chunkLvl)
             else: # old
-                regionreader.processChunk(x,z, meshBuffer) #may need to be further broken down to block level. maybe rename as loadChunk.
+                regionreader.processChunk(x,z, meshBuffer, chunkLvl=chunkLvl) #may need to be further broken down to block level. maybe rename as loadChunk.
             tChunk1 = datetime.datetime.now()
-            chunkTime = tChunk1 - tChunk0
+            chunkTime = tChunk1 - tChunk0    #the fill, plus any wait for the stages behind it
+            tChunk0 = tChunk1
             tChunkReadTimes.append(chunkTime.total_seconds())	#tString = "%.2f seconds" % chunkTime.total_seconds() it's a float.
 
-            if (OPTIONS['showslimes']):
-                if slimes.isSlimeSpawn(wseed, x, z):
-                    slimeLoc = mcToBlendCoord((x,z), (8,8,8))	#(8,8,120)
-                    slimeLoc += Vector((0.5,0.5,-0.5))
-                    slimeBuffer.append(slimeLoc)
-    shouldHollow = OPTIONS['hollow']
-    if (OPTIONS['newVoxel']): # new method for voxel-based
-        yMax = OPTIONS['highlimit']
-        yMin = OPTIONS['lowlimit']
-        xMin = 0
-        xMax = numElements-1
-        zMin = 0
-        zMax = numElements-1
-        hideSides = OPTIONS['hideSides']
-        print('mMin/Max: '+str(xMin)+'-'+str(xMax)+', yMin/Max: '+str(yMin)+'-'+str(yMax)+', zMin/Max: '+str(zMin)+'-'+str(zMax))
-        if hideSides:
-            print("hiding sides")
-        progMax = (zMax+1)-zMin
-        progCounter = 0
-        for z in range(zMin, zMax+1):
-            wm.progress_update((49+(progCounter/progMax)/2)*100)
-            progCounter += 1
-
-            for y in range(yMin, yMax+1): # FIXME - 0,255? (i.e. yMin/Max for visibility only?)
-                for x in range(xMin, xMax+1):
-                    blockID = blockBuffer[x][y][z]
-                    skipBlock = False
-                    #if ((x>0) & (y>yMin) & (z>0) & (x<numElements) & (y<yMax) & (z<numElements)):
-                    if shouldHollow:
-                        if ((x>xMin) & (y>yMin) & (z>zMin) & (x<xMax) & (y<yMax) & (z<zMax)):
-                            if (blockID in BLOCKS_WATER):
-                                #print("is water")
-                                if blockSurroundedBy(blockBuffer,BLOCKS_WATER,x,y,z):
-                                    #print("hollowing")
-                                    blockBuffer[x][y][z]=-1*blockID
-                                    REPORTING['blocksdropped'] += 1
-                                    skipBlock=True
-                            elif (blockID in BLOCKS_LAVA):
-                                if blockSurroundedBy(blockBuffer,BLOCKS_LAVA,x,y,z):
-                                    blockBuffer[x][y][z]=-1*blockID
-                                    REPORTING['blocksdropped'] += 1
-                                    skipBlock=True
-                            elif (blockID in BLOCKS_OTHER):
-                                if blockSurroundedBy(blockBuffer,BLOCKS_OTHER,x,y,z):
-                                    blockBuffer[x][y][z]=-1*blockID
-                                    REPORTING['blocksdropped'] += 1
-                                    skipBlock=True
-                    if (hideSides):
-                        if ((x==xMin) | (x==xMax) | (y==yMin) | (y==yMax) | (z==zMin) | (z==zMax)):
-                            skipBlock=True
-                    if ((not skipBlock) & (blockID>0)):
-                        extraValue = extraBuffer[x][y][z] # TODO (see _readBlocks in mcanvilreader)
-                        AnvilChunkReader.createBlock(blockID, (x,y,z), extraValue, meshBuffer)
-
-    wm.progress_end()
+        if (OPTIONS['showslimes']) and updateRoot is None:
+            for z in range(pZ-loadRadius, pZ+loadRadius+1):
+                for x in range(pX-loadRadius, pX+loadRadius+1):
+                    if slimes.isSlimeSpawn(wseed, x, z):
+                        slimeLoc = mcToBlendCoord((x,z), (8,8,8))	#(8,8,120)
+                        slimeLoc += Vector((0.5,0.5,-0.5))
+                        slimeBuffer.append(slimeLoc)
+        shouldHollow = OPTIONS['hollow']
+        if (OPTIONS['newVoxel']): # new method for voxel-based
+            yMax = OPTIONS['highlimit']
+            yMin = OPTIONS['lowlimit']
+            xMin = 0
+            xMax = numElements-1
+            zMin = 0
+            zMax = numElements-1
+            hideSides = OPTIONS['hideSides']
+            print('mMin/Max: '+str(xMin)+'-'+str(xMax)+', yMin/Max: '+str(yMin)+'-'+str(yMax)+', zMin/Max: '+str(zMin)+'-'+str(zMax))
+            if hideSides:
+                print("hiding sides")
+            if updateRoot is None:
+                rows = [(z, range(xMin, xMax+1)) for z in range(zMin, zMax+1)]
+            else:
+                #the changed chunks' columns (as chunk indexes into the buffers), and the border rows of their
+                #neighbours: hollowing reaches across chunk borders (neighbours were read for this, see needed)
+                rebuilt = voxelmesh.rebuildMask([(x+zeroAdjX, z+zeroAdjZ) for x, z in changed], loadRadius*2+1)
+                rows = voxelmesh.maskRows(rebuilt)
+            progMax = len(rows)
+            groups = (BLOCKS_WATER, BLOCKS_LAVA, BLOCKS_OTHER)
+            for progCounter, row in enumerate(rows):
+                wm.progress_update((49+(progCounter/progMax)/2)*100)
+                for x, y, z, blockID in voxelmesh.surfaceBlocks(blockBuffer, [row], yMin, yMax, groups, shouldHollow, hideSides, REPORTING):
+                    extraValue = extraBuffer[x][y][z] # TODO (see _readBlocks in mcanvilreader)
+                    AnvilChunkReader.createBlock(blockID, (x,y,z), extraValue, meshBuffer)
+    finally:
+        if chunkStream is not None:
+            chunkStream.close()    #stops and joins the pipeline stages before what they read from is closed
+        if sharedVoxels is not None:
+            blockBuffer = extraBuffer = None
+            sharedVoxels.close()
+        if regionreader is not None:
+            regionreader.close()
+        storage.close()
+        if wm is not None:
+            wm.progress_end()
     tBuild0 = datetime.datetime.now()
-    batchBuild(meshBuffer)
-    if (OPTIONS['showslimes']):
+    if updateRoot is not None:
+        patchBuild(WORLD_ROOT, meshBuffer, rebuilt)
+    else:
+        batchBuild(meshBuffer)
+    if OPTIONS['newVoxel'] and worldFormat == 'anvil':
+        recordImport(WORLD_ROOT, worldSelected, settings, (pX, pZ), chunkTimestamps)
+    if (OPTIONS['showslimes']) and updateRoot is None:
         batchSlimeChunks(slimeBuffer)
     tBuild1 = datetime.datetime.now()
     tBuildTime = tBuild1 - tBuild0
@@ -998,12 +1129,13 @@ def readMinecraftWorld(self, worldFolder, loadRadius, toggleOptions):
         hideIfPresent('mcRedstoneOre')
 
     #Profile/run stats:
-    chunkReadTotal = tChunkReadTimes[0]
-    for tdiff in tChunkReadTimes[1:]:
-        chunkReadTotal = chunkReadTotal + tdiff
-    print("Total chunk reads time: %.2fs" % chunkReadTotal)  #I presume that's in seconds, ofc... hm.
-    chunkMRT = chunkReadTotal / len(tChunkReadTimes)
-    print("Mean chunk read time: %.2fs" % chunkMRT)
+    if tChunkReadTimes:    #none if nothing in the load square was generated
+        chunkReadTotal = tChunkReadTimes[0]
+        for tdiff in tChunkReadTimes[1:]:
+            chunkReadTotal = chunkReadTotal + tdiff
+        print("Total chunk reads time: %.2fs" % chunkReadTotal)  #I presume that's in seconds, ofc... hm.
+        chunkMRT = chunkReadTotal / len(tChunkReadTimes)
+        print("Mean chunk read time: %.2fs" % chunkMRT)
     print("Block points processed: %d" % REPORTING['blocksread'])
     print("of those, verts dumped: %d" % REPORTING['blocksdropped'])
     if REPORTING['blocksread'] > 0:
@@ -1014,25 +1146,6 @@ def readMinecraftWorld(self, worldFolder, loadRadius, toggleOptions):
     #bpy.types.Space...
     #Actually: scale world root down to 0.05 by default?
 
-def blockSurroundedBy(blockAry,blockGroupAry,x,y,z):
-    #id = blockAry[x][y][z]
-    #if (id in blockGroupAry):
-    #print("xyz: "+str(x)+", "+str(y)+", "+str(z))
-    bl_u = blockAry[x][y][z+1]
-    if (bl_u in blockGroupAry):
-        bl_d = blockAry[x][y][z-1]
-        if (bl_d in blockGroupAry):
-            bl_l = blockAry[x-1][y][z]
-            if (bl_l in blockGroupAry):
-                bl_r = blockAry[x+1][y][z]
-                if (bl_r in blockGroupAry):
-                    bl_f = blockAry[x][y-1][z]
-                    if (bl_f in blockGroupAry):
-                        bl_b = blockAry[x][y+1][z]
-                        if (bl_b in blockGroupAry):
-                            return True
-    return False
-
 def hideIfPresent(mName):
     if mName in bpy.data.objects:
         bpy.data.objects[mName].hide = True
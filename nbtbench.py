@@ -0,0 +1,213 @@
+# NBT parser benchmark.
+# Builds a reproducible corpus of synthetic NBT (Anvil chunks of varying density,
+# entity-heavy chunks and a level.dat) and times readNBT and the alternative
+# decoders in nbtreader over it. Runs headless -- no bpy needed:
+#
+#   cd <addon dir>; python nbtbench.py [--repeat N] [--chunks N] [--seed N]
+#
+# For each decoder and corpus it reports MB/s, tags/s, the peak memory of
+# decoding one payload, and the number of allocations still held per decoded
+# payload (ie. what keeping the result alive costs).
+
+import argparse, gc, io, random, sys, time, tracemalloc, zlib
+from struct import pack
+
+import nbtreader
+
+try:
+    import chunkdecode    #needs NumPy
+except ImportError:
+    chunkdecode = None
+
+
+# Minimal NBT writer for the corpus.
+
+def _name(tname):
+    encoded = tname.encode('utf-8')
+    return pack(">h", len(encoded)) + encoded
+
+def _named(tagId, tname, payload):
+    return bytes((tagId,)) + _name(tname) + payload
+
+def _compound(children):
+    return b"".join(_named(tagId, tname, payload) for tagId, tname, payload in children) + b"\x00"
+
+def _list(itemId, payloads):
+    return bytes((itemId,)) + pack(">i", len(payloads)) + b"".join(payloads)
+
+def _byteArray(data):
+    return pack(">i", len(data)) + data
+
+def _intArray(values):
+    return pack(">i", len(values)) + pack(">%di" % len(values), *values)
+
+def _string(value):
+    return _name(value)
+
+
+def _section(rnd, y, density):
+    """A 16x16x16 section with roughly density (0..1) of its blocks non-air."""
+    blocks = bytes(rnd.randrange(1, 100) if rnd.random() < density else 0 for i in range(4096))
+    children = [(nbtreader.TAG_BYTE, 'Y', pack(">b", y)),
+        (nbtreader.TAG_BYTE_ARRAY, 'Blocks', _byteArray(blocks)),
+        (nbtreader.TAG_BYTE_ARRAY, 'Data', _byteArray(bytes(rnd.randrange(256) for i in range(2048)))),
+        (nbtreader.TAG_BYTE_ARRAY, 'SkyLight', _byteArray(b"\xff" * 2048)),
+        (nbtreader.TAG_BYTE_ARRAY, 'BlockLight', _byteArray(bytes(2048)))]
+    if rnd.random() < 0.1:
+        children.append((nbtreader.TAG_BYTE_ARRAY, 'Add', _byteArray(bytes(2048))))
+    return _compound(children)
+
+
+def _entity(rnd):
+    return _compound([(nbtreader.TAG_STRING, 'id', _string(rnd.choice(['Sheep', 'Cow', 'Zombie', 'Item']))),
+        (nbtreader.TAG_LIST, 'Pos', _list(nbtreader.TAG_DOUBLE, [pack(">d", rnd.uniform(-500, 500)) for i in range(3)])),
+        (nbtreader.TAG_LIST, 'Motion', _list(nbtreader.TAG_DOUBLE, [pack(">d", 0.0)] * 3)),
+        (nbtreader.TAG_LIST, 'Rotation', _list(nbtreader.TAG_FLOAT, [pack(">f", rnd.uniform(0, 360)), pack(">f", 0.0)])),
+        (nbtreader.TAG_SHORT, 'Health', pack(">h", 10)), (nbtreader.TAG_BYTE, 'OnGround', pack(">b", 1)),
+        (nbtreader.TAG_LONG, 'UUIDMost', pack(">q", rnd.getrandbits(63))),
+        (nbtreader.TAG_LONG, 'UUIDLeast', pack(">q", rnd.getrandbits(63))),
+        (nbtreader.TAG_LIST, 'Equipment', _list(nbtreader.TAG_COMPOUND, [_compound([]) for i in range(5)]))])
+
+
+def _tileEntity(rnd):
+    items = [_compound([(nbtreader.TAG_BYTE, 'Slot', pack(">b", i)), (nbtreader.TAG_SHORT, 'id', pack(">h", rnd.randrange(400))),
+        (nbtreader.TAG_BYTE, 'Count', pack(">b", rnd.randrange(1, 64))), (nbtreader.TAG_SHORT, 'Damage', pack(">h", 0))])
+        for i in range(rnd.randrange(0, 27))]
+    return _compound([(nbtreader.TAG_STRING, 'id', _string('Chest')),
+        (nbtreader.TAG_INT, 'x', pack(">i", rnd.randrange(-500, 500))), (nbtreader.TAG_INT, 'y', pack(">i", rnd.randrange(256))),
+        (nbtreader.TAG_INT, 'z', pack(">i", rnd.randrange(-500, 500))), (nbtreader.TAG_LIST, 'Items', _list(nbtreader.TAG_COMPOUND, items))])
+
+
+def makeChunk(rnd, cx, cz, sections, density, entities=0, tileEntities=0):
+    """Payload (inflated NBT) of one synthetic Anvil chunk."""
+    level = _compound([(nbtreader.TAG_INT, 'xPos', pack(">i", cx)), (nbtreader.TAG_INT, 'zPos', pack(">i", cz)),
+        (nbtreader.TAG_LONG, 'LastUpdate', pack(">q", rnd.getrandbits(32))),
+        (nbtreader.TAG_BYTE, 'TerrainPopulated', pack(">b", 1)), (nbtreader.TAG_LONG, 'InhabitedTime', pack(">q", 0)),
+        (nbtreader.TAG_BYTE_ARRAY, 'Biomes', _byteArray(bytes(rnd.randrange(20) for i in range(256)))),
+        (nbtreader.TAG_INT_ARRAY, 'HeightMap', _intArray([rnd.randrange(60, 90) for i in range(256)])),
+        (nbtreader.TAG_LIST, 'Sections', _list(nbtreader.TAG_COMPOUND, [_section(rnd, y, density) for y in range(sections)])),
+        (nbtreader.TAG_LIST, 'Entities', _list(nbtreader.TAG_COMPOUND, [_entity(rnd) for i in range(entities)]) if entities else _list(nbtreader.TAG_END, [])),
+        (nbtreader.TAG_LIST, 'TileEntities', _list(nbtreader.TAG_COMPOUND, [_tileEntity(rnd) for i in range(tileEntities)]) if tileEntities else _list(nbtreader.TAG_END, []))])
+    return _named(nbtreader.TAG_COMPOUND, '', _compound([(nbtreader.TAG_COMPOUND, 'Level', level)]))
+
+
+def makeLevelDat(rnd):
+    """Payload (inflated NBT) of a synthetic singleplayer level.dat."""
+    inventory = [_compound([(nbtreader.TAG_BYTE, 'Slot', pack(">b", i)), (nbtreader.TAG_SHORT, 'id', pack(">h", rnd.randrange(400))),
+        (nbtreader.TAG_BYTE, 'Count', pack(">b", 1)), (nbtreader.TAG_SHORT, 'Damage', pack(">h", 0))]) for i in range(36)]
+    player = _compound([(nbtreader.TAG_LIST, 'Pos', _list(nbtreader.TAG_DOUBLE, [pack(">d", rnd.uniform(-500, 500)) for i in range(3)])),
+        (nbtreader.TAG_LIST, 'Rotation', _list(nbtreader.TAG_FLOAT, [pack(">f", 0.0)] * 2)),
+        (nbtreader.TAG_INT, 'Dimension', pack(">i", 0)), (nbtreader.TAG_LIST, 'Inventory', _list(nbtreader.TAG_COMPOUND, inventory))])
+    data = _compound([(nbtreader.TAG_STRING, 'LevelName', _string('Benchmark World')),
+        (nbtreader.TAG_INT, 'version', pack(">i", 0x4abd)), (nbtreader.TAG_LONG, 'RandomSeed', pack(">q", rnd.getrandbits(63))),
+        (nbtreader.TAG_LONG, 'SizeOnDisk', pack(">q", 0)), (nbtreader.TAG_INT, 'SpawnX', pack(">i", 0)),
+        (nbtreader.TAG_INT, 'SpawnY', pack(">i", 64)), (nbtreader.TAG_INT, 'SpawnZ', pack(">i", 0)),
+        (nbtreader.TAG_COMPOUND, 'Player', player)])
+    return _named(nbtreader.TAG_COMPOUND, '', _compound([(nbtreader.TAG_COMPOUND, 'Data', data)]))
+
+
+def makeCorpus(seed=1, chunks=24):
+    """{corpus name: [payloads]}, the same for a given seed."""
+    rnd = random.Random(seed)
+    return {
+        'sparse chunks': [makeChunk(rnd, i, 0, 3, 0.05) for i in range(chunks)],
+        'dense chunks': [makeChunk(rnd, i, 1, 16, 0.9) for i in range(chunks)],
+        'entity chunks': [makeChunk(rnd, i, 2, 6, 0.5, entities=40, tileEntities=15) for i in range(chunks)],
+        'level.dat': [makeLevelDat(rnd) for i in range(chunks)],
+    }
+
+
+# The decoders under test. Each takes one payload and returns something that keeps the result alive.
+
+_CHUNK_PATHS = ['Level/xPos', 'Level/zPos', 'Level/Sections/*/Y', 'Level/Sections/*/Blocks', 'Level/Sections/*/Data']
+_CHUNK_SELECT = nbtreader.compileSelect(_CHUNK_PATHS)
+
+def _touchSections(root):
+    #what the block readers do with a chunk: get at every section's arrays
+    if 'Level' in root.value:
+        for section in root.value['Level'].value['Sections'].value:
+            section.value['Blocks'].value
+            section.value['Data'].value
+    return root
+
+DECODERS = [
+    ('readNBT', lambda payload: nbtreader.readNBT(io.BytesIO(payload))),
+    ('readNBTBuffer', lambda payload: nbtreader.readNBTBuffer(payload)),
+    ('lazy + touch sections', lambda payload: _touchSections(nbtreader.readNBTBuffer(payload, lazy=True))),
+    ('select sections', lambda payload: nbtreader.readNBTBuffer(payload, select=_CHUNK_SELECT)),
+    ('compact', lambda payload: nbtreader.readNBTBuffer(payload, compact=True)),
+]
+
+
+def countTags(payload):
+    """Number of tags in a payload (container ends not counted)."""
+    return sum(1 for ev in nbtreader.NBTEventReader([payload]) if ev[0] != nbtreader.EVENT_END)
+
+
+def measure(decode, payloads, repeat):
+    """(seconds per pass, peak bytes decoding one payload, allocations held per payload)"""
+    decode(payloads[0])    #warm up (eg. a ChunkLayout learning its sample)
+    best = None
+    for r in range(repeat):
+        t0 = time.perf_counter()
+        for payload in payloads:
+            decode(payload)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = 0
+    for payload in payloads:
+        tracemalloc.start()
+        result = decode(payload)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del result
+
+    gc.collect()
+    blocksBefore = sys.getallocatedblocks()
+    held = [decode(payload) for payload in payloads]
+    gc.collect()
+    allocations = (sys.getallocatedblocks() - blocksBefore) / len(payloads)
+    del held
+    return best, peak, allocations
+
+
+def run(seed=1, chunks=24, repeat=3, out=sys.stdout):
+    corpus = makeCorpus(seed, chunks)
+    header = "%-16s %-24s %9s %12s %11s %11s" % ("corpus", "decoder", "MB/s", "tags/s", "peak KiB", "allocs")
+    print(header, file=out)
+    print("-" * len(header), file=out)
+    for corpusName, payloads in corpus.items():
+        totalBytes = sum(len(p) for p in payloads)
+        totalTags = sum(countTags(p) for p in payloads)
+        runs = list(DECODERS)
+        if corpusName != 'level.dat':
+            layout = nbtreader.ChunkLayout(payloads[0], _CHUNK_SELECT)
+            runs.append(('ChunkLayout sections', layout.decode))
+            if chunkdecode is not None:
+                runs.append(('batchSections (1 chunk)', lambda payload: chunkdecode.batchSections([payload])))
+        for decoderName, decode in runs:
+            seconds, peak, allocations = measure(decode, payloads, repeat)
+            print("%-16s %-24s %9.1f %12.0f %11.1f %11.1f" % (corpusName, decoderName,
+                totalBytes / seconds / 1e6, totalTags / seconds, peak / 1024, allocations), file=out)
+
+        #the streaming reader works from compressed data, so compare it on inflate + parse
+        compressed = [zlib.compress(p) for p in payloads]
+        def _inflateAndEvents(z):
+            return sum(1 for ev in nbtreader.NBTEventReader(nbtreader.iterZlibBlocks(z)))
+        def _inflateAndBuffer(z):
+            return nbtreader.readNBTBuffer(zlib.decompress(z))
+        for decoderName, decode in (('inflate + readNBTBuffer', _inflateAndBuffer), ('inflate + event stream', _inflateAndEvents)):
+            seconds, peak, allocations = measure(decode, compressed, repeat)
+            print("%-16s %-24s %9.1f %12.0f %11.1f %11.1f" % (corpusName, decoderName,
+                totalBytes / seconds / 1e6, totalTags / seconds, peak / 1024, allocations), file=out)
+        print(file=out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the NBT decoders in nbtreader on a synthetic corpus.")
+    parser.add_argument('--seed', type=int, default=1, help="corpus random seed")
+    parser.add_argument('--chunks', type=int, default=24, help="payloads per corpus")
+    parser.add_argument('--repeat', type=int, default=3, help="timing passes (best is reported)")
+    args = parser.parse_args()
+    run(args.seed, args.chunks, args.repeat)
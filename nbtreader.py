@@ -1,7 +1,14 @@
 
 # NBT Reader module
 
-from struct import calcsize, unpack, error as StructError
+import sys, zlib
+from array import array
+from struct import calcsize, Struct, error as StructError
+
+try:
+    import numpy as npy
+except ImportError:    #not available outside Blender (or a NumPy install): arrays then decode to array.array
+    npy = None
 
 # An NBT file contains one root TAG_Compound.
 TAG_END = 0
@@ -16,6 +23,7 @@ TAG_STRING = 8
 TAG_LIST = 9
 TAG_COMPOUND = 10
 TAG_INT_ARRAY = 11
+TAG_LONG_ARRAY = 12
 
 INDENTCHAR = "  "
 
@@ -42,7 +50,7 @@ class TagReader:
         #print("Reading Named Tag\n")
         tbyte = bstream.read(1)[0]    # read 1 byte and get its numerical value        #read 1 byte, switch type generated depending (stream-reader type 'abstract?' factory
         #print("Byte read: %d" % tbyte)
-        tname = TAG_String(bstream).value
+        tname = sys.intern(TAG_String(bstream).value)
         #print("Name read: %s" % tname)
         #print("RNamedT - name is %s" %tname)
         tpayload = TAGLIST[tbyte](bstream)
@@ -51,7 +59,11 @@ class TagReader:
         #object type = bleh based on the number 0-255 you just read. Which should be a 10... for TAG_Compound.
 
 
-def readNBT(bstream):
+def readNBT(bstream, select=None):
+    """Reads the root tag from an NBT stream. If select is given (a list of tag paths, see compileSelect)
+the rest of the stream is read in one go and only the selected parts of the tree are built."""
+    if select is not None:
+        return readNBTBuffer(bstream.read(), select=select)
     rootname, rootTag = TagReader.readNamedTag(bstream)
     rootTag.name = rootname
 
@@ -60,6 +72,33 @@ def readNBT(bstream):
     return rootTag
 
 
+GZIP_MAGIC = b"\x1f\x8b"
+
+def inflateNBT(data):
+    """Inflates a whole NBT file's contents, telling gzip (level.dat, players/*.dat), zlib and
+uncompressed NBT apart by their first bytes. Raises IOError if the data is none of those."""
+    if data[:2] == GZIP_MAGIC:
+        wbits = 16 + zlib.MAX_WBITS
+    elif len(data) >= 2 and data[0] & 0x0f == 8 and ((data[0] << 8) | data[1]) % 31 == 0:
+        wbits = zlib.MAX_WBITS    #zlib header: deflate method, checksummed CMF/FLG
+    elif data[:1] == bytes((TAG_COMPOUND,)):
+        return data
+    else:
+        raise IOError("not an NBT file (gzip, zlib or uncompressed)")
+    try:
+        return zlib.decompress(data, wbits)
+    except zlib.error as e:
+        raise IOError("corrupt compressed NBT: %s" % e)
+
+
+def readNBTFile(path, lazy=False, select=None):
+    """Reads the root tag of a (gzip, zlib or uncompressed) NBT file: one bulk read and inflate,
+then parsed from memory with readNBTBuffer. Much cheaper than readNBT on a gzip.open'd stream."""
+    with open(path, 'rb') as nbtFile:
+        data = nbtFile.read()
+    return readNBTBuffer(inflateNBT(data), lazy=lazy, select=select)
+
+
     ##DONT PASS THE TYPE IN TO EVERY INSTANCE WHEN ITS ALWAYS THE SAME! DEFINE IT AS A CLASS VAR IN THE SUBCLASSES.
 
 
@@ -69,6 +108,8 @@ def readNBT(bstream):
 
 class Tag:
     type = None
+    #No per-instance __dict__: a chunk makes a lot of these.
+    __slots__ = ('name', 'value')
 
     def __init__(self, bstream):
         """Reads self-building data for this type from the bytestream given, until a complete tag instance is ready."""
@@ -101,6 +142,7 @@ class Tag:
         #could just skip this class....?
 class TAG_End(Tag):
     type = TAG_END
+    __slots__ = ()
 
     def _parseContent(self, bstream):
         pass
@@ -111,24 +153,21 @@ class _TAG_Numeric(Tag):
     """parses one of the numeric types (actual type defined by subclass)"""
     #uses struct bitformats (within each subclass) to parse the value from the data stream...
     bitformat = ""    #class, not instance, var.nB: make this something that will crash badly if not overwritten properly!
-
-    def __init__(self, bstream):
-        #if self.bitformat == "":
-        #    print("INCONCEIVABLE!")
-        #    raise NotImplementedError(self.__class__.__name__)
-        #print("fmt is: %s" % self.bitformat)
-        self.size = calcsize(self.bitformat)
-        super(_TAG_Numeric, self).__init__(bstream)
+    __slots__ = ()
+    #size and the precompiled Struct are class vars too, set up once per subclass by _initNumeric (below the class defs).
+    size = 0
+    _struct = None
 
     def _parseContent(self, bstream):
-        #struct parse it using bitformat.
-        self.value = unpack(self.bitformat, bstream.read(self.size))[0]	#[0] because this always returns a tuple
+        #struct parse it using the precompiled bitformat.
+        self.value = self._struct.unpack(bstream.read(self.size))[0]	#[0] because this always returns a tuple
 
     def __repr__(self):
         return "%d" % self.value
 
 class TAG_Byte(_TAG_Numeric):
     bitformat = ">b"    # class variable, NOT INSTANCE VARIABLE.
+    __slots__ = ()
     #easy, it's read 1 byte!
     #def __parseContent(self, bstream):
     #    self.value = bstream.read(1)[0]    #grab next 1 byte in stream. That's the TAG_Byte's payload.
@@ -137,17 +176,21 @@ class TAG_Byte(_TAG_Numeric):
 class TAG_Short(_TAG_Numeric):
 #    type = TAG_SHORT
     bitformat = ">h"
+    __slots__ = ()
 
 class TAG_Int(_TAG_Numeric):
     bitformat = ">i"
+    __slots__ = ()
 
 class TAG_Long(_TAG_Numeric):
 #    id = TAG_LONG
     bitformat = ">q"
+    __slots__ = ()
 
 class TAG_Float(_TAG_Numeric):
 #    id = TAG_FLOAT
     bitformat = ">f"
+    __slots__ = ()
     
     def __repr__(self):
         return "%0.2f" % self.value
@@ -155,12 +198,14 @@ class TAG_Float(_TAG_Numeric):
 class TAG_Double(_TAG_Numeric):
 #    id = TAG_DOUBLE
     bitformat = ">d"
+    __slots__ = ()
     
     def __repr__(self):
         return "%0.2f" % self.value
 
 class TAG_Byte_Array(Tag):
     type = TAG_BYTE_ARRAY
+    __slots__ = ()
     def _parseContent(self, bstream):
         #read the length, then grab the bytes.
         length = TAG_Int(bstream)
@@ -171,7 +216,8 @@ class TAG_Byte_Array(Tag):
         
 class TAG_String(Tag):
     type = TAG_STRING
-    
+    __slots__ = ()
+
     def _parseContent(self, bstream):
         #print ("Parsing TAG_String")
         length = TAG_Short(bstream)
@@ -185,6 +231,7 @@ class TAG_String(Tag):
 
 class TAG_List(Tag):
     type = TAG_LIST
+    __slots__ = ()
 
     def _parseContent(self, bstream):
         tagId = TAG_Byte(bstream).value
@@ -210,6 +257,7 @@ class TAG_List(Tag):
 
 class TAG_Compound(Tag):
     type = TAG_COMPOUND
+    __slots__ = ()
         #A sequential list of Named Tags. This array keeps going until a TAG_End is found.
         #NB: "Named tags" are:
         #byte tagType
@@ -229,7 +277,7 @@ class TAG_Compound(Tag):
         readType = bstream.read(1)[0]    #rly?
         #print("First compound inner tag type byte is: %d" % readType)
         while readType != TAG_END:
-            tname = TAG_String(bstream).value
+            tname = sys.intern(TAG_String(bstream).value)    #the same few names repeat in every chunk
             #print ("Tag name read as: %s" % tname)
             payload = TAGLIST[readType](bstream)
             payload.name = tname
@@ -248,25 +296,1064 @@ class TAG_Compound(Tag):
         
         return outstr
 
-class TAG_Int_Array(Tag):
-    type = TAG_INT_ARRAY
+class _TAG_Numeric_Array(Tag):
+    """A length-prefixed array of big-endian numbers (actual type defined by subclass)."""
+    #Kept as the raw big-endian payload; decoded in one go (not one tag per element) the first
+    #time .value is asked for. Callers wanting NumPy can use toNumpy() and skip decoding entirely.
+    __slots__ = ('raw', '_value')
+    itemsize = 0
+    dtype = ""    #NumPy dtype of one element
+
     def _parseContent(self, bstream):
-        #read the length, then grab the bytes. split those out as 4-byte integers. we hope...
-        tagLen = TAG_Int(bstream)
-        #read out all other values as tag_ints too.
-        ilength = tagLen.value
-        self.value = []
-        for t in range(ilength):
-            self.value.append(TAG_Int(bstream).value)
+        #read the length, then grab all the bytes at once.
+        ilength = TAG_Int(bstream).value
+        raw = bstream.read(self.itemsize*ilength)
+        if ilength < 0 or len(raw) != self.itemsize*ilength:
+            raise StructError()
+        self.raw = raw
+        self._value = None
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = self._decode(self.raw)
+        return self._value
+
+    @value.setter
+    def value(self, newValue):
+        self._value = newValue
+
+    def toNumpy(self):
+        """The numbers as a (read-only, zero copy) NumPy view over the raw payload."""
+        if npy is None:
+            raise ImportError("NumPy is not available")
+        return npy.frombuffer(self.raw, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.raw) // self.itemsize
+
+class TAG_Int_Array(_TAG_Numeric_Array):
+    type = TAG_INT_ARRAY
+    __slots__ = ()
+    itemsize = 4
+    dtype = '>i4'
+
+    def _decode(self, raw):
+        return decodeIntArray(raw)
 
     def __repr__(self):
         #printslist = [str(i) for i in self.value]
         #prout = ', '.join(printslist)
         #return "[%d ints array] [%s]" % (len(self.value), prout)
-        return "[%d ints array]" % len(self.value)
+        return "[%d ints array]" % len(self)
+
+class TAG_Long_Array(_TAG_Numeric_Array):
+    type = TAG_LONG_ARRAY
+    __slots__ = ()
+    itemsize = 8
+    dtype = '>i8'
+
+    def _decode(self, raw):
+        return decodeLongArray(raw)
+
+    def __repr__(self):
+        return "[%d longs array]" % len(self)
+
+
+#array typecodes for 32 and 64 bit signed ints on this platform ('i' and 'q' nearly everywhere).
+_INT32_CODE = 'i' if array('i').itemsize == 4 else 'l'
+_INT64_CODE = 'q'
+
+def decodeIntArray(raw):
+    """Decodes a big-endian int32 payload into an array('i') in one call, fixing the byte order in bulk."""
+    values = array(_INT32_CODE)
+    values.frombytes(raw)
+    if sys.byteorder == 'little':
+        values.byteswap()
+    return values
+
+def decodeLongArray(raw):
+    """Decodes a big-endian int64 payload in one call: a NumPy '>i8' view over raw (no copy)
+if NumPy is available, otherwise an array('q')."""
+    if npy is not None:
+        return npy.frombuffer(raw, dtype='>i8')
+    values = array(_INT64_CODE)
+    values.frombytes(raw)
+    if sys.byteorder == 'little':
+        values.byteswap()
+    return values
+
+
+def _initNumeric(cls):
+    cls.size = calcsize(cls.bitformat)
+    cls._struct = Struct(cls.bitformat)
+
+for _numericClass in (TAG_Byte, TAG_Short, TAG_Int, TAG_Long, TAG_Float, TAG_Double):
+    _initNumeric(_numericClass)
 
 
 TAGLIST = {TAG_BYTE: TAG_Byte, TAG_SHORT: TAG_Short, TAG_INT: TAG_Int, 
     TAG_LONG:TAG_Long, TAG_FLOAT:TAG_Float, TAG_DOUBLE:TAG_Double, 
     TAG_BYTE_ARRAY:TAG_Byte_Array, TAG_STRING:TAG_String,
-    TAG_LIST: TAG_List, TAG_COMPOUND:TAG_Compound, TAG_INT_ARRAY: TAG_Int_Array}
+    TAG_LIST: TAG_List, TAG_COMPOUND:TAG_Compound, TAG_INT_ARRAY: TAG_Int_Array,
+    TAG_LONG_ARRAY: TAG_Long_Array}
+
+
+# Buffer (offset-based) decoder.
+# readNBT above pulls every tag out of a stream a few bytes at a time. When the
+# whole NBT payload is already in memory (as it is once a chunk is inflated)
+# it is much cheaper to walk the bytes with an integer cursor and the
+# precompiled Structs. Produces the same tree of Tag objects as readNBT, except
+# that byte arrays are memoryview slices of the buffer rather than copies.
+
+_BYTE = Struct(">b")
+_SHORT = Struct(">h")
+_INT = Struct(">i")
+
+
+def _makeTag(cls, value):
+    """Builds a tag instance directly from an already-decoded value (skipping the stream-reading __init__)."""
+    tag = cls.__new__(cls)
+    tag.name = ""
+    tag.value = value
+    return tag
+
+
+def _readBufferString(buf, pos):
+    length = _SHORT.unpack_from(buf, pos)[0]
+    pos += 2
+    end = pos + length
+    if length < 0 or end > len(buf):
+        raise StructError("string runs past the end of the NBT buffer")
+    return str(buf[pos:end], 'utf-8'), end
+
+
+def _readBufferName(buf, pos):
+    """Reads a tag name. Names are interned: "Y", "Blocks", "Data" etc. repeat in every section."""
+    tname, pos = _readBufferString(buf, pos)
+    return sys.intern(tname), pos
+
+
+def _numericBufferReader(cls):
+    unpackFrom = cls._struct.unpack_from
+    size = cls.size
+    def _read(buf, pos):
+        return _makeTag(cls, unpackFrom(buf, pos)[0]), pos + size
+    return _read
+
+
+def _byteArraySlice(buf, pos):
+    length = _INT.unpack_from(buf, pos)[0]
+    pos += 4
+    end = pos + length
+    if length < 0 or end > len(buf):
+        raise StructError("byte array runs past the end of the NBT buffer")
+    return buf[pos:end], end
+
+
+def _readBufferByteArray(buf, pos):
+    value, end = _byteArraySlice(buf, pos)
+    return _makeTag(TAG_Byte_Array, value), end
+
+
+def _readBufferStringTag(buf, pos):
+    value, pos = _readBufferString(buf, pos)
+    return _makeTag(TAG_String, value), pos
+
+
+def _listBufferReader(readers):
+    """Makes a TAG_List payload reader which reads its items with the given reader table."""
+    def _readBufferList(buf, pos):
+        tagId = buf[pos]
+        length = _INT.unpack_from(buf, pos+1)[0]
+        pos += 5
+        items = []
+        if length > 0:
+            reader = readers[tagId]
+            for i in range(length):
+                tag, pos = reader(buf, pos)
+                items.append(tag)
+        return _makeTag(TAG_List, items), pos
+    return _readBufferList
+
+
+def _compoundBufferReader(readers):
+    """Makes a TAG_Compound payload reader which reads its children with the given reader table."""
+    def _readBufferCompound(buf, pos):
+        value = {}
+        tagId = buf[pos]
+        pos += 1
+        while tagId != TAG_END:
+            tname, pos = _readBufferName(buf, pos)
+            tag, pos = readers[tagId](buf, pos)
+            tag.name = tname
+            value[tname] = tag
+            tagId = buf[pos]
+            pos += 1
+        return _makeTag(TAG_Compound, value), pos
+    return _readBufferCompound
+
+
+def _arraySlice(buf, pos, itemsize):
+    length = _INT.unpack_from(buf, pos)[0]
+    pos += 4
+    end = pos + itemsize*length
+    if length < 0 or end > len(buf):
+        raise StructError("array runs past the end of the NBT buffer")
+    return buf[pos:end], end
+
+
+def _numericArrayBufferReader(cls):
+    itemsize = cls.itemsize
+    def _read(buf, pos):
+        raw, end = _arraySlice(buf, pos, itemsize)
+        tag = cls.__new__(cls)
+        tag.name = ""
+        tag.raw = raw
+        tag._value = None
+        return tag, end
+    return _read
+
+
+_readBufferIntArray = _numericArrayBufferReader(TAG_Int_Array)
+_readBufferLongArray = _numericArrayBufferReader(TAG_Long_Array)
+
+
+def _bufferReaderTable(compoundReaderFactory):
+    readers = {TAG_BYTE: _numericBufferReader(TAG_Byte), TAG_SHORT: _numericBufferReader(TAG_Short),
+        TAG_INT: _numericBufferReader(TAG_Int), TAG_LONG: _numericBufferReader(TAG_Long),
+        TAG_FLOAT: _numericBufferReader(TAG_Float), TAG_DOUBLE: _numericBufferReader(TAG_Double),
+        TAG_BYTE_ARRAY: _readBufferByteArray, TAG_STRING: _readBufferStringTag,
+        TAG_INT_ARRAY: _readBufferIntArray, TAG_LONG_ARRAY: _readBufferLongArray}
+    readers[TAG_LIST] = _listBufferReader(readers)
+    readers[TAG_COMPOUND] = compoundReaderFactory(readers)
+    return readers
+
+
+# Skipping payloads without building anything. Numeric tags have a fixed size,
+# arrays and strings carry their length up front; only lists of variable-size
+# tags and compounds need walking.
+
+_FIXED_SIZES = {TAG_BYTE: 1, TAG_SHORT: 2, TAG_INT: 4, TAG_LONG: 8, TAG_FLOAT: 4, TAG_DOUBLE: 8}
+
+
+def _skipped(buf, pos, length, itemsize, what):
+    """Offset past length items of itemsize bytes from pos, checked like _arraySlice does."""
+    end = pos + itemsize*length
+    if length < 0 or end > len(buf):
+        raise StructError("%s runs past the end of the NBT buffer" % what)
+    return end
+
+
+def _skipBufferPayload(buf, pos, tagId):
+    """Returns the offset just past the payload of type tagId that starts at pos."""
+    if tagId in _FIXED_SIZES:
+        return pos + _FIXED_SIZES[tagId]
+    if tagId == TAG_BYTE_ARRAY:
+        return _skipped(buf, pos + 4, _INT.unpack_from(buf, pos)[0], 1, "byte array")
+    if tagId == TAG_STRING:
+        return _skipped(buf, pos + 2, _SHORT.unpack_from(buf, pos)[0], 1, "string")
+    if tagId == TAG_INT_ARRAY:
+        return _skipped(buf, pos + 4, _INT.unpack_from(buf, pos)[0], 4, "array")
+    if tagId == TAG_LONG_ARRAY:
+        return _skipped(buf, pos + 4, _INT.unpack_from(buf, pos)[0], 8, "array")
+    if tagId == TAG_LIST:
+        itemId = buf[pos]
+        length = _INT.unpack_from(buf, pos+1)[0]
+        pos += 5
+        if length < 0:
+            raise StructError("negative list length")
+        if itemId in _FIXED_SIZES:
+            return _skipped(buf, pos, length, _FIXED_SIZES[itemId], "list")
+        for i in range(length):
+            pos = _skipBufferPayload(buf, pos, itemId)
+        return pos
+    if tagId == TAG_COMPOUND:
+        childId = buf[pos]
+        pos += 1
+        while childId != TAG_END:
+            pos = _skipped(buf, pos + 2, _SHORT.unpack_from(buf, pos)[0], 1, "string")    #the child's name
+            pos = _skipBufferPayload(buf, pos, childId)
+            childId = buf[pos]
+            pos += 1
+        return pos
+    raise KeyError(tagId)    #same as TAGLIST would for an unknown tag id
+
+
+class LazyCompoundValue:
+    """dict-like value of a lazily read TAG_Compound. Children are indexed by name, type and byte range
+when the compound is read, but each one is only decoded the first time it is looked up."""
+    __slots__ = ('_buf', '_entries', '_readers', '_decoded')
+
+    def __init__(self, buf, entries, readers):
+        self._buf = buf
+        self._entries = entries    #name -> (tagId, payload start, payload end)
+        self._readers = readers
+        self._decoded = {}
+
+    def __getitem__(self, name):
+        tag = self._decoded.get(name)
+        if tag is None:
+            tagId, start, end = self._entries[name]
+            tag = self._readers[tagId](self._buf, start)[0]
+            tag.name = name
+            self._decoded[name] = tag
+        return tag
+
+    def get(self, name, default=None):
+        if name in self._entries:
+            return self[name]
+        return default
+
+    def tagType(self, name):
+        """Type id of a child, without decoding it."""
+        return self._entries[name][0]
+
+    def byteRange(self, name):
+        """(start, end) offsets of a child's payload in the underlying buffer."""
+        return self._entries[name][1:]
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def keys(self):
+        return self._entries.keys()
+
+    def values(self):
+        return [self[k] for k in self._entries]
+
+    def items(self):
+        return [(k, self[k]) for k in self._entries]
+
+
+def _lazyCompoundBufferReader(readers):
+    """Makes a TAG_Compound payload reader which only indexes its children (see LazyCompoundValue)."""
+    def _readLazyCompound(buf, pos):
+        entries = {}
+        tagId = buf[pos]
+        pos += 1
+        while tagId != TAG_END:
+            tname, pos = _readBufferName(buf, pos)
+            end = _skipBufferPayload(buf, pos, tagId)
+            entries[tname] = (tagId, pos, end)
+            pos = end
+            tagId = buf[pos]
+            pos += 1
+        if pos > len(buf):
+            raise StructError("compound runs past the end of the NBT buffer")
+        return _makeTag(TAG_Compound, LazyCompoundValue(buf, entries, readers)), pos
+    return _readLazyCompound
+
+
+_BUFFER_READERS = _bufferReaderTable(_compoundBufferReader)
+_LAZY_READERS = _bufferReaderTable(_lazyCompoundBufferReader)
+
+
+# Non-recursive tree builder.
+# Builds the same Tag tree as the reader tables above, but keeps an explicit stack
+# of open containers instead of recursing per nesting level, with numeric tags
+# decoded inline in the loop. Deeply nested entity/tile entity data costs no
+# Python frames and can't hit the recursion limit.
+
+_NUMERIC_INFO = {tagId: (cls, cls._struct.unpack_from, cls.size)
+    for tagId, cls in TAGLIST.items() if issubclass(cls, _TAG_Numeric)}
+
+_LEAF_READERS = {TAG_BYTE_ARRAY: _readBufferByteArray, TAG_STRING: _readBufferStringTag,
+    TAG_INT_ARRAY: _readBufferIntArray, TAG_LONG_ARRAY: _readBufferLongArray}
+
+
+def _readIterative(buf, pos, tagId):
+    """Reads the payload of type tagId at pos into a Tag tree, without recursion. Returns (tag, new pos)."""
+    numericInfo = _NUMERIC_INFO
+    leafReaders = _LEAF_READERS
+    unpackInt = _INT.unpack_from
+    unpackShort = _SHORT.unpack_from
+    intern = sys.intern
+    bufLen = len(buf)
+    newTag = _makeTag
+    stack = []    #enclosing open containers, as [isCompound, value, list item id, list items remaining]
+    top = None    #the innermost open container (not on the stack)
+    name = ""
+    root = None
+
+    while True:
+        if tagId in numericInfo:
+            cls, unpackFrom, size = numericInfo[tagId]
+            tag = cls.__new__(cls)
+            tag.value = unpackFrom(buf, pos)[0]
+            pos += size
+            frame = None
+        elif tagId == TAG_COMPOUND:
+            tag = newTag(TAG_Compound, {})
+            frame = [True, tag.value, None, 0]
+        elif tagId == TAG_LIST:
+            itemId = buf[pos]
+            length = unpackInt(buf, pos+1)[0]
+            pos += 5
+            if length > 0 and itemId not in TAGLIST:
+                raise KeyError(itemId)    #same as TAGLIST would for an unknown tag id
+            tag = newTag(TAG_List, [])
+            frame = [False, tag.value, itemId, length]
+        else:
+            tag, pos = leafReaders[tagId](buf, pos)
+            frame = None
+        tag.name = name
+
+        if top is None:
+            root = tag
+        elif top[0]:
+            top[1][name] = tag
+        else:
+            top[1].append(tag)
+        if frame is not None:
+            if top is not None:
+                stack.append(top)
+            top = frame
+
+        #Find the next tag to read, closing any containers that have run out.
+        while True:
+            if top is None:
+                return root, pos
+            if top[0]:
+                tagId = buf[pos]
+                pos += 1
+                if tagId != TAG_END:
+                    #the name, inline (see _readBufferName)
+                    length = unpackShort(buf, pos)[0]
+                    pos += 2
+                    end = pos + length
+                    if length < 0 or end > bufLen:
+                        raise StructError("string runs past the end of the NBT buffer")
+                    name = intern(str(buf[pos:end], 'utf-8'))
+                    pos = end
+                    break
+            elif top[3] > 0:
+                top[3] -= 1
+                tagId = top[2]
+                name = ""
+                break
+            top = stack.pop() if stack else None
+
+
+# Compact output: plain Python values instead of Tag objects. Scalars come back as
+# ints/floats/strs, compounds as dicts (with interned keys), lists as lists, byte
+# arrays as memoryview slices, int arrays as array('i') and long arrays as
+# decodeLongArray gives them. No Tag instances,
+# names or type ids are kept per node, which matters when lots of parsed chunks
+# are held in memory at once.
+
+def _compactNumericReader(cls):
+    unpackFrom = cls._struct.unpack_from
+    size = cls.size
+    def _read(buf, pos):
+        return unpackFrom(buf, pos)[0], pos + size
+    return _read
+
+
+def _readCompactIntArray(buf, pos):
+    raw, end = _arraySlice(buf, pos, 4)
+    return decodeIntArray(raw), end
+
+
+def _readCompactLongArray(buf, pos):
+    raw, end = _arraySlice(buf, pos, 8)
+    return decodeLongArray(raw), end
+
+
+def _compactReaderTable():
+    readers = {TAG_BYTE: _compactNumericReader(TAG_Byte), TAG_SHORT: _compactNumericReader(TAG_Short),
+        TAG_INT: _compactNumericReader(TAG_Int), TAG_LONG: _compactNumericReader(TAG_Long),
+        TAG_FLOAT: _compactNumericReader(TAG_Float), TAG_DOUBLE: _compactNumericReader(TAG_Double),
+        TAG_BYTE_ARRAY: _byteArraySlice, TAG_STRING: _readBufferString,
+        TAG_INT_ARRAY: _readCompactIntArray, TAG_LONG_ARRAY: _readCompactLongArray}
+
+    def _readCompactList(buf, pos):
+        tagId = buf[pos]
+        length = _INT.unpack_from(buf, pos+1)[0]
+        pos += 5
+        items = []
+        if length > 0:
+            reader = readers[tagId]
+            for i in range(length):
+                item, pos = reader(buf, pos)
+                items.append(item)
+        return items, pos
+
+    def _readCompactCompound(buf, pos):
+        value = {}
+        tagId = buf[pos]
+        pos += 1
+        while tagId != TAG_END:
+            tname, pos = _readBufferName(buf, pos)
+            value[tname], pos = readers[tagId](buf, pos)
+            tagId = buf[pos]
+            pos += 1
+        return value, pos
+
+    readers[TAG_LIST] = _readCompactList
+    readers[TAG_COMPOUND] = _readCompactCompound
+    return readers
+
+
+_COMPACT_READERS = _compactReaderTable()
+
+
+# Path projection: only build the parts of the tree a caller asked for.
+# A selection is a list of '/'-separated tag paths below the root compound, eg.
+# 'Level/Sections/*/Blocks'. '*' matches any child name (or any item of a list);
+# list items can also be picked by index. A path ending on a tag takes its whole
+# subtree. Anything not on a selected path is skipped at the byte level.
+
+SELECT_ALL = True    #trie leaf: the whole subtree from here is wanted
+
+
+def compileSelect(paths):
+    """Compiles a list of tag paths into the nested-dict trie the selective reader walks."""
+    root = {}
+    for path in paths:
+        parts = [p for p in path.split('/') if p]
+        if not parts:
+            return SELECT_ALL
+        node = root
+        for part in parts[:-1]:
+            child = node.get(part)
+            if child is SELECT_ALL:
+                break
+            if child is None:
+                child = node[part] = {}
+            node = child
+        else:
+            node[parts[-1]] = SELECT_ALL
+    return root
+
+
+def _mergeSelect(a, b):
+    if a is SELECT_ALL or b is SELECT_ALL:
+        return SELECT_ALL
+    merged = dict(a)
+    for k, v in b.items():
+        merged[k] = _mergeSelect(merged[k], v) if k in merged else v
+    return merged
+
+
+def _selectChild(node, name):
+    """The part of selection node that applies to the child called name (None if it isn't wanted)."""
+    exact = node.get(name)
+    wild = node.get('*')
+    if exact is None:
+        return wild
+    if wild is None:
+        return exact
+    return _mergeSelect(exact, wild)
+
+
+def _readSelected(buf, pos, tagId, node, compact=False):
+    """Reads the payload of type tagId at pos, only building the parts of it selected by node."""
+    if node is SELECT_ALL or (tagId != TAG_COMPOUND and tagId != TAG_LIST):
+        if compact:
+            return _COMPACT_READERS[tagId](buf, pos)
+        return _readIterative(buf, pos, tagId)
+    if tagId == TAG_LIST:
+        itemId = buf[pos]
+        length = _INT.unpack_from(buf, pos+1)[0]
+        pos += 5
+        items = []
+        for i in range(length):
+            child = _selectChild(node, str(i))
+            if child is None:
+                pos = _skipBufferPayload(buf, pos, itemId)
+            else:
+                item, pos = _readSelected(buf, pos, itemId, child, compact)
+                items.append(item)
+        if compact:
+            return items, pos
+        return _makeTag(TAG_List, items), pos
+    value = {}
+    childId = buf[pos]
+    pos += 1
+    while childId != TAG_END:
+        tname, pos = _readBufferName(buf, pos)
+        child = _selectChild(node, tname)
+        if child is None:
+            pos = _skipBufferPayload(buf, pos, childId)
+        else:
+            tag, pos = _readSelected(buf, pos, childId, child, compact)
+            if not compact:
+                tag.name = tname
+            value[tname] = tag
+        childId = buf[pos]
+        pos += 1
+    if compact:
+        return value, pos
+    return _makeTag(TAG_Compound, value), pos
+
+
+def readNBTBuffer(data, lazy=False, select=None, compact=False):
+    """Reads the root tag from a bytes/bytearray/memoryview holding a whole NBT payload.
+Same result as readNBT(io.BytesIO(data)), but byte arrays come back as memoryview slices of data.
+With lazy=True every TAG_Compound only decodes a child when it is first accessed through .value[name].
+With select (a list of tag paths, or the result of compileSelect) only those parts of the tree are built.
+With compact=True the result is plain values (see _compactReaderTable) rather than Tags: the root
+compound's dict is returned, and the root name is dropped. lazy is ignored in compact mode."""
+    buf = memoryview(data)
+    tagId = buf[0]
+    rootname, pos = _readBufferName(buf, 1)
+    if select is not None:
+        if not isinstance(select, dict) and select is not SELECT_ALL:
+            select = compileSelect(select)
+        rootTag, pos = _readSelected(buf, pos, tagId, select, compact)
+    elif compact:
+        rootTag, pos = _COMPACT_READERS[tagId](buf, pos)
+    elif lazy:
+        rootTag, pos = _LAZY_READERS[tagId](buf, pos)
+    else:
+        rootTag, pos = _readIterative(buf, pos, tagId)
+    if not compact:
+        rootTag.name = rootname
+    return rootTag
+
+
+# Streaming (pull/event) reader.
+# Parses NBT incrementally from an iterable of byte blocks -- eg. the output of a
+# zlib.decompressobj as it inflates, or a gzip file read a block at a time -- so
+# the whole inflated payload never has to be in memory at once. Yields events
+# rather than a tree, and keeps an explicit stack of open containers.
+# Each event is a tuple (event, name, tagId, value):
+#   (EVENT_START_COMPOUND, name, TAG_COMPOUND, None)
+#   (EVENT_START_LIST, name, TAG_LIST, (itemTagId, length))
+#   (EVENT_SCALAR, name, tagId, value)          numbers and strings
+#   (EVENT_ARRAY, name, tagId, value)           bytes for byte arrays, array('i') for int arrays,
+#                                               decodeLongArray's result for long arrays
+#   (EVENT_END, name, TAG_COMPOUND or TAG_LIST, None)
+# List items have the name "".
+
+EVENT_START_COMPOUND = 'start_compound'
+EVENT_START_LIST = 'start_list'
+EVENT_SCALAR = 'scalar'
+EVENT_ARRAY = 'array'
+EVENT_END = 'end'
+
+_ARRAY_ITEMSIZES = {TAG_BYTE_ARRAY: 1, TAG_INT_ARRAY: 4, TAG_LONG_ARRAY: 8}
+
+_NUMERIC_STRUCTS = {TAG_BYTE: TAG_Byte._struct, TAG_SHORT: TAG_Short._struct, TAG_INT: TAG_Int._struct,
+    TAG_LONG: TAG_Long._struct, TAG_FLOAT: TAG_Float._struct, TAG_DOUBLE: TAG_Double._struct}
+
+
+class NBTEventReader:
+    """Pull-style NBT event reader over an iterable of byte blocks (see iterZlibBlocks, iterFileBlocks).
+Iterate over it to get events. Right after a start event, call skip() to pass over that container's
+contents without them being decoded or copied (its end event is still produced)."""
+
+    def __init__(self, blocks):
+        self._blocks = iter(blocks)
+        self._buf = bytearray()
+        self._pos = 0
+        self._skipRequested = False
+        self._atStart = False    #whether the last event produced was a start event
+
+    def skip(self):
+        """Skip the contents of the container whose start event was just produced. Raises RuntimeError
+if the last event produced wasn't a start event."""
+        if not self._atStart:
+            raise RuntimeError("skip() called when the last event wasn't a container start")
+        self._skipRequested = True
+
+    def _need(self, n):
+        """Makes sure there are at least n unread bytes buffered."""
+        buf = self._buf
+        while len(buf) - self._pos < n:
+            block = next(self._blocks, None)
+            if block is None:
+                raise StructError("NBT stream ended early")
+            if self._pos:
+                del buf[:self._pos]    #drop what's been consumed, so the buffer stays small
+                self._pos = 0
+            buf += block
+
+    def _advance(self, n):
+        """Passes over n bytes without keeping them, even if they aren't all buffered yet."""
+        available = len(self._buf) - self._pos
+        while n > available:
+            n -= available
+            del self._buf[:]
+            self._pos = 0
+            block = next(self._blocks, None)
+            if block is None:
+                raise StructError("NBT stream ended early")
+            self._buf += block
+            available = len(self._buf)
+        self._pos += n
+
+    def _unpack(self, struct):
+        self._need(struct.size)
+        value = struct.unpack_from(self._buf, self._pos)[0]
+        self._pos += struct.size
+        return value
+
+    def _bytes(self, n):
+        self._need(n)
+        start = self._pos
+        self._pos += n
+        return bytes(self._buf[start:self._pos])
+
+    def _string(self):
+        length = self._unpack(_SHORT)
+        if length < 0:
+            raise StructError("negative string length")
+        return str(self._bytes(length), 'utf-8')
+
+    def __iter__(self):
+        return self.events()
+
+    def events(self):
+        """Generates the events for one named root tag."""
+        stack = []    #open containers: [tagId, name, list item id, list items remaining]
+        skipDepth = 0    #when non-zero, the depth of the container being skipped
+        tagId = self._unpack(_BYTE)
+        name = sys.intern(self._string())
+
+        while True:
+            if tagId is None:
+                #Work out what comes next from the innermost open container.
+                if not stack:
+                    return
+                top = stack[-1]
+                if top[0] == TAG_COMPOUND:
+                    tagId = self._unpack(_BYTE)
+                    if tagId != TAG_END:
+                        if skipDepth:
+                            self._advance(self._unpack(_SHORT))    #skipped: the name's never used
+                            name = None
+                        else:
+                            name = sys.intern(self._string())
+                elif top[3] > 0:
+                    top[3] -= 1
+                    tagId = top[2]
+                    name = ""
+                else:
+                    tagId = TAG_END
+                if tagId == TAG_END:
+                    if skipDepth == len(stack):
+                        skipDepth = 0
+                    stack.pop()
+                    if not skipDepth:
+                        yield (EVENT_END, top[1], top[0], None)
+                    tagId = None
+                    continue
+
+            if tagId in _NUMERIC_STRUCTS:
+                value = self._unpack(_NUMERIC_STRUCTS[tagId])
+                if not skipDepth:
+                    yield (EVENT_SCALAR, name, tagId, value)
+            elif tagId == TAG_STRING:
+                if skipDepth:
+                    self._advance(self._unpack(_SHORT))
+                else:
+                    yield (EVENT_SCALAR, name, tagId, self._string())
+            elif tagId in _ARRAY_ITEMSIZES:
+                length = self._unpack(_INT)
+                if length < 0:
+                    raise StructError("negative array length")
+                length *= _ARRAY_ITEMSIZES[tagId]
+                if skipDepth:
+                    self._advance(length)
+                elif tagId == TAG_INT_ARRAY:
+                    yield (EVENT_ARRAY, name, tagId, decodeIntArray(self._bytes(length)))
+                elif tagId == TAG_LONG_ARRAY:
+                    yield (EVENT_ARRAY, name, tagId, decodeLongArray(self._bytes(length)))
+                else:
+                    yield (EVENT_ARRAY, name, tagId, self._bytes(length))
+            elif tagId == TAG_LIST or tagId == TAG_COMPOUND:
+                if tagId == TAG_LIST:
+                    itemId = self._unpack(_BYTE)
+                    length = self._unpack(_INT)
+                    if length > 0 and itemId not in TAGLIST:
+                        raise KeyError(itemId)    #same as TAGLIST would for an unknown tag id
+                    stack.append([TAG_LIST, name, itemId, max(length, 0)])
+                    if not skipDepth:
+                        self._atStart = True
+                        yield (EVENT_START_LIST, name, tagId, (itemId, length))
+                else:
+                    stack.append([TAG_COMPOUND, name, None, 0])
+                    if not skipDepth:
+                        self._atStart = True
+                        yield (EVENT_START_COMPOUND, name, tagId, None)
+                self._atStart = False
+                if self._skipRequested:
+                    self._skipRequested = False
+                    skipDepth = len(stack)
+            else:
+                raise KeyError(tagId)
+            tagId = None
+
+
+def iterZlibBlocks(data, blockSize=65536, wbits=zlib.MAX_WBITS):
+    """Inflates zlib (or, with wbits=16+zlib.MAX_WBITS, gzip) data through a zlib.decompressobj,
+yielding the output in blocks of at most blockSize bytes. Feed the result to NBTEventReader."""
+    zipper = zlib.decompressobj(wbits)
+    for i in range(0, len(data), blockSize):
+        piece = data[i:i+blockSize]
+        while piece:
+            out = zipper.decompress(piece, blockSize)
+            if out:
+                yield out
+            piece = zipper.unconsumed_tail
+    tail = zipper.flush()
+    if tail:
+        yield tail
+
+
+def iterFileBlocks(fileobj, blockSize=65536):
+    """Yields successive blocks read from an open (binary) file, eg. a gzip.open'd level.dat."""
+    block = fileobj.read(blockSize)
+    while block:
+        yield block
+        block = fileobj.read(blockSize)
+
+
+# Layout-specialised decoding.
+# Chunks from one world nearly always have the same compound layout: the same
+# keys in the same order, and sections made of the same fixed-size arrays.
+# ChunkLayout learns that layout from a sample chunk, then decodes each chunk by
+# comparing the expected tag id/name (and array length) header bytes at each
+# position and slicing payloads out at known offsets, instead of dispatching on
+# every tag. A section that doesn't match is read generically; anything else
+# that doesn't match makes the whole chunk fall back to readNBTBuffer.
+# A list of compounds that's empty in the sample (eg. a chunk with no sections
+# yet) has its item layout learned from the first items decoded instead.
+
+class _LayoutMismatch(Exception):
+    pass
+
+
+_FIXED_KIND, _COMPOUND_KIND, _COMPOUND_LIST_KIND, _GENERIC_KIND = range(4)
+
+
+def _tagHeader(tagId, tname):
+    encoded = tname.encode('utf-8')
+    return bytes((tagId,)) + _SHORT.pack(len(encoded)) + encoded
+
+
+def _fixedField(buf, pos, tagId):
+    """(header suffix, payload size) if the payload at pos has a size that can be checked up front."""
+    if tagId in _FIXED_SIZES:
+        return b"", _FIXED_SIZES[tagId]
+    if tagId in _ARRAY_ITEMSIZES:
+        length = _INT.unpack_from(buf, pos)[0]
+        return bytes(buf[pos:pos+4]), length * _ARRAY_ITEMSIZES[tagId]
+    return None
+
+
+class _CompoundPlan:
+    """Expected children of a compound, in order. Each step is
+(kind, tagId, name, header bytes, payload size or sub-plan(s), selection node)."""
+    __slots__ = ('steps',)
+
+    def __init__(self, steps):
+        self.steps = steps
+
+
+class _FixedCompoundPlan:
+    """A compound whose children all have fixed-size payloads: every header and payload
+is at a known offset from the start, and the whole thing is a known size."""
+    __slots__ = ('checks', 'fields', 'size')
+
+    def __init__(self, steps):
+        self.checks = []    #(offset, expected header bytes)
+        self.fields = []    #(name, tagId, payload offset, payload size) for the selected children
+        offset = 0
+        for kind, tagId, tname, header, size, node in steps:
+            self.checks.append((offset, header))
+            offset += len(header)
+            if node is not None:
+                self.fields.append((tname, tagId, offset, size))
+            offset += size
+        self.size = offset + 1    #and the TAG_End
+
+
+def _learnCompound(buf, pos, node):
+    """Learns the plan of the compound payload at pos from a sample. Returns (plan, end pos)."""
+    steps = []
+    fixed = True
+    tagId = buf[pos]
+    pos += 1
+    while tagId != TAG_END:
+        tname, pos = _readBufferName(buf, pos)
+        header = _tagHeader(tagId, tname)
+        child = _selectChild(node, tname) if node is not SELECT_ALL else SELECT_ALL
+        end = _skipBufferPayload(buf, pos, tagId)
+        field = _fixedField(buf, pos, tagId)
+        if field is not None:
+            suffix, size = field
+            steps.append((_FIXED_KIND, tagId, tname, header + suffix, size, child))
+        elif child is None:
+            steps.append((_GENERIC_KIND, tagId, tname, header, None, None))
+            fixed = False
+        elif tagId == TAG_COMPOUND:
+            subplan = _learnCompound(buf, pos, child)[0]
+            steps.append((_COMPOUND_KIND, tagId, tname, header, subplan, child))
+            fixed = False
+        elif tagId == TAG_LIST and (buf[pos] == TAG_COMPOUND or _INT.unpack_from(buf, pos+1)[0] <= 0) \
+                and (child is SELECT_ALL or set(child) == {'*'}):
+            #(an empty list says nothing of its item type: other chunks' may be compounds)
+            itemNode = child if child is SELECT_ALL else child['*']
+            itemPlans = []
+            seen = set()
+            itemPos = pos + 5
+            for i in range(_INT.unpack_from(buf, pos+1)[0]):
+                itemPlan, itemPos = _learnCompound(buf, itemPos, itemNode)
+                if isinstance(itemPlan, _FixedCompoundPlan):
+                    #keep one plan per distinct item layout (eg. sections with and without Add)
+                    signature = tuple(h for o, h in itemPlan.checks)
+                    if signature not in seen:
+                        seen.add(signature)
+                        itemPlans.append(itemPlan)
+            steps.append((_COMPOUND_LIST_KIND, tagId, tname, header, itemPlans, (child, itemNode)))
+            fixed = False
+        else:
+            steps.append((_GENERIC_KIND, tagId, tname, header, None, child))
+            fixed = False
+        pos = end
+        tagId = buf[pos]
+        pos += 1
+    if fixed:
+        return _FixedCompoundPlan(steps), pos
+    return _CompoundPlan(steps), pos
+
+
+def _learnItemPlan(itemPlans, buf, pos, itemNode):
+    """Adds the plan of the list item at pos to itemPlans (a list step's, which had none): None if it isn't fixed,
+so it's only tried once."""
+    itemPlan = _learnCompound(buf, pos, itemNode)[0]
+    itemPlans.append(itemPlan if isinstance(itemPlan, _FixedCompoundPlan) else None)
+
+
+def _readFixedField(buf, pos, tagId, size):
+    if tagId in _NUMERIC_INFO:
+        cls, unpackFrom, ignored = _NUMERIC_INFO[tagId]
+        tag = cls.__new__(cls)
+        tag.value = unpackFrom(buf, pos)[0]
+    elif tagId == TAG_BYTE_ARRAY:
+        tag = TAG_Byte_Array.__new__(TAG_Byte_Array)
+        tag.value = buf[pos:pos+size]
+    else:
+        cls = TAGLIST[tagId]
+        tag = cls.__new__(cls)
+        tag.raw = buf[pos:pos+size]
+        tag._value = None
+    return tag
+
+
+def _decodeFixed(plan, buf, pos):
+    """Decodes a compound matching a _FixedCompoundPlan: a few slice compares, then slices."""
+    for offset, header in plan.checks:
+        start = pos + offset
+        if buf[start:start+len(header)] != header:
+            raise _LayoutMismatch()
+    end = pos + plan.size
+    if end > len(buf) or buf[end-1] != TAG_END:
+        raise _LayoutMismatch()
+    value = {}
+    for tname, tagId, offset, size in plan.fields:
+        tag = _readFixedField(buf, pos+offset, tagId, size)
+        tag.name = tname
+        value[tname] = tag
+    return _makeTag(TAG_Compound, value), end
+
+
+def _decodePlanned(plan, buf, pos):
+    """Decodes the compound payload at pos following plan. Raises _LayoutMismatch if it doesn't fit."""
+    if isinstance(plan, _FixedCompoundPlan):
+        return _decodeFixed(plan, buf, pos)
+    value = {}
+    for kind, tagId, tname, header, arg, node in plan.steps:
+        if buf[pos:pos+len(header)] != header:
+            raise _LayoutMismatch()
+        pos += len(header)
+        if kind == _FIXED_KIND:
+            if node is not None:
+                tag = _readFixedField(buf, pos, tagId, arg)
+                tag.name = tname
+                value[tname] = tag
+            pos += arg
+            continue
+        if kind == _GENERIC_KIND:
+            if node is None:
+                pos = _skipBufferPayload(buf, pos, tagId)
+                continue
+            tag, pos = _readSelected(buf, pos, tagId, node)
+        elif kind == _COMPOUND_KIND:
+            tag, pos = _decodePlanned(arg, buf, pos)
+        elif buf[pos] != TAG_COMPOUND:
+            #eg. an empty list stored with item type TAG_End
+            tag, pos = _readSelected(buf, pos, tagId, node[0])
+        else:
+            itemNode = node[1]
+            length = _INT.unpack_from(buf, pos+1)[0]
+            pos += 5
+            items = []
+            for i in range(length):
+                if not arg:
+                    _learnItemPlan(arg, buf, pos, itemNode)
+                item = None
+                for itemPlan in arg:
+                    if itemPlan is None:
+                        continue
+                    try:
+                        item, itemEnd = _decodeFixed(itemPlan, buf, pos)
+                        break
+                    except _LayoutMismatch:
+                        pass
+                if item is None:
+                    item, itemEnd = _readSelected(buf, pos, TAG_COMPOUND, itemNode)
+                items.append(item)
+                pos = itemEnd
+            tag = _makeTag(TAG_List, items)
+        tag.name = tname
+        value[tname] = tag
+    if buf[pos] != TAG_END:
+        raise _LayoutMismatch()
+    return _makeTag(TAG_Compound, value), pos + 1
+
+
+class ChunkLayout:
+    """A decoder specialised to the layout of a sample chunk (see above).
+decode(data) gives the same tree as readNBTBuffer(data, select=select), falling back to it
+for chunks that don't match. hits and fallbacks count how often each path was taken."""
+
+    def __init__(self, sample, select=None):
+        if select is None:
+            select = SELECT_ALL
+        elif not isinstance(select, dict) and select is not SELECT_ALL:
+            select = compileSelect(select)
+        self.select = select
+        buf = memoryview(sample)
+        self.rootId = buf[0]
+        rootname, pos = _readBufferName(buf, 1)
+        self.rootName = rootname
+        self.rootHeader = bytes(buf[:pos])
+        self.plan = None
+        if self.rootId == TAG_COMPOUND:
+            self.plan = _learnCompound(buf, pos, select)[0]
+        self.hits = 0
+        self.fallbacks = 0
+
+    def decode(self, data):
+        buf = memoryview(data)
+        header = self.rootHeader
+        if self.plan is not None and buf[:len(header)] == header:
+            try:
+                rootTag, pos = _decodePlanned(self.plan, buf, len(header))
+                rootTag.name = self.rootName
+                self.hits += 1
+                return rootTag
+            except (_LayoutMismatch, IndexError, StructError):
+                pass
+        self.fallbacks += 1
+        return readNBTBuffer(buf, select=self.select)
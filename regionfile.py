@@ -0,0 +1,568 @@
+# Region file module.
+# Access to McRegion (.mcr) and Anvil (.mca) region files: header parsing, chunk
+# sector reads, a pool of open region files shared by the chunk readers, and the
+# threaded stages chunk loading is pipelined with. No bpy in here, so it can also be
+# used outside Blender.
+#
+# Region files can be read with seek/read, or memory-mapped (mmapped=True): chunk
+# sectors then come back as memoryview slices of the map, with no read copies.
+# Headers can be kept across imports in a RegionHeaderCache. Given a WorldStorage (see
+# worldstorage), a pool reads region files through it instead, eg. from a web server.
+#
+# A region file holds 32x32 chunks. It starts with an 8 KiB header:
+#  1024 big-endian 4-byte locations: 3 bytes sector offset, 1 byte sector count
+#  1024 big-endian 4-byte last-modified timestamps
+# and each chunk is stored at (sector offset * 4 KiB) as:
+#  4 bytes length (of what follows), 1 byte compression type, length-1 bytes of data.
+
+import hashlib, mmap, os, queue, threading, zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from struct import Struct, error as StructError
+
+try:
+    from . import worldstorage
+except ImportError:    #imported as a top-level module, outside Blender
+    import worldstorage
+
+try:
+    import numpy as npy
+except ImportError:    #headers then parse with struct
+    npy = None
+
+SECTOR_BYTES = 4096
+HEADER_BYTES = 2 * SECTOR_BYTES
+REGION_CHUNKS = 32    #chunks along each side of a region
+
+MAX_RUN_SECTORS = 256    #biggest coalesced read (1 MiB), see RegionFile.readChunks
+PREFETCH_RUNS = 8    #runs a RegionFile on a WorldStorage asks it to prefetch at a time
+
+COMPRESSION_GZIP = 1    #unused by Minecraft in practice
+COMPRESSION_ZLIB = 2
+COMPRESSION_NONE = 3
+
+PIPELINE_DEPTH = 16    #default items a pipelineStage runs ahead of its consumer
+
+_HEADER_TABLE = Struct(">1024I")
+_CHUNK_HEADER = Struct(">iB")
+
+
+def regionCoords(chunkX, chunkZ):
+    """Region x, z containing chunk x, z (ie. floor of chunk coord / 32)."""
+    return chunkX >> 5, chunkZ >> 5
+
+
+def chunkIndex(chunkX, chunkZ):
+    """Index of chunk x, z in its region's header tables."""
+    return (chunkX & 31) + (chunkZ & 31) * REGION_CHUNKS
+
+
+def regionFileCoords(name, extension):
+    """Region x, z of a region file name ("r.<x>.<z>.<extension>"), or None if it isn't one."""
+    parts = name.split('.')
+    if len(parts) != 4 or parts[0] != 'r' or parts[3] != extension:
+        return None
+    try:
+        return int(parts[1]), int(parts[2])
+    except ValueError:
+        return None
+
+
+class RegionHeader:
+    """The parsed 8 KiB header of a region file: per chunk index (see chunkIndex),
+its sector offset, sector count and last-modified timestamp."""
+    __slots__ = ('offsets', 'sectorCounts', 'timestamps')
+
+    def __init__(self, data):
+        #a truncated (or empty) file just has no chunks past what's there
+        if len(data) < HEADER_BYTES:
+            data = bytes(data) + bytes(HEADER_BYTES - len(data))
+        if npy is not None:
+            #both tables in one vectorized decode (a native-order copy: nothing keeps data exported)
+            tables = npy.frombuffer(data, dtype='>u4', count=2048).astype(npy.uint32)
+            locations = tables[:1024]
+            self.offsets = locations >> 8
+            self.sectorCounts = locations & 0xff
+            self.timestamps = tables[1024:]
+        else:
+            locations = _HEADER_TABLE.unpack_from(data, 0)
+            self.offsets = [loc >> 8 for loc in locations]
+            self.sectorCounts = [loc & 0xff for loc in locations]
+            self.timestamps = list(_HEADER_TABLE.unpack_from(data, SECTOR_BYTES))
+
+    def location(self, index):
+        """(sector offset, sector count) of a chunk, or None if it was never generated."""
+        offset = int(self.offsets[index])
+        count = int(self.sectorCounts[index])
+        if offset == 0 and count == 0:
+            return None
+        return offset, count
+
+    def presence(self):
+        """Presence bitmap: per chunk index, whether that chunk was ever generated."""
+        if npy is not None:
+            return (self.offsets != 0) | (self.sectorCounts != 0)
+        return [offset != 0 or count != 0 for offset, count in zip(self.offsets, self.sectorCounts)]
+
+    def toBytes(self):
+        """The header in its on-disk layout."""
+        if npy is not None:
+            locations = (npy.asarray(self.offsets, dtype=npy.uint32) << 8) | npy.asarray(self.sectorCounts, dtype=npy.uint32)
+            return locations.astype('>u4').tobytes() + npy.asarray(self.timestamps, dtype='>u4').tobytes()
+        locations = [(int(offset) << 8) | int(count) for offset, count in zip(self.offsets, self.sectorCounts)]
+        return _HEADER_TABLE.pack(*locations) + _HEADER_TABLE.pack(*[int(t) for t in self.timestamps])
+
+
+class RegionFile:
+    """One region file. The header is read once, when the file is first opened; the file
+itself may be closed and reopened by a RegionFilePool as descriptors are recycled.
+With mmapped=True the whole file is mapped while open, and read from the map (local files only).
+With a storage (a worldstorage.WorldStorage) path is relative to it, and read through it."""
+
+    def __init__(self, path, mmapped=False, storage=None):
+        self.path = path
+        self.mmapped = mmapped
+        self.storage = storage
+        self.fileobj = None
+        self.map = None
+        self.header = None
+
+    def open(self):
+        if self.fileobj is None:
+            if self.storage is None:
+                self.fileobj = open(self.path, 'rb')
+            else:
+                self.fileobj = self.storage.open(self.path)
+            if self.mmapped and (self.storage is None or self.storage.localPath(self.path) is not None):
+                try:
+                    self.map = mmap.mmap(self.fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:    #empty file: can't be mapped, but has no chunks to read either
+                    self.map = None
+            if self.header is None:
+                if self.map is not None:
+                    self.header = RegionHeader(self.map[:HEADER_BYTES])
+                else:
+                    self.header = RegionHeader(self.fileobj.read(HEADER_BYTES))
+        return self.fileobj
+
+    def close(self):
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                pass    #a chunk's sectors are still in use: unmapped once they're dropped
+            self.map = None
+        if self.fileobj is not None:
+            self.fileobj.close()
+            self.fileobj = None
+
+    def readSectors(self, chunkX, chunkZ):
+        """The raw sectors (chunk header and compressed data) of chunk x, z, or None if it was never generated."""
+        loc = self.header.location(chunkIndex(chunkX, chunkZ))
+        if loc is None:
+            return None
+        return self._readRun(*loc)
+
+    def readChunks(self, chunks, gapSectors=0, maxRunSectors=MAX_RUN_SECTORS):
+        """Yields (chunkX, chunkZ, sectors) for each chunk x, z in chunks, sectors being as readSectors gives.
+Generated chunks come first, in sector order, read as runs of adjacent sectors: one read per run
+rather than per chunk. Runs bridge gaps of up to gapSectors unused sectors, and stop growing at
+maxRunSectors (a chunk bigger than that is a run of its own). Then chunks never generated, with None."""
+        located = []
+        missing = []
+        for chunkX, chunkZ in chunks:
+            loc = self.header.location(chunkIndex(chunkX, chunkZ))
+            if loc is None:
+                missing.append((chunkX, chunkZ))
+            else:
+                located.append((loc[0], loc[1], chunkX, chunkZ))
+        located.sort()
+
+        runs = []    #(first, last + 1 index into located, start sector, end sector)
+        i = 0
+        while i < len(located):
+            runStart = located[i][0]
+            runEnd = runStart + located[i][1]
+            j = i + 1
+            while j < len(located):
+                offset, count = located[j][:2]
+                if offset > runEnd + gapSectors or max(runEnd, offset + count) - runStart > maxRunSectors:
+                    break
+                runEnd = max(runEnd, offset + count)
+                j += 1
+            runs.append((i, j, runStart, runEnd))
+            i = j
+
+        for n, (i, j, runStart, runEnd) in enumerate(runs):
+            if self.storage is not None and n % PREFETCH_RUNS == 0:
+                #the next few runs, fetched together (for remote storage, as concurrent requests)
+                self.storage.prefetch([(self.path, start * SECTOR_BYTES, (end - start) * SECTOR_BYTES)
+                    for i2, j2, start, end in runs[n:n + PREFETCH_RUNS]])
+            run = self._readRun(runStart, runEnd - runStart)
+            for offset, count, chunkX, chunkZ in located[i:j]:
+                start = (offset - runStart) * SECTOR_BYTES
+                yield chunkX, chunkZ, run[start:start + count * SECTOR_BYTES]
+
+        for chunkX, chunkZ in missing:
+            yield chunkX, chunkZ, None
+
+    def _readRun(self, offset, count):
+        regfile = self.open()
+        if self.map is not None:
+            return memoryview(self.map)[offset * SECTOR_BYTES:(offset + count) * SECTOR_BYTES]
+        regfile.seek(offset * SECTOR_BYTES)
+        return memoryview(regfile.read(count * SECTOR_BYTES))
+
+
+def inflateChunk(sectorData):
+    """The inflated NBT payload of a chunk, from its raw sectors (see RegionFile.readSectors)."""
+    length, compression = _CHUNK_HEADER.unpack_from(sectorData, 0)
+    zipped = memoryview(sectorData)[5:4 + length]
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompress(zipped)
+    if compression == COMPRESSION_GZIP:
+        return zlib.decompress(zipped, 16 + zlib.MAX_WBITS)
+    if compression == COMPRESSION_NONE:
+        return bytes(zipped)
+    raise IOError("unknown chunk compression type %d" % compression)
+
+
+def inflateChunks(chunks, workers=4, maxPending=None):
+    """Yields (chunkX, chunkZ, payload) for each (chunkX, chunkZ, sectors) in chunks (eg. from
+RegionFilePool.readChunks), payload being the inflated NBT (None where sectors is None).
+zlib releases the GIL, so with workers > 1 chunks are inflated on that many threads and come
+back in completion order, not the order given. At most maxPending (default 4 per worker) are
+in flight at once, so chunks are only read about as fast as they're inflated."""
+    if workers <= 1:
+        for chunkX, chunkZ, sectors in chunks:
+            yield chunkX, chunkZ, None if sectors is None else inflateChunk(sectors)
+        return
+    if maxPending is None:
+        maxPending = workers * 4
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for chunkX, chunkZ, sectors in chunks:
+            if sectors is None:
+                yield chunkX, chunkZ, None
+                continue
+            pending[executor.submit(inflateChunk, sectors)] = (chunkX, chunkZ)
+            if len(pending) >= maxPending:
+                done = wait(pending, return_when=FIRST_COMPLETED)[0]
+                for future in done:
+                    doneX, doneZ = pending.pop(future)
+                    yield doneX, doneZ, future.result()
+        while pending:
+            done = wait(pending, return_when=FIRST_COMPLETED)[0]
+            for future in done:
+                doneX, doneZ = pending.pop(future)
+                yield doneX, doneZ, future.result()
+
+
+
+# Pipeline stages.
+# A chunk goes through reading, inflating, parsing and voxel filling. Run one after the
+# other, the disk sits idle while a chunk is parsed and the CPU while the next is read.
+# pipelineStage runs one step on a thread of its own, a bounded queue ahead of the next:
+# the queue's bound is the backpressure that keeps a fast stage from buffering the
+# whole load (and its memory) ahead of a slow one.
+
+def pipelineStage(items, depth=PIPELINE_DEPTH):
+    """Yields what iterating items yields, but iterates items on a thread of its own, at most depth
+items ahead of the consumer. Exceptions are re-raised in the consumer; closing the generator
+early stops the thread."""
+    results = queue.Queue(depth)
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                results.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not put((True, item)):
+                    return
+            put((False, None))
+        except BaseException as e:
+            put((False, e))
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name='pipeline stage', daemon=True)
+    thread.start()
+    try:
+        while True:
+            more, item = results.get()
+            if not more:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+# Region header index cache.
+# One file per region directory (ie. per world dimension), holding the header tables
+# of each region file read, keyed by file name and checked against the file's size
+# and mtime: a repeat import of an unchanged region gets its header without reading it.
+# File layout: _CACHE_MAGIC, then per region: _CACHE_ENTRY (name length, size,
+# mtime in ns), the name (utf-8), and the HEADER_BYTES of tables in header layout.
+
+_CACHE_MAGIC = b"MBRI\x01"
+_CACHE_ENTRY = Struct(">Hqq")
+
+
+def headerCachePath(directory, cacheRoot):
+    """Where the RegionHeaderCache for a region directory (a local path, or a WorldStorage location) lives, under cacheRoot."""
+    if '://' not in directory:
+        directory = os.path.abspath(directory)
+    key = hashlib.sha1(directory.encode('utf-8')).hexdigest()[:20]
+    return os.path.join(cacheRoot, 'regionindex', key + '.idx')
+
+
+def _fileStat(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class RegionHeaderCache:
+    """Region headers of one region directory, persisted in the file at path (see headerCachePath).
+A missing, unreadable or corrupt cache file just starts an empty cache."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}    #region file name: (size, mtime_ns, header bytes)
+        self.dirty = False
+        try:
+            with open(path, 'rb') as cacheFile:
+                data = cacheFile.read()
+        except OSError:
+            return
+        if data[:len(_CACHE_MAGIC)] != _CACHE_MAGIC:
+            return
+        pos = len(_CACHE_MAGIC)
+        try:
+            while pos < len(data):
+                nameLength, size, mtime = _CACHE_ENTRY.unpack_from(data, pos)
+                pos += _CACHE_ENTRY.size
+                name = data[pos:pos + nameLength].decode('utf-8')
+                pos += nameLength
+                header = data[pos:pos + HEADER_BYTES]
+                if len(header) != HEADER_BYTES:
+                    raise ValueError("truncated region index")
+                pos += HEADER_BYTES
+                self.entries[name] = (size, mtime, header)
+        except (StructError, ValueError):    #corrupt: start again
+            self.entries = {}
+
+    def header(self, path, stat=_fileStat):
+        """The cached RegionHeader for the region file at path, or None if there's none or the
+file's size or mtime have changed since. Raises FileNotFoundError if there's no such file.
+stat gives a file's (size, mtime in ns): a WorldStorage's, for a file in one."""
+        entry = self.entries.get(os.path.basename(path))
+        size, mtime = stat(path)
+        if entry is None or mtime is None or entry[0] != size or entry[1] != mtime:
+            return None
+        return RegionHeader(entry[2])
+
+    def store(self, path, header, stat=_fileStat):
+        """Records the RegionHeader just read from the region file at path (stat as for header())."""
+        size, mtime = stat(path)
+        if mtime is None:
+            return    #can't tell when it's changed
+        self.entries[os.path.basename(path)] = (size, mtime, header.toBytes())
+        self.dirty = True
+
+    def save(self):
+        """Writes the cache file, if anything changed. Failing to is reported, not raised: it's only a cache."""
+        if not self.dirty:
+            return
+        parts = [_CACHE_MAGIC]
+        for name, (size, mtime, header) in sorted(self.entries.items()):
+            encoded = name.encode('utf-8')
+            parts.append(_CACHE_ENTRY.pack(len(encoded), size, mtime))
+            parts.append(encoded)
+            parts.append(header)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tempPath = self.path + '.tmp'
+            with open(tempPath, 'wb') as cacheFile:
+                cacheFile.write(b"".join(parts))
+            os.replace(tempPath, self.path)
+            self.dirty = False
+        except OSError as e:
+            print("Couldn't save region index %s: %s" % (self.path, e))
+
+
+class RegionFilePool:
+    """The region files of one dimension's region directory, each opened once per import
+with its header cached. At most maxOpen are kept open at a time: the least recently used
+one is closed (its header stays cached) when another needs opening. Regions that don't
+exist are remembered too, so they cost one failed open rather than a stat per chunk; once
+the directory has been listed (see listRegions) they cost nothing at all.
+mmapped is passed on to every RegionFile. With a headerCache (a RegionHeaderCache for this
+directory) headers come from there when still valid, new ones are added, and it's saved on close().
+With a storage (a worldstorage.WorldStorage) directory is relative to it, and files are read through it."""
+
+    def __init__(self, directory='.', extension='mca', maxOpen=16, mmapped=False, headerCache=None, storage=None):
+        self.storage = storage
+        self.directory = os.path.abspath(directory) if storage is None else directory
+        self.extension = extension
+        self.mmapped = mmapped
+        self.headerCache = headerCache
+        self.maxOpen = maxOpen
+        self.regions = {}    #(regionX, regionZ): RegionFile, or None if there's no such file
+        self._open = OrderedDict()    #open RegionFiles, least recently used first
+        self.present = None    #(regionX, regionZ) of every region file, once listed
+
+    def region(self, regionX, regionZ):
+        """The RegionFile for region x, z, opened (and its header read), or None if it doesn't exist."""
+        key = (regionX, regionZ)
+        try:
+            region = self.regions[key]
+        except KeyError:
+            if self.present is not None and key not in self.present:
+                self.regions[key] = None
+                return None
+            region = RegionFile(self._path(regionX, regionZ), self.mmapped, self.storage)
+            try:
+                if self.headerCache is not None:
+                    stat = _fileStat if self.storage is None else self.storage.stat
+                    region.header = self.headerCache.header(region.path, stat)
+                    if region.header is None:
+                        self._use(region)
+                        self.headerCache.store(region.path, region.header, stat)
+                self._use(region)
+            except FileNotFoundError:
+                region = None
+            self.regions[key] = region
+            return region
+        if region is not None:
+            self._use(region)
+        return region
+
+    def _path(self, regionX, regionZ):
+        name = "r.%d.%d.%s" % (regionX, regionZ, self.extension)
+        if self.storage is None:
+            return os.path.join(self.directory, name)
+        return worldstorage.joinPath(self.directory, name)
+
+    def localDirectory(self):
+        """The region directory on the local filesystem, or None if it isn't on one."""
+        if self.storage is None:
+            return self.directory
+        return self.storage.localPath(self.directory)
+
+    def _headerCached(self, path):
+        """Whether the header cache holds a still valid header for the region file at path."""
+        if self.headerCache is None:
+            return False
+        stat = _fileStat if self.storage is None else self.storage.stat
+        try:
+            return self.headerCache.header(path, stat) is not None
+        except FileNotFoundError:
+            return False
+
+    def _use(self, region):
+        if region.fileobj is None:
+            region.open()    #first, so a missing file doesn't cost an open one
+            while len(self._open) >= self.maxOpen:
+                self._open.popitem(last=False)[1].close()
+            self._open[region.path] = region
+        else:
+            self._open.move_to_end(region.path)
+
+    def regionForChunk(self, chunkX, chunkZ):
+        return self.region(*regionCoords(chunkX, chunkZ))
+
+    def listRegions(self):
+        """The set of (regionX, regionZ) of the directory's region files, from one listing (kept)."""
+        if self.present is None:
+            try:
+                names = os.listdir(self.directory) if self.storage is None else self.storage.list(self.directory)
+            except FileNotFoundError:
+                names = []
+            self.present = {coords for coords in (regionFileCoords(name, self.extension) for name in names) if coords is not None}
+        return self.present
+
+    def generatedChunks(self, chunks):
+        """The chunks (x, z) of chunks that exist, in the same order: a load plan with nothing in it for
+ungenerated areas. Decided from one directory listing and each present region's header presence bitmap,
+so missing regions are never opened and no chunk is read."""
+        present = self.listRegions()
+        if self.storage is not None:
+            #every header the plan needs and the header cache can't supply, fetched together
+            #(for remote storage, as concurrent requests)
+            needed = {regionCoords(chunkX, chunkZ) for chunkX, chunkZ in chunks}
+            paths = [self._path(*key) for key in needed if key in present and key not in self.regions]
+            self.storage.prefetch([(path, 0, HEADER_BYTES) for path in paths if not self._headerCached(path)])
+        bitmaps = {}
+        generated = []
+        for chunkX, chunkZ in chunks:
+            key = regionCoords(chunkX, chunkZ)
+            if key not in present:
+                continue
+            if key not in bitmaps:
+                region = self.region(*key)
+                bitmaps[key] = None if region is None else region.header.presence()
+            bitmap = bitmaps[key]
+            if bitmap is not None and bitmap[chunkIndex(chunkX, chunkZ)]:
+                generated.append((chunkX, chunkZ))
+        return generated
+
+    def chunkTimestamp(self, chunkX, chunkZ):
+        """Last-modified time (epoch seconds) of chunk x, z from its region header, or None if it doesn't exist."""
+        region = self.regionForChunk(chunkX, chunkZ)
+        if region is None:
+            return None
+        index = chunkIndex(chunkX, chunkZ)
+        if region.header.location(index) is None:
+            return None
+        return int(region.header.timestamps[index])
+
+    def readSectors(self, chunkX, chunkZ):
+        """The raw sectors of chunk x, z, or None if its region or the chunk itself doesn't exist."""
+        region = self.regionForChunk(chunkX, chunkZ)
+        if region is None:
+            return None
+        return region.readSectors(chunkX, chunkZ)
+
+    def readChunks(self, chunks, gapSectors=0, maxRunSectors=MAX_RUN_SECTORS):
+        """Yields (chunkX, chunkZ, sectors) for every chunk x, z in chunks (in any order), sectors
+being None for chunks that don't exist. Chunks are read a region at a time, in sector order with
+adjacent sectors coalesced into single reads (see RegionFile.readChunks), so a load square turns into
+mostly sequential reads rather than jumping between and around files."""
+        byRegion = {}
+        for chunkX, chunkZ in chunks:
+            byRegion.setdefault(regionCoords(chunkX, chunkZ), []).append((chunkX, chunkZ))
+        for key in sorted(byRegion):
+            region = self.region(*key)
+            if region is None:
+                for chunkX, chunkZ in byRegion[key]:
+                    yield chunkX, chunkZ, None
+            else:
+                for chunk in region.readChunks(byRegion[key], gapSectors, maxRunSectors):
+                    yield chunk
+
+    def close(self):
+        for region in self._open.values():
+            region.close()
+        self._open.clear()
+        if self.headerCache is not None:
+            self.headerCache.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
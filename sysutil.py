@@ -12,8 +12,19 @@ else:
 
 MCSAVEPATH = os.path.join(MCPATH, 'saves/')
 
+#Where the addon keeps its own caches (region indexes etc). Safe to delete.
+if sys.platform == 'darwin':
+    CACHEPATH = os.path.join(os.environ['HOME'], 'Library', 'Caches', 'mineblend')
+elif sys.platform == 'linux':
+    CACHEPATH = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.environ['HOME'], '.cache')), 'mineblend')
+else:
+    CACHEPATH = os.path.join(os.environ.get('LOCALAPPDATA', os.environ['APPDATA']), 'mineblend', 'cache')
+
 def getMCPath():
     return MCPATH
 
 def getMCSavePath():
     return MCSAVEPATH
+
+def getCachePath():
+    return CACHEPATH
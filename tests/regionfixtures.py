@@ -0,0 +1,65 @@
+# Region file fixtures shared by the tests: a region file writer, and a storage that logs what's read.
+
+import gzip, os, sys, zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import regionfile, worldstorage
+
+
+def storedChunk(payload, compression=regionfile.COMPRESSION_ZLIB):
+    """A chunk as stored in a region file (length, compression type, compressed payload), unpadded."""
+    if compression == regionfile.COMPRESSION_ZLIB:
+        data = zlib.compress(payload)
+    elif compression == regionfile.COMPRESSION_GZIP:
+        data = gzip.compress(payload)
+    else:
+        data = payload
+    return (len(data) + 1).to_bytes(4, 'big') + bytes([compression]) + data
+
+
+def writeRegion(path, payloads, timestamps=None, compression=None, order=None, gaps=None):
+    """Writes a region file holding payloads (chunk x, z: its inflated NBT, or any bytes) and returns
+each chunk's (sector offset, sector count). Chunks are stored in order (default: sorted), compressed
+as compression says (chunk: compression type, default zlib), each after gaps (chunk: unused sectors,
+default none). timestamps (chunk: epoch seconds) default to 1000 + the chunk's index."""
+    locations = [0] * 1024
+    stamps = [0] * 1024
+    sectors = []
+    placed = {}
+    offset = regionfile.HEADER_BYTES // regionfile.SECTOR_BYTES
+    for chunk in (sorted(payloads) if order is None else order):
+        gap = (gaps or {}).get(chunk, 0)
+        sectors.append(bytes(gap * regionfile.SECTOR_BYTES))
+        offset += gap
+        stored = storedChunk(payloads[chunk], (compression or {}).get(chunk, regionfile.COMPRESSION_ZLIB))
+        count = -(-len(stored) // regionfile.SECTOR_BYTES)
+        index = regionfile.chunkIndex(*chunk)
+        locations[index] = offset << 8 | count
+        stamps[index] = (timestamps or {}).get(chunk, 1000 + index)
+        placed[chunk] = (offset, count)
+        offset += count
+        sectors.append(stored.ljust(count * regionfile.SECTOR_BYTES, b'\0'))
+    header = b''.join(l.to_bytes(4, 'big') for l in locations) + b''.join(t.to_bytes(4, 'big') for t in stamps)
+    with open(path, 'wb') as f:
+        f.write(header + b''.join(sectors))
+    return placed
+
+
+class LoggingStorage(worldstorage.LocalStorage):
+    """A LocalStorage whose files are read through read(), recording each read and prefetch."""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.reads = []
+        self.prefetches = []
+
+    def open(self, path):
+        self.stat(path)
+        return worldstorage._StorageFile(self, path)
+
+    def read(self, path, offset=0, length=None):
+        self.reads.append((path, offset, length))
+        return super().read(path, offset, length)
+
+    def prefetch(self, requests):
+        self.prefetches.extend(requests)
@@ -0,0 +1,89 @@
+# Tests for chunkcache's on-disk DecodedChunkCache: hits, stale entries, and eviction under its byte budget.
+# Run outside Blender, from the addon directory: python -m unittest discover tests
+
+import os, random, shutil, sys, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import chunkcache, chunkdecode
+from test_chunkdecode import chunk
+
+
+def batch(x, z, seed):
+    """A chunkdecode.SectionBatch of chunk x, z: two sections of random blocks (that barely compress)."""
+    rng = random.Random(seed)
+    sections = {y: (bytes(rng.getrandbits(8) for i in range(4096)), bytes(rng.getrandbits(8) for i in range(2048))) for y in (0, 2)}
+    return chunkdecode.batchSections([chunk(x, z, sections)])
+
+
+class DecodedChunkCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cacheRoot = tempfile.mkdtemp()
+        self.root = chunkcache.chunkCacheRoot(self.cacheRoot)
+        self.overworld = chunkcache.chunkCachePath('/worlds/a/region', self.cacheRoot)
+        self.nether = chunkcache.chunkCachePath('/worlds/a/DIM-1/region', self.cacheRoot)
+
+    def tearDown(self):
+        shutil.rmtree(self.cacheRoot)
+
+    def assertBatchEqual(self, a, b):
+        for name in ('blocks', 'data', 'chunkX', 'chunkZ', 'sectionY'):
+            self.assertEqual(getattr(a, name).tolist(), getattr(b, name).tolist())
+
+    def testHit(self):
+        cache = chunkcache.DecodedChunkCache(self.overworld, 1 << 30)
+        self.assertIsNone(cache.get(-3, 40, 1000))
+        cache.put(-3, 40, 1000, batch(-3, 40, 1))
+        self.assertBatchEqual(cache.get(-3, 40, 1000), batch(-3, 40, 1))
+        #and from a later import
+        cache = chunkcache.DecodedChunkCache(self.overworld, 1 << 30)
+        self.assertBatchEqual(cache.get(-3, 40, 1000), batch(-3, 40, 1))
+        self.assertIsNone(cache.get(-3, 41, 1000))
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (1, 1, 0))
+        self.assertNotEqual(self.overworld, self.nether)
+        self.assertIsNone(chunkcache.DecodedChunkCache(self.nether, 1 << 30).get(-3, 40, 1000))
+
+    def testStale(self):
+        #the chunk was saved again since it was cached: its region timestamp moved on
+        cache = chunkcache.DecodedChunkCache(self.overworld, 1 << 30)
+        cache.put(5, 5, 1000, batch(5, 5, 1))
+        self.assertIsNone(cache.get(5, 5, 1001))
+        cache.put(5, 5, 1001, batch(5, 5, 2))
+        self.assertBatchEqual(cache.get(5, 5, 1001), batch(5, 5, 2))
+        self.assertIsNone(cache.get(5, 5, 1000))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def evicting(self, directories, budgetRoot):
+        """Caches chunks a and b (in directories[0] and [1]) and, once a has been used since, c in directories[0],
+with room for only two of them: returns the names of the chunks left."""
+        cache = chunkcache.DecodedChunkCache(directories[0], 1 << 30, budgetRoot)
+        cache.put(0, 0, 1, batch(0, 0, 1))
+        chunkcache.DecodedChunkCache(directories[1], 1 << 30, budgetRoot).put(1, 0, 1, batch(1, 0, 2))
+        paths = {'a': cache._path(0, 0), 'b': chunkcache.DecodedChunkCache(directories[1], 0)._path(1, 0)}
+        os.utime(paths['a'], (1000, 1000))
+        os.utime(paths['b'], (2000, 2000))
+        size = max(os.path.getsize(path) for path in paths.values())
+        cache = chunkcache.DecodedChunkCache(directories[0], 2 * size + size // 2, budgetRoot)
+        self.assertIsNotNone(cache.get(0, 0, 1))    #a is now the most recently used
+        cache.put(2, 0, 1, batch(2, 0, 3))
+        left = [name for name, path in dict(paths, c=cache._path(2, 0)).items() if os.path.exists(path)]
+        self.assertLessEqual(cache._total, cache.maxBytes)
+        return left, cache.evictions
+
+    def testEviction(self):
+        left, evictions = self.evicting([self.overworld, self.overworld], None)
+        self.assertEqual((left, evictions), (['a', 'c'], 1))    #b, the least recently used, went
+
+    def testSharedBudget(self):
+        #one budget over both dimensions' caches: caching in the overworld evicts from the nether
+        left, evictions = self.evicting([self.overworld, self.nether], self.root)
+        self.assertEqual((left, evictions), (['a', 'c'], 1))
+        #with a budget each, nothing needs evicting
+        shutil.rmtree(self.root)
+        left, evictions = self.evicting([self.overworld, self.nether], None)
+        self.assertEqual((left, evictions), (['a', 'b', 'c'], 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+# Tests for chunkdecode's batch section decoder: its vectorised voxel fill matches the block by block one.
+# Run outside Blender, from the addon directory: python -m unittest discover tests
+
+import os, random, struct, sys, unittest
+
+import numpy as npy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import chunkdecode, nbtreader
+from test_nbtreader import tag
+
+KNOWN = {1, 2, 3, 8, 9, 17, 18}    #stand-in for BLOCKDATA
+EXCLUDED = {31, 32}
+UNKNOWN = {200, 201}
+IDS = [0] * 6 + sorted(KNOWN | EXCLUDED | UNKNOWN)
+
+
+def chunk(x, z, sections):
+    """An Anvil chunk at x, z with sections (section Y: (blocks, data))."""
+    items = [tag(nbtreader.TAG_BYTE, 'Y', bytes((y,)))
+        + tag(nbtreader.TAG_BYTE_ARRAY, 'Blocks', struct.pack('>i', len(blocks)) + blocks)
+        + tag(nbtreader.TAG_BYTE_ARRAY, 'Data', struct.pack('>i', len(data)) + data)
+        + tag(nbtreader.TAG_BYTE_ARRAY, 'SkyLight', struct.pack('>i', 2048) + bytes(2048)) + b'\0'
+        for y, (blocks, data) in sorted(sections.items())]
+    level = (tag(nbtreader.TAG_INT, 'xPos', struct.pack('>i', x)) + tag(nbtreader.TAG_INT, 'zPos', struct.pack('>i', z))
+        + tag(nbtreader.TAG_LIST, 'Sections', bytes((nbtreader.TAG_COMPOUND,)) + struct.pack('>i', len(items)) + b''.join(items))
+        + b'\0')
+    return tag(nbtreader.TAG_COMPOUND, '', tag(nbtreader.TAG_COMPOUND, 'Level', level) + b'\0')
+
+
+def processChunk2(payload, blockBuffer, extraBuffer, zeroAdjX, zeroAdjZ, lowLimit, highLimit):
+    """mcanvilreader's processChunk2 (through _processBlocks) as it is outside Blender: block by block.
+Returns the unknown block ids seen."""
+    lvl = nbtreader.readNBTBuffer(payload).value['Level'].value
+    chunkX = lvl['xPos'].value
+    chunkZ = lvl['zPos'].value
+    unknown = set()
+    for section in lvl['Sections'].value:
+        sec = section.value
+        secY = sec['Y'].value * 16
+        if secY + 16 < lowLimit:
+            continue
+        if secY > highLimit:
+            return unknown
+        blockData = sec['Blocks'].value
+        extraData = sec['Data'].value
+        for sy in range(16):
+            dY = secY + sy
+            if dY < lowLimit:
+                continue
+            if dY > highLimit:
+                return unknown
+            for dZ in range(16):
+                for dX in range(16):
+                    blockIndex = (sy * 16 + dZ) * 16 + dX
+                    blockID = blockData[blockIndex]
+                    if blockID != 0 and blockID not in EXCLUDED:
+                        if blockID in KNOWN:
+                            extraDatByte = extraData[blockIndex // 2]
+                            extraValue = (extraDatByte >> 4) & 0x0f if blockIndex % 2 else extraDatByte & 0x0f
+                            baseX = (chunkX + zeroAdjX) * 16
+                            baseZ = (chunkZ + zeroAdjZ) * 16
+                            blockBuffer[baseX + dX][dY][baseZ + dZ] = blockID
+                            extraBuffer[baseX + dX][dY][baseZ + dZ] = extraValue
+                        else:
+                            unknown.add(blockID)
+    return unknown
+
+
+class FillVoxelsTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(3)
+
+        def section():
+            return bytes(rng.choice(IDS) for i in range(4096)), bytes(rng.getrandbits(8) for i in range(2048))
+
+        #chunk x, z: its sections, with gaps and a chunk that has none
+        self.payloads = [chunk(-1, 0, {0: section(), 1: section(), 3: section()}),
+            chunk(0, 1, {1: section(), 2: section()}),
+            chunk(-1, 1, {})]
+        self.zeroAdjX, self.zeroAdjZ = 1, 0
+        self.shape = (32, 64, 32)
+
+    def fill(self, lowLimit, highLimit):
+        """(block buffer, extra buffer, rejected ids) from fillVoxels and from processChunk2."""
+        batch = chunkdecode.batchSections(self.payloads)
+        blocks, extra = npy.zeros(self.shape), npy.zeros(self.shape)
+        rejected, written = chunkdecode.fillVoxels(batch, blocks, extra, self.zeroAdjX, self.zeroAdjZ,
+            chunkdecode.blockFilter(KNOWN, EXCLUDED), lowLimit, highLimit)
+        self.assertEqual(written, npy.count_nonzero(blocks))
+        expectedBlocks, expectedExtra = npy.zeros(self.shape), npy.zeros(self.shape)
+        unknown = set()
+        for payload in self.payloads:
+            unknown |= processChunk2(payload, expectedBlocks, expectedExtra, self.zeroAdjX, self.zeroAdjZ, lowLimit, highLimit)
+        return (blocks, extra, rejected.difference(EXCLUDED)), (expectedBlocks, expectedExtra, unknown)
+
+    def assertMatches(self, lowLimit, highLimit):
+        (blocks, extra, rejected), (expectedBlocks, expectedExtra, unknown) = self.fill(lowLimit, highLimit)
+        npy.testing.assert_array_equal(blocks, expectedBlocks)
+        npy.testing.assert_array_equal(extra, expectedExtra)
+        self.assertEqual(rejected, unknown)
+        return blocks
+
+    def testMatchesProcessChunk2(self):
+        blocks = self.assertMatches(0, 255)
+        self.assertTrue(npy.count_nonzero(blocks))
+        self.assertTrue(npy.count_nonzero(blocks[:, 48:64, :]))
+
+    def testLimits(self):
+        for lowLimit, highLimit in ((5, 37), (16, 31), (17, 17), (40, 255), (0, 3)):
+            blocks = self.assertMatches(lowLimit, highLimit)
+            self.assertFalse(npy.count_nonzero(blocks[:, :lowLimit, :]))
+            self.assertFalse(npy.count_nonzero(blocks[:, highLimit + 1:, :]))
+
+    def testRejected(self):
+        (blocks, extra, rejected), expected = self.fill(0, 255)
+        self.assertEqual(rejected, UNKNOWN)
+        for blockID in EXCLUDED | UNKNOWN:
+            self.assertFalse((blocks == blockID).any())
+
+    def testOrder(self):
+        #a block at x 2, y 16 + 5, z 9 of chunk 0, 1, and one next to it: YZX in the section, [x][y][z] in the buffers
+        blocks = bytearray(4096)
+        data = bytearray(2048)
+        index = (5 * 16 + 9) * 16 + 2
+        blocks[index] = 17
+        blocks[index + 1] = 18    #x 3: the high nibble of the same byte
+        data[index // 2] = 0x6a    #even index: low nibble
+        self.payloads = [chunk(0, 1, {1: (bytes(blocks), bytes(data))})]
+        blocks = self.assertMatches(0, 255)
+        _, extra, _ = self.fill(0, 255)[0]
+        x, y, z = 16 + 2, 16 + 5, 16 + 9
+        self.assertEqual(blocks[x][y][z], 17)
+        self.assertEqual(blocks[x + 1][y][z], 18)
+        self.assertEqual(extra[x][y][z], 0xa)
+        self.assertEqual(extra[x + 1][y][z], 0x6)
+        self.assertEqual(npy.count_nonzero(blocks), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
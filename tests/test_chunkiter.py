@@ -0,0 +1,80 @@
+# Tests for chunkiter's generator API over a synthetic world.
+# Run outside Blender, from the addon directory: python -m unittest discover tests
+
+import os, random, shutil, sys, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import chunkiter
+from regionfixtures import writeRegion
+from test_chunkdecode import chunk
+
+#chunks of each region, in the order they're stored in it
+REGIONS = {
+    (0, 0): [(3, 1), (0, 0), (31, 31), (1, 0), (0, 2)],
+    (-1, 0): [(-1, 5), (-32, 0), (-2, 0)],
+    (0, 1): [(4, 32), (0, 40)],
+}
+
+
+class IterChunksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.world = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.world, 'region'))
+        rng = random.Random(6)
+        self.timestamps = {}
+        for (regionX, regionZ), chunks in REGIONS.items():
+            payloads = {}
+            for x, z in chunks:
+                payloads[(x, z)] = chunk(x, z, {(x + z) % 4: (bytes([x % 200 + 1]) * 4096, bytes(2048))})
+                self.timestamps[(x, z)] = rng.randint(1, 2 ** 31)
+            writeRegion(os.path.join(self.world, 'region', 'r.%d.%d.mca' % (regionX, regionZ)), payloads,
+                self.timestamps, order=chunks)
+
+    def tearDown(self):
+        shutil.rmtree(self.world)
+
+    def chunks(self, **args):
+        records = list(chunkiter.iterChunks(self.world, **args))
+        for record in records:
+            self.assertEqual(record.timestamp, self.timestamps[(record.x, record.z)])
+        return [(record.x, record.z) for record in records]
+
+    def testDiskOrder(self):
+        #a region at a time (z-major), each in sector order
+        self.assertEqual(self.chunks(), REGIONS[(-1, 0)] + REGIONS[(0, 0)] + REGIONS[(0, 1)])
+        self.assertEqual(self.chunks(order=chunkiter.ORDER_DISK), self.chunks())
+
+    def testRowOrder(self):
+        everything = [chunk for chunks in REGIONS.values() for chunk in chunks]
+        self.assertEqual(self.chunks(order=chunkiter.ORDER_ROWS), sorted(everything, key=lambda c: (c[1], c[0])))
+
+    def testBbox(self):
+        #across three regions, clipped on every side; ungenerated chunks inside it are skipped
+        bbox = (-2, 0, 3, 32)
+        inside = [(x, z) for chunks in REGIONS.values() for x, z in chunks if -2 <= x <= 3 and 0 <= z <= 32]
+        self.assertEqual(sorted(inside), sorted([(-2, 0), (-1, 5), (0, 0), (1, 0), (0, 2), (3, 1)]))
+        self.assertEqual(self.chunks(bbox=bbox, order=chunkiter.ORDER_ROWS), sorted(inside, key=lambda c: (c[1], c[0])))
+        self.assertEqual(self.chunks(bbox=bbox), [(-1, 5), (-2, 0), (3, 1), (0, 0), (1, 0), (0, 2)])
+        self.assertEqual(self.chunks(bbox=(5, 5, 20, 20)), [])
+        self.assertEqual(self.chunks(bbox=(100, 100, 110, 110)), [])    #no regions there at all
+
+    def testRecord(self):
+        records = {(record.x, record.z): record for record in chunkiter.iterChunks(self.world, bbox=(0, 0, 3, 3))}
+        record = records[(3, 1)]
+        sections = record.sections()
+        self.assertEqual(sections.sectionY.tolist(), [(3 + 1) % 4])
+        self.assertEqual(sections.blocks[0, 0], 4)
+        self.assertEqual(record.level()['xPos'].value, 3)
+
+    def testDimensions(self):
+        self.assertEqual(self.chunks(dimension=-1), [])    #no nether region directory
+        with self.assertRaises(ValueError):
+            chunkiter.regionDirectory(self.world, 7)
+        with self.assertRaises(ValueError):
+            list(chunkiter.iterChunks(self.world, order='random'))
+
+
+if __name__ == '__main__':
+    unittest.main()
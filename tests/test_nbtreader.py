@@ -0,0 +1,477 @@
+# Tests for nbtreader's decoders (buffer, lazy, selective, compact, streaming and layout-specialised) against readNBT.
+# Run outside Blender, from the addon directory: python -m unittest discover tests
+
+import gzip, io, os, random, shutil, struct, sys, tempfile, unittest, zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import nbtreader
+
+SELECT = nbtreader.compileSelect(['Level/xPos', 'Level/Sections/*/Y', 'Level/Sections/*/Blocks'])
+
+
+TAG_IDS = {cls: tagId for tagId, cls in nbtreader.TAGLIST.items()}
+
+
+def tag(tagId, name, payload):
+    encoded = name.encode('utf-8')
+    return bytes((tagId,)) + struct.pack('>h', len(encoded)) + encoded + payload
+
+
+def chunk(x, sectionYs, emptyItemId=nbtreader.TAG_END):
+    """A minimal Anvil chunk with sections at sectionYs (an empty Sections list of emptyItemId if none)."""
+    sections = [tag(nbtreader.TAG_BYTE, 'Y', bytes((y,)))
+        + tag(nbtreader.TAG_BYTE_ARRAY, 'Blocks', struct.pack('>i', 4096) + bytes((y + 1,)) * 4096)
+        + tag(nbtreader.TAG_BYTE_ARRAY, 'Data', struct.pack('>i', 2048) + bytes(2048)) + b'\0' for y in sectionYs]
+    itemId = nbtreader.TAG_COMPOUND if sections else emptyItemId
+    level = (tag(nbtreader.TAG_INT, 'xPos', struct.pack('>i', x))
+        + tag(nbtreader.TAG_LIST, 'Sections', bytes((itemId,)) + struct.pack('>i', len(sections)) + b''.join(sections))
+        + tag(nbtreader.TAG_LONG, 'LastUpdate', bytes(8)) + b'\0')
+    return tag(nbtreader.TAG_COMPOUND, '', tag(nbtreader.TAG_COMPOUND, 'Level', level) + b'\0')
+
+
+def everyTag():
+    """A payload with every tag type in it, nested (lists of lists too), with empty containers and a multi-block long array."""
+    def array(tagId, name, fmt, values):
+        return tag(tagId, name, struct.pack('>i', len(values)) + struct.pack('>%d%s' % (len(values), fmt), *values))
+    def string(text):
+        encoded = text.encode('utf-8')
+        return struct.pack('>h', len(encoded)) + encoded
+    item = lambda i: (tag(nbtreader.TAG_SHORT, 'n', struct.pack('>h', -i)) + tag(nbtreader.TAG_STRING, 's', string('item %d' % i))
+        + array(nbtreader.TAG_LONG_ARRAY, 'l', 'q', [i, -i, 2 ** 62]) + b'\0')
+    body = (tag(nbtreader.TAG_BYTE, 'byte', b'\xfe') + tag(nbtreader.TAG_SHORT, 'short', struct.pack('>h', -300))
+        + tag(nbtreader.TAG_INT, 'int', struct.pack('>i', 1 << 30)) + tag(nbtreader.TAG_LONG, 'long', struct.pack('>q', -(1 << 40)))
+        + tag(nbtreader.TAG_FLOAT, 'float', struct.pack('>f', 1.5)) + tag(nbtreader.TAG_DOUBLE, 'double', struct.pack('>d', -2.25))
+        + tag(nbtreader.TAG_STRING, 'string', string('caf\u00e9')) + tag(nbtreader.TAG_STRING, 'empty string', string(''))
+        + tag(nbtreader.TAG_BYTE_ARRAY, 'bytes', struct.pack('>i', 300) + bytes(range(256)) + bytes(44))
+        + array(nbtreader.TAG_INT_ARRAY, 'ints', 'i', [1, -1, 2 ** 31 - 1, 0])
+        + array(nbtreader.TAG_LONG_ARRAY, 'longs', 'q', list(range(-500, 500, 3)))
+        + tag(nbtreader.TAG_LIST, 'numbers', bytes((nbtreader.TAG_INT,)) + struct.pack('>4i', 3, 1, 4, 1))
+        + tag(nbtreader.TAG_LIST, 'nothing', bytes((nbtreader.TAG_END,)) + struct.pack('>i', 0))
+        + tag(nbtreader.TAG_LIST, 'items', bytes((nbtreader.TAG_COMPOUND,)) + struct.pack('>i', 3) + b''.join(item(i) for i in range(3)))
+        + tag(nbtreader.TAG_LIST, 'matrix', bytes((nbtreader.TAG_LIST,)) + struct.pack('>i', 3)
+            + bytes((nbtreader.TAG_INT,)) + struct.pack('>4i', 3, 2, 7, -1) + bytes((nbtreader.TAG_INT,)) + struct.pack('>3i', 2, 1, 5)
+            + bytes((nbtreader.TAG_END,)) + struct.pack('>i', 0))
+        + tag(nbtreader.TAG_LIST, 'groups', bytes((nbtreader.TAG_LIST,)) + struct.pack('>i', 2)
+            + bytes((nbtreader.TAG_COMPOUND,)) + struct.pack('>i', 2) + item(3) + item(4)
+            + bytes((nbtreader.TAG_COMPOUND,)) + struct.pack('>i', 1) + item(5))
+        + tag(nbtreader.TAG_COMPOUND, 'empty', b'\0')
+        + tag(nbtreader.TAG_COMPOUND, 'nested', tag(nbtreader.TAG_COMPOUND, 'deeper', tag(nbtreader.TAG_BYTE, 'b', b'\1') + b'\0') + b'\0'))
+    return tag(nbtreader.TAG_COMPOUND, 'root', body + b'\0')
+
+
+def treeEvents(t, name):
+    """The events NBTEventReader should produce for the tag t (from readNBTBuffer), named name, with array values as lists."""
+    tagId = TAG_IDS[type(t)]    #the numeric tag classes have no type
+    if tagId == nbtreader.TAG_COMPOUND:
+        events = [(nbtreader.EVENT_START_COMPOUND, name, tagId, None)]
+        for childName, child in t.value.items():
+            events += treeEvents(child, childName)
+        return events + [(nbtreader.EVENT_END, name, tagId, None)]
+    if tagId == nbtreader.TAG_LIST:
+        itemId = TAG_IDS[type(t.value[0])] if t.value else nbtreader.TAG_END
+        events = [(nbtreader.EVENT_START_LIST, name, tagId, (itemId, len(t.value)))]
+        for item in t.value:
+            events += treeEvents(item, "")
+        return events + [(nbtreader.EVENT_END, name, tagId, None)]
+    if tagId in (nbtreader.TAG_BYTE_ARRAY, nbtreader.TAG_INT_ARRAY, nbtreader.TAG_LONG_ARRAY):
+        return [(nbtreader.EVENT_ARRAY, name, tagId, list(t.value))]
+    return [(nbtreader.EVENT_SCALAR, name, tagId, t.value)]
+
+
+def plain(t):
+    """The tag t (from any of the decoders) as (tag id, value), compounds as dicts and lists and arrays as lists."""
+    tagId = TAG_IDS[type(t)]
+    if tagId == nbtreader.TAG_COMPOUND:
+        return tagId, {name: plain(child) for name, child in t.value.items()}
+    if tagId == nbtreader.TAG_LIST:
+        return tagId, [plain(item) for item in t.value]
+    if tagId in (nbtreader.TAG_BYTE_ARRAY, nbtreader.TAG_INT_ARRAY, nbtreader.TAG_LONG_ARRAY):
+        return tagId, [int(n) for n in t.value]
+    return tagId, t.value
+
+
+def streamTree(payload, **args):
+    """plain() of the stream reader's tree: what every other decoder should give."""
+    return plain(nbtreader.readNBT(io.BytesIO(payload), **args))
+
+
+def project(tree, paths):
+    """A plain() tree cut down to the tag paths (split into parts) a selective read should keep."""
+    if any(not parts for parts in paths):
+        return tree
+    tagId, value = tree
+    if tagId == nbtreader.TAG_COMPOUND:
+        children = value.items()
+    elif tagId == nbtreader.TAG_LIST:
+        children = [(str(i), item) for i, item in enumerate(value)]
+    else:
+        return tree    #only containers are cut down
+    kept = []
+    for name, child in children:
+        wanted = [parts[1:] for parts in paths if parts[0] in (name, '*')]
+        if wanted:
+            kept.append((name, project(child, wanted)))
+    if tagId == nbtreader.TAG_COMPOUND:
+        return tagId, dict(kept)
+    return tagId, [child for name, child in kept]
+
+
+def unwrap(tree):
+    """A plain() tree without its tag ids: what compact mode should give."""
+    tagId, value = tree
+    if tagId == nbtreader.TAG_COMPOUND:
+        return {name: unwrap(child) for name, child in value.items()}
+    if tagId == nbtreader.TAG_LIST:
+        return [unwrap(item) for item in value]
+    return value
+
+
+def compactValues(value):
+    """Compact mode's value with its arrays (memoryviews, array('i')s, NumPy arrays) as lists."""
+    if isinstance(value, dict):
+        return {name: compactValues(child) for name, child in value.items()}
+    if isinstance(value, list):
+        return [compactValues(item) for item in value]
+    if isinstance(value, (str, int, float)):
+        return value
+    return [int(n) for n in value]
+
+
+def streamEvents(blocks):
+    return [(event, name, tagId, list(value) if event == nbtreader.EVENT_ARRAY else value)
+        for event, name, tagId, value in nbtreader.NBTEventReader(blocks)]
+
+
+def sections(root):
+    return [(s.value['Y'].value, bytes(s.value['Blocks'].value)) for s in root.value['Level'].value['Sections'].value]
+
+
+class ChunkLayoutTest(unittest.TestCase):
+
+    def testSampleWithoutSections(self):
+        for emptyItemId in (nbtreader.TAG_END, nbtreader.TAG_COMPOUND):
+            layout = nbtreader.ChunkLayout(chunk(0, [], emptyItemId), SELECT)
+            for data in (chunk(0, [], emptyItemId), chunk(1, [0, 1, 3]), chunk(2, [2])):
+                self.assertEqual(sections(layout.decode(data)), sections(nbtreader.readNBTBuffer(data, select=SELECT)))
+            self.assertEqual(layout.fallbacks, 0)
+            #the sections' layout was learned from the first chunk that had any
+            levelPlan = layout.plan.steps[0][4]
+            itemPlans = [step[4] for step in levelPlan.steps if step[2] == 'Sections'][0]
+            self.assertTrue(itemPlans and all(isinstance(plan, nbtreader._FixedCompoundPlan) for plan in itemPlans))
+
+
+class BufferReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.payload = everyTag()
+
+    def testMatchesStream(self):
+        for data in (self.payload, bytearray(self.payload), memoryview(self.payload)):
+            root = nbtreader.readNBTBuffer(data)
+            self.assertEqual(root.name, 'root')
+            self.assertEqual(plain(root), streamTree(self.payload))
+        self.assertIsInstance(root.value['bytes'].value, memoryview)    #a slice of the payload, not a copy
+        self.assertEqual([child.name for child in root.value.values()], list(root.value))
+
+    def testNestedLists(self):
+        root = nbtreader.readNBTBuffer(self.payload).value
+        self.assertEqual(plain(root['matrix']), streamTree(self.payload)[1]['matrix'])
+        self.assertEqual([[n.value for n in row.value] for row in root['matrix'].value], [[2, 7, -1], [1, 5], []])
+        self.assertEqual([[item.value['s'].value for item in group.value] for group in root['groups'].value],
+            [['item 3', 'item 4'], ['item 5']])
+
+    def testTruncated(self):
+        with self.assertRaises(struct.error):
+            nbtreader.readNBTBuffer(self.payload[:-5])
+
+
+class LazyReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.payload = everyTag()
+
+    def testMatchesStream(self):
+        root = nbtreader.readNBTBuffer(self.payload, lazy=True)
+        self.assertEqual(root.name, 'root')
+        self.assertEqual(plain(root), streamTree(self.payload))
+
+    def testDecodedOnAccess(self):
+        root = nbtreader.readNBTBuffer(self.payload, lazy=True).value
+        self.assertIsInstance(root, nbtreader.LazyCompoundValue)
+        self.assertEqual(root._decoded, {})
+        self.assertEqual(root.tagType('groups'), nbtreader.TAG_LIST)
+        start, end = root.byteRange('longs')
+        self.assertEqual(bytes(self.payload[start:end]), struct.pack('>i', 334) + struct.pack('>334q', *range(-500, 500, 3)))
+        self.assertEqual(root._decoded, {})    #indexed, not decoded
+        nested = root['nested']
+        self.assertEqual(list(root._decoded), ['nested'])
+        self.assertIs(root['nested'], nested)
+        self.assertEqual(nested.name, 'nested')
+        self.assertEqual(plain(nested), streamTree(self.payload)[1]['nested'])
+        self.assertIsNone(root.get('missing'))
+        self.assertNotIn('missing', root)
+        with self.assertRaises(KeyError):
+            root['missing']
+        self.assertEqual(list(root._decoded), ['nested'])
+
+    def testTruncated(self):
+        #children are indexed when the compound is read, so a short payload fails then, not on access
+        with self.assertRaises(struct.error):
+            nbtreader.readNBTBuffer(self.payload[:-5], lazy=True)
+
+
+class SelectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.payload = everyTag()
+        self.tree = streamTree(self.payload)
+
+    def assertSelects(self, paths):
+        expected = project(self.tree, [[part for part in path.split('/') if part] for path in paths])
+        for select in (paths, nbtreader.compileSelect(paths)):
+            root = nbtreader.readNBTBuffer(self.payload, select=select)
+            self.assertEqual(root.name, 'root')
+            self.assertEqual(plain(root), expected)
+            self.assertEqual(streamTree(self.payload, select=select), expected)
+        return expected[1]
+
+    def testPaths(self):
+        self.assertEqual(self.assertSelects(['int', 'nested/deeper']),
+            {'int': (nbtreader.TAG_INT, 1 << 30), 'nested': self.tree[1]['nested']})
+        self.assertEqual(self.assertSelects(['missing', 'nested/missing']), {'nested': (nbtreader.TAG_COMPOUND, {})})
+        self.assertEqual(self.assertSelects(['']), self.tree[1])
+        self.assertEqual(self.assertSelects(['longs', 'longs/ignored', 'matrix']).keys(), {'longs', 'matrix'})
+
+    def testWildcards(self):
+        items = self.assertSelects(['items/*/s'])['items'][1]
+        self.assertEqual(items, [(nbtreader.TAG_COMPOUND, {'s': (nbtreader.TAG_STRING, 'item %d' % i)}) for i in range(3)])
+        #'*' at the top takes every child, cut down below it where it's a container
+        top = self.assertSelects(['*/deeper/b'])
+        self.assertEqual(top.keys(), self.tree[1].keys())
+        self.assertEqual(top['nested'], self.tree[1]['nested'])
+        self.assertEqual((top['items'], top['string']), ((nbtreader.TAG_LIST, []), self.tree[1]['string']))
+        self.assertSelects(['groups/*/*/n', 'groups/1/0/l', '*/*/s'])
+
+    def testListIndices(self):
+        groups = self.assertSelects(['groups/0/1/s', 'matrix/1', 'matrix/7'])
+        self.assertEqual(groups['groups'], (nbtreader.TAG_LIST, [(nbtreader.TAG_LIST, [(nbtreader.TAG_COMPOUND,
+            {'s': (nbtreader.TAG_STRING, 'item 4')})])]))
+        self.assertEqual(groups['matrix'], (nbtreader.TAG_LIST, [self.tree[1]['matrix'][1][1]]))
+        #an index and a wildcard on the same list: the indexed item gets both selections
+        items = self.assertSelects(['items/*/n', 'items/2/s'])['items'][1]
+        self.assertEqual([sorted(item[1]) for item in items], [['n'], ['n'], ['n', 's']])
+
+    def testNames(self):
+        root = nbtreader.readNBTBuffer(self.payload, select=['nested/deeper/b', 'items/0'])
+        self.assertEqual(root.value['nested'].value['deeper'].value['b'].name, 'b')
+        self.assertEqual(root.value['items'].name, 'items')
+
+
+class CompactReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.payload = everyTag()
+
+    def testMatchesStream(self):
+        root = nbtreader.readNBTBuffer(self.payload, compact=True)
+        self.assertEqual(compactValues(root), unwrap(streamTree(self.payload)))
+        self.assertEqual(compactValues(nbtreader.readNBTBuffer(self.payload, compact=True, lazy=True)), compactValues(root))    #lazy is ignored
+        self.assertIsInstance(root['bytes'], memoryview)
+        self.assertEqual(root['ints'].typecode, nbtreader._INT32_CODE)
+        if nbtreader.npy is not None:
+            self.assertEqual(root['longs'].dtype, nbtreader.npy.dtype('>i8'))
+        self.assertEqual(root['matrix'], [[2, 7, -1], [1, 5], []])
+
+    def testSelect(self):
+        paths = ['groups/*/0', 'items/1/s', 'nested']
+        expected = unwrap(project(streamTree(self.payload), [path.split('/') for path in paths]))
+        self.assertEqual(compactValues(nbtreader.readNBTBuffer(self.payload, select=paths, compact=True)), expected)
+        self.assertEqual(expected['items'], [{'s': 'item 1'}])
+
+
+class LongArrayTest(unittest.TestCase):
+
+    LONGS = [-2 ** 63, 2 ** 63 - 1, 0, -1, 1 << 40, -(1 << 33) + 5]
+
+    def setUp(self):
+        self.raw = raw = struct.pack('>%dq' % len(self.LONGS), *self.LONGS)
+        self.payload = tag(nbtreader.TAG_COMPOUND, 'root', tag(nbtreader.TAG_LONG_ARRAY, 'longs', struct.pack('>i', len(self.LONGS)) + raw)
+            + tag(nbtreader.TAG_LONG_ARRAY, 'none', struct.pack('>i', 0))
+            + tag(nbtreader.TAG_LIST, 'list', bytes((nbtreader.TAG_LONG_ARRAY,)) + struct.pack('>ii', 2, 1) + raw[:8] + struct.pack('>i', 0))
+            + b'\0')
+
+    def longArrays(self):
+        """The 'longs' tag from each of the decoders that build tags."""
+        return [nbtreader.readNBT(io.BytesIO(self.payload)).value['longs'], nbtreader.readNBTBuffer(self.payload).value['longs'],
+            nbtreader.readNBTBuffer(self.payload, lazy=True).value['longs'],
+            nbtreader.readNBTBuffer(self.payload, select=['longs']).value['longs']]
+
+    def testMatchesStream(self):
+        self.assertEqual(plain(nbtreader.readNBTBuffer(self.payload)), streamTree(self.payload))
+        self.assertEqual(unwrap(streamTree(self.payload)), {'longs': self.LONGS, 'none': [], 'list': [self.LONGS[:1], []]})
+        for longs in self.longArrays():
+            self.assertIsInstance(longs, nbtreader.TAG_Long_Array)
+            self.assertEqual(bytes(longs.raw), self.raw)
+            self.assertEqual(len(longs), len(self.LONGS))
+            self.assertEqual([int(n) for n in longs.value], self.LONGS)
+            self.assertEqual(repr(longs), "[6 longs array]")
+
+    def testToNumpy(self):
+        if nbtreader.npy is None:
+            self.skipTest("NumPy is not available")
+        for longs in self.longArrays():
+            values = longs.toNumpy()
+            self.assertEqual(values.dtype, nbtreader.npy.dtype('>i8'))
+            self.assertEqual(values.tolist(), self.LONGS)
+            self.assertFalse(values.flags.writeable)    #a view over raw, not a copy
+            self.assertIsNone(longs._value)    #and .value was never decoded for it
+        empty = nbtreader.readNBTBuffer(self.payload).value['none']
+        self.assertEqual((len(empty), empty.toNumpy().tolist(), list(empty.value)), (0, [], []))
+
+    def testWithoutNumpy(self):
+        npy = nbtreader.npy
+        nbtreader.npy = None
+        try:
+            longs = nbtreader.readNBTBuffer(self.payload).value['longs']
+            self.assertEqual(longs.value.tolist(), self.LONGS)    #an array('q')
+            self.assertEqual(longs.value.typecode, 'q')
+            with self.assertRaises(ImportError):
+                longs.toNumpy()
+        finally:
+            nbtreader.npy = npy
+
+    def testTruncated(self):
+        for reader in (lambda data: nbtreader.readNBT(io.BytesIO(data)), nbtreader.readNBTBuffer):
+            with self.assertRaises(struct.error):
+                reader(self.payload[:len(self.payload) // 2])
+
+
+class InflateNBTTest(unittest.TestCase):
+
+    def setUp(self):
+        self.payload = everyTag()
+
+    def compressed(self):
+        """The payload as level.dat (gzip), as zlib with headers of several levels and window sizes, and uncompressed."""
+        forms = {'gzip': gzip.compress(self.payload), 'raw': self.payload}
+        for level in (1, 6, 9):
+            forms['zlib %d' % level] = zlib.compress(self.payload, level)
+        small = zlib.compressobj(6, zlib.DEFLATED, 9)
+        forms['zlib window 9'] = small.compress(self.payload) + small.flush()
+        self.assertEqual(len({data[:2] for data in forms.values()}), len(forms))
+        return forms
+
+    def testMagic(self):
+        for form, data in self.compressed().items():
+            self.assertEqual(nbtreader.inflateNBT(data), self.payload, form)
+            self.assertEqual(nbtreader.inflateNBT(bytearray(data)), self.payload, form)
+
+    def testReadNBTFile(self):
+        directory = tempfile.mkdtemp()
+        try:
+            for form, data in self.compressed().items():
+                path = os.path.join(directory, form + '.dat')
+                with open(path, 'wb') as f:
+                    f.write(data)
+                self.assertEqual(plain(nbtreader.readNBTFile(path)), streamTree(self.payload), form)
+                self.assertEqual(plain(nbtreader.readNBTFile(path, lazy=True)), streamTree(self.payload), form)
+                self.assertEqual(plain(nbtreader.readNBTFile(path, select=['nested'])), streamTree(self.payload, select=['nested']), form)
+        finally:
+            shutil.rmtree(directory)
+
+    def testNotNBT(self):
+        #neither magic, a zlib-like header that fails its checksum, and the empty file
+        for data in (b'PK\x03\x04 a zip', b'\x78\x9d' + zlib.compress(self.payload)[2:], b'\x08', b''):
+            with self.assertRaisesRegex(IOError, "not an NBT file"):
+                nbtreader.inflateNBT(data)
+
+    def testCorrupt(self):
+        gzipped = gzip.compress(self.payload)
+        zlibbed = zlib.compress(self.payload)
+        for data in (gzipped[:len(gzipped) // 2], zlibbed[:len(zlibbed) // 2], zlibbed[:2] + bytes(40)):
+            with self.assertRaisesRegex(IOError, "corrupt compressed NBT"):
+                nbtreader.inflateNBT(data)
+
+
+class NBTEventReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.payload = everyTag()
+        self.expected = treeEvents(nbtreader.readNBTBuffer(self.payload), 'root')
+
+    def testByteAtATime(self):
+        self.assertEqual(streamEvents(self.payload[i:i + 1] for i in range(len(self.payload))), self.expected)
+
+    def testRandomBlocks(self):
+        rng = random.Random(7)
+        for run in range(20):
+            blocks = []
+            pos = 0
+            while pos < len(self.payload):
+                size = rng.randint(1, 64) if rng.random() < 0.8 else rng.randint(1, 2000)
+                blocks.append(self.payload[pos:pos + size])
+                pos += size
+            self.assertEqual(streamEvents(blocks), self.expected)
+
+    def testZlibBlocks(self):
+        compressed = zlib.compress(self.payload)
+        for blockSize in (1, 7, 65536):
+            self.assertEqual(streamEvents(nbtreader.iterZlibBlocks(compressed, blockSize)), self.expected)
+
+    def testSkip(self):
+        #skipping 'items' and 'nested' (1 byte blocks, so skipped contents span many): their end events still come
+        reader = nbtreader.NBTEventReader(self.payload[i:i + 1] for i in range(len(self.payload)))
+        events = []
+        for event in reader:
+            if event[0] in (nbtreader.EVENT_START_LIST, nbtreader.EVENT_START_COMPOUND) and event[1] in ('items', 'nested'):
+                reader.skip()
+            events.append(event[:2])
+        expected = []
+        skipping = None
+        for event in self.expected:
+            if skipping is None:
+                expected.append(event[:2])
+                if event[1] in ('items', 'nested') and event[0] != nbtreader.EVENT_END:
+                    skipping = event[1]
+            elif event[0] == nbtreader.EVENT_END and event[1] == skipping:
+                expected.append(event[:2])
+                skipping = None
+        self.assertEqual(events, expected)
+
+    def testSkipMisuse(self):
+        #skip() anywhere but right after a start event raises, and doesn't skip the next container
+        reader = nbtreader.NBTEventReader([self.payload])
+        events = []
+        for event in reader:
+            if event[0] in (nbtreader.EVENT_SCALAR, nbtreader.EVENT_ARRAY, nbtreader.EVENT_END):
+                with self.assertRaises(RuntimeError):
+                    reader.skip()
+            events.append(event)
+        self.assertEqual(streamEvents([self.payload]), [(event, name, tagId, list(value) if event == nbtreader.EVENT_ARRAY else value)
+            for event, name, tagId, value in events])
+        with self.assertRaises(RuntimeError):
+            nbtreader.NBTEventReader([self.payload]).skip()    #nothing produced yet
+
+    def testSkippedNamesNotDecoded(self):
+        #a name that isn't valid UTF-8, inside a skipped compound: skipped as bytes, never decoded
+        badName = b'\x01' + struct.pack('>h', 2) + b'\xff\xfe' + b'\x05'
+        payload = tag(nbtreader.TAG_COMPOUND, 'root', tag(nbtreader.TAG_COMPOUND, 'skipped', badName + b'\0')
+            + tag(nbtreader.TAG_INT, 'after', struct.pack('>i', 7)) + b'\0')
+        reader = nbtreader.NBTEventReader([payload])
+        events = []
+        for event in reader:
+            if event[:2] == (nbtreader.EVENT_START_COMPOUND, 'skipped'):
+                reader.skip()
+            events.append(event[:2] + (event[3],))
+        self.assertEqual(events, [(nbtreader.EVENT_START_COMPOUND, 'root', None), (nbtreader.EVENT_START_COMPOUND, 'skipped', None),
+            (nbtreader.EVENT_END, 'skipped', None), (nbtreader.EVENT_SCALAR, 'after', 7), (nbtreader.EVENT_END, 'root', None)])
+        with self.assertRaises(UnicodeDecodeError):
+            streamEvents([payload])
+
+    def testTruncated(self):
+        with self.assertRaises(struct.error):
+            streamEvents([self.payload[:-5]])
+
+
+if __name__ == '__main__':
+    unittest.main()
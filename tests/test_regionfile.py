@@ -0,0 +1,220 @@
+# Tests for regionfile: coalesced chunk reads, threaded inflating, the persistent region header index
+# (RegionHeaderCache), and pipeline stages.
+# Run outside Blender, from the addon directory: python -m unittest discover tests
+
+import contextlib, io, os, random, shutil, sys, tempfile, threading, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import regionfile
+from regionfixtures import LoggingStorage, writeRegion
+
+PAYLOADS = {(0, 0): b'first chunk', (1, 1): b'second chunk'}
+
+
+class ReadChunksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.world = tempfile.mkdtemp()
+        rng = random.Random(2)
+        #random (incompressible) payloads of 1, 2 and 3 sectors
+        self.payloads = {(x, 0): bytes(rng.getrandbits(8) for i in range((x % 3 + 1) * regionfile.SECTOR_BYTES - 100))
+            for x in range(6)}
+
+    def tearDown(self):
+        shutil.rmtree(self.world)
+
+    def read(self, chunks, **args):
+        """(chunks read in the order readChunks gave them, {chunk: sectors}, the (offset, sector count) of each run read)."""
+        storage = LoggingStorage(self.world)
+        with regionfile.RegionFilePool('.', storage=storage) as pool:
+            region = pool.region(0, 0)
+            single = {chunk: region.readSectors(*chunk) for chunk in chunks}
+            single = {chunk: None if sectors is None else bytes(sectors) for chunk, sectors in single.items()}
+            del storage.reads[:]
+            order = []
+            read = {}
+            for chunkX, chunkZ, sectors in region.readChunks(chunks, **args):
+                order.append((chunkX, chunkZ))
+                read[(chunkX, chunkZ)] = None if sectors is None else bytes(sectors)
+        #every chunk once, the same as read one at a time
+        self.assertEqual(sorted(order), sorted(chunks))
+        self.assertEqual(read, single)
+        for chunk, sectors in read.items():
+            if sectors is not None:
+                self.assertEqual(regionfile.inflateChunk(sectors), self.payloads[chunk])
+        runs = [(offset // regionfile.SECTOR_BYTES, length // regionfile.SECTOR_BYTES) for path, offset, length in storage.reads]
+        return order, read, runs
+
+    def testGaps(self):
+        #chunks 0-2 back to back, then 2 unused sectors before 3, and 1 before 4
+        placed = writeRegion(os.path.join(self.world, 'r.0.0.mca'), self.payloads, gaps={(3, 0): 2, (4, 0): 1})
+        chunks = sorted(self.payloads)
+        order, read, runs = self.read(chunks)
+        self.assertEqual(runs, [(2, 6), (10, 1), (12, 5)])    #no gaps bridged: 3, 0 and 4, 0 start runs
+        order, read, runs = self.read(chunks, gapSectors=1)
+        self.assertEqual(runs, [(2, 6), (10, 7)])    #the 1 sector gap is bridged, the 2 sector one isn't
+        order, read, runs = self.read(chunks, gapSectors=2)
+        self.assertEqual(runs, [(2, 15)])
+        self.assertEqual(order, chunks)
+        self.assertEqual(placed[(5, 0)], (14, 3))
+
+    def testMaxRun(self):
+        writeRegion(os.path.join(self.world, 'r.0.0.mca'), self.payloads)
+        chunks = sorted(self.payloads)
+        #sector counts 1, 2, 3, 1, 2, 3 from sector 2
+        order, read, runs = self.read(chunks, maxRunSectors=3)
+        self.assertEqual(runs, [(2, 3), (5, 3), (8, 3), (11, 3)])
+        order, read, runs = self.read(chunks, maxRunSectors=2)
+        self.assertEqual(runs, [(2, 1), (3, 2), (5, 3), (8, 1), (9, 2), (11, 3)])    #3 sector chunks are runs of their own
+        order, read, runs = self.read(chunks, maxRunSectors=regionfile.MAX_RUN_SECTORS)
+        self.assertEqual(runs, [(2, 12)])
+
+    def testDiskOrder(self):
+        #stored in an order of their own; asked for in another, with chunks that don't exist among them
+        diskOrder = [(4, 0), (1, 0), (5, 0), (0, 0), (3, 0), (2, 0)]
+        writeRegion(os.path.join(self.world, 'r.0.0.mca'), self.payloads, order=diskOrder, gaps={(0, 0): 3})
+        chunks = [(7, 0), (0, 0), (2, 0), (1, 0), (8, 8), (3, 0), (5, 0), (4, 0)]
+        order, read, runs = self.read(chunks)
+        self.assertEqual(order, diskOrder + [(7, 0), (8, 8)])    #in sector order, then the missing ones
+        self.assertIsNone(read[(7, 0)])
+        self.assertEqual(len(runs), 2)
+        order, read, runs = self.read(chunks, gapSectors=3)
+        self.assertEqual(len(runs), 1)
+
+
+class InflateChunksTest(unittest.TestCase):
+
+    def testMatchesSerial(self):
+        world = tempfile.mkdtemp()
+        try:
+            rng = random.Random(4)
+            payloads = {(x, z): bytes(rng.choice(b'abc') for i in range(rng.randint(10, 50000)))
+                for z in range(4) for x in range(8)}
+            compression = {chunk: rng.choice((regionfile.COMPRESSION_ZLIB, regionfile.COMPRESSION_GZIP, regionfile.COMPRESSION_NONE))
+                for chunk in payloads}
+            self.assertEqual(len(set(compression.values())), 3)
+            writeRegion(os.path.join(world, 'r.0.0.mca'), payloads, compression=compression)
+            #generated chunks, chunks never generated, and chunks of a region that doesn't exist
+            chunks = list(payloads) + [(x, 5) for x in range(8)] + [(-1, 0), (40, 3)]
+            with regionfile.RegionFilePool(world) as pool:
+                serial = list(regionfile.inflateChunks(pool.readChunks(chunks), 1))
+                threaded = list(regionfile.inflateChunks(pool.readChunks(chunks), 4, maxPending=3))
+        finally:
+            shutil.rmtree(world)
+        self.assertEqual(len(threaded), len(chunks))
+        self.assertEqual(set(threaded), set(serial))
+        self.assertEqual({(x, z): payload for x, z, payload in threaded}, {chunk: payloads.get(chunk) for chunk in chunks})
+
+
+class RegionHeaderCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.world = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.world, 'region'))
+        self.regionPath = os.path.join(self.world, 'region', 'r.0.0.mca')
+        writeRegion(self.regionPath, PAYLOADS, {(0, 0): 1000, (1, 1): 2000})
+        self.cachePath = regionfile.headerCachePath(os.path.join(self.world, 'region'), os.path.join(self.world, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.world)
+
+    def timestamps(self):
+        """Reads the region through a pool on the header cache at cachePath: ((timestamps of chunks 0, 0 and 1, 1), reads made)."""
+        storage = LoggingStorage(self.world)
+        pool = regionfile.RegionFilePool('region', storage=storage, headerCache=regionfile.RegionHeaderCache(self.cachePath))
+        timestamps = (pool.chunkTimestamp(0, 0), pool.chunkTimestamp(1, 1))
+        pool.close()
+        return timestamps, storage.reads
+
+    def testHit(self):
+        header = ('region/r.0.0.mca', 0, regionfile.HEADER_BYTES)
+        self.assertEqual(self.timestamps(), ((1000, 2000), [header]))
+        self.assertTrue(os.path.exists(self.cachePath))
+        self.assertEqual(self.timestamps(), ((1000, 2000), []))    #from the cache, without reading the file
+
+    def testChangedFile(self):
+        header = ('region/r.0.0.mca', 0, regionfile.HEADER_BYTES)
+        self.timestamps()
+        st = os.stat(self.regionPath)
+        #rewritten, same size: only the mtime tells
+        writeRegion(self.regionPath, PAYLOADS, {(0, 0): 1500, (1, 1): 2000})
+        os.utime(self.regionPath, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+        self.assertEqual(self.timestamps(), ((1500, 2000), [header]))
+        self.assertEqual(self.timestamps(), ((1500, 2000), []))
+        #grown, same mtime: only the size tells
+        st = os.stat(self.regionPath)
+        writeRegion(self.regionPath, {**PAYLOADS, (2, 1): b'third chunk'}, {(0, 0): 1500, (1, 1): 2500})
+        os.utime(self.regionPath, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertNotEqual(os.path.getsize(self.regionPath), st.st_size)
+        self.assertEqual(self.timestamps(), ((1500, 2500), [header]))
+
+    def testCorruptCache(self):
+        self.timestamps()
+        with open(self.cachePath, 'rb') as f:
+            data = f.read()
+        header = ('region/r.0.0.mca', 0, regionfile.HEADER_BYTES)
+        for corrupt in (b'not an index', data[:len(data) - 100], data[:len(data) - regionfile.HEADER_BYTES - 3]):
+            with open(self.cachePath, 'wb') as f:
+                f.write(corrupt)
+            self.assertEqual(regionfile.RegionHeaderCache(self.cachePath).entries, {})
+            self.assertEqual(self.timestamps(), ((1000, 2000), [header]))    #read again, and the cache rewritten
+        self.assertEqual(self.timestamps(), ((1000, 2000), []))
+
+    def testUnwritableCache(self):
+        #the cache's directory is a file: it can't be read or written, so every import reads the header
+        with open(os.path.join(self.world, 'cache'), 'wb') as f:
+            f.write(b'in the way')
+        header = ('region/r.0.0.mca', 0, regionfile.HEADER_BYTES)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(self.timestamps(), ((1000, 2000), [header]))
+            self.assertEqual(self.timestamps(), ((1000, 2000), [header]))
+        self.assertIn("Couldn't save region index", output.getvalue())    #reported, not raised
+
+    def testCachePath(self):
+        cacheRoot = os.path.join(self.world, 'cache')
+        self.assertEqual(regionfile.headerCachePath(os.path.join(self.world, 'region'), cacheRoot), self.cachePath)
+        self.assertNotEqual(regionfile.headerCachePath(os.path.join(self.world, 'DIM-1', 'region'), cacheRoot), self.cachePath)
+        self.assertTrue(self.cachePath.startswith(cacheRoot + os.sep))
+
+
+class PipelineStageTest(unittest.TestCase):
+
+    def testOrder(self):
+        self.assertEqual(list(regionfile.pipelineStage(iter(range(1000)), depth=3)), list(range(1000)))
+        self.assertEqual(list(regionfile.pipelineStage(iter([]))), [])
+
+    def testException(self):
+        def items():
+            yield 1
+            yield 2
+            raise ValueError("bad chunk")
+        stage = regionfile.pipelineStage(items(), depth=1)
+        self.assertEqual([next(stage), next(stage)], [1, 2])
+        with self.assertRaisesRegex(ValueError, "bad chunk"):
+            next(stage)
+
+    def testCloseEarly(self):
+        #the producer is endless and blocked on the full queue: closing stops its thread, and closes it
+        closed = threading.Event()
+        def items():
+            try:
+                n = 0
+                while True:
+                    yield n
+                    n += 1
+            finally:
+                closed.set()
+        stage = regionfile.pipelineStage(items(), depth=2)
+        self.assertEqual([next(stage) for i in range(3)], [0, 1, 2])
+        closer = threading.Thread(target=stage.close, daemon=True)
+        closer.start()
+        closer.join(10)
+        self.assertFalse(closer.is_alive(), "close() deadlocked")
+        self.assertTrue(closed.is_set())
+        self.assertFalse([thread for thread in threading.enumerate() if thread.name == 'pipeline stage'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+# Tests for voxelmesh: surface scans, and rebuilding just what an update changed.
+# Run outside Blender, from the addon directory: python -m unittest discover tests
+
+import os, sys, unittest
+
+import numpy as npy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import voxelmesh
+
+STONE = 1
+GROUPS = ({8, 9, -8, -9}, {10, 11, -10, -11}, {1, -1, 3, -3})
+Y_MIN, Y_MAX = 0, 6
+CHUNKS = 3    #chunks per side of the buffers
+
+
+def solidWorld():
+    blockBuffer = npy.zeros((CHUNKS * 16, 256, CHUNKS * 16))
+    blockBuffer[:, Y_MIN:Y_MAX + 1, :] = STONE
+    return blockBuffer
+
+
+def mesh(blockBuffer, rows):
+    """Vertices (as createBlock places them, at (z, x, y)) of the blocks a scan of rows keeps."""
+    return [(z, x, y) for x, y, z, blockID in voxelmesh.surfaceBlocks(blockBuffer, rows, Y_MIN, Y_MAX, GROUPS)]
+
+
+def fullRows(blockBuffer):
+    return [(z, range(len(blockBuffer))) for z in range(len(blockBuffer[0][0]))]
+
+
+class UpdateTest(unittest.TestCase):
+
+    def update(self, oldMesh, blockBuffer, changedColumns):
+        """The mesh of an update: oldMesh patched with a scan of what changedColumns make stale."""
+        mask = voxelmesh.rebuildMask(changedColumns, CHUNKS)
+        kept = voxelmesh.keptVerts(npy.array(oldMesh, dtype=float).reshape(-1, 3), mask)
+        return sorted([tuple(int(c) for c in v) for v in kept] + mesh(blockBuffer, voxelmesh.maskRows(mask)))
+
+    def testBorderBlockRemoved(self):
+        oldMesh = mesh(solidWorld(), fullRows(solidWorld()))
+        #dig out the block on the west border of the centre chunk: its neighbour in the chunk
+        #to the west, hollowed until now, becomes visible
+        blockBuffer = solidWorld()
+        blockBuffer[16, 3, 20] = 0
+        patched = self.update(oldMesh, blockBuffer, [(1, 1)])
+        self.assertIn((20, 15, 3), patched)
+        self.assertNotIn((20, 15, 3), oldMesh)
+        full = blockBuffer.copy()
+        self.assertEqual(patched, sorted(mesh(full, fullRows(full))))
+
+    def testBorderBlockFilled(self):
+        hole = solidWorld()
+        hole[31, 3, 40] = 0    #on the east border of chunk 1, 2
+        oldMesh = mesh(hole, fullRows(hole))
+        self.assertIn((40, 32, 3), oldMesh)    #the neighbour in chunk 2, 2 shows
+        patched = self.update(oldMesh, solidWorld(), [(1, 2)])
+        self.assertNotIn((40, 32, 3), patched)
+        self.assertEqual(patched, sorted(mesh(solidWorld(), fullRows(solidWorld()))))
+
+    def testMask(self):
+        mask = voxelmesh.rebuildMask([(1, 1)], CHUNKS)
+        self.assertEqual(int(mask.sum()), 16 * 16 + 4 * 16)
+        self.assertTrue(mask[15, 20] and mask[32, 20] and mask[20, 15] and mask[20, 32])
+        self.assertFalse(mask[14, 20] or mask[15, 15] or mask[33, 20])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+# Tests for worldstorage: a world read over HTTP (from a local server) matches it read from disk.
+# Run outside Blender, from the addon directory: python -m unittest discover tests
+
+import email.utils, http.server, io, os, random, re, shutil, sys, tempfile, threading, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import regionfile, worldstorage
+from regionfixtures import LoggingStorage, writeRegion
+
+CHUNKS = {(0, 0): 3000, (1, 0): 9000, (5, 7): 20000, (31, 31): 100}    #chunk: size (random data: about as big compressed)
+
+
+def randomChunks():
+    rng = random.Random(1)
+    return {chunk: bytes(rng.getrandbits(8) for i in range(size)) for chunk, size in sorted(CHUNKS.items())}
+
+
+class RangeHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves files with Range support (single byte ranges), like a web server or object store would."""
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        match = re.match(r'bytes=(\d+)-(\d+)$', self.headers.get('Range', ''))
+        if os.path.isdir(path) or match is None or not os.path.exists(path):
+            return super().send_head()
+        size = os.path.getsize(path)
+        start, end = int(match.group(1)), min(int(match.group(2)), size - 1)
+        if start >= size:
+            self.send_error(416)
+            return None
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        self.send_response(206)
+        self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, size))
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Last-Modified', email.utils.formatdate(os.path.getmtime(path), usegmt=True))
+        self.end_headers()
+        return io.BytesIO(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class PlainHandler(http.server.SimpleHTTPRequestHandler):
+    """Ignores Range headers: always the whole file, with a 200."""
+
+    def log_message(self, *args):
+        pass
+
+
+class NoLengthHandler(http.server.SimpleHTTPRequestHandler):
+    """Answers HEAD requests without a Content-Length."""
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTPStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.world = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.world, 'region'))
+        writeRegion(os.path.join(self.world, 'region', 'r.0.0.mca'), randomChunks())
+        with open(os.path.join(self.world, 'level.dat'), 'wb') as f:
+            f.write(b'level')
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(self.world)
+
+    def serve(self, handler):
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+            lambda *args: handler(*args, directory=self.world))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.servers.append(server)
+        return 'http://127.0.0.1:%d/' % server.server_address[1]
+
+    def testMatchesLocal(self):
+        local = worldstorage.LocalStorage(self.world)
+        with worldstorage.HTTPStorage(self.serve(RangeHandler), blockBytes=4096, cacheBytes=4 * 4096) as remote:
+            self.assertEqual(remote.read('level.dat'), local.read('level.dat'))
+            self.assertEqual(remote.stat('region/r.0.0.mca')[0], local.stat('region/r.0.0.mca')[0])
+            self.assertEqual(remote.read('region/r.0.0.mca', 0, regionfile.HEADER_BYTES),
+                local.read('region/r.0.0.mca', 0, regionfile.HEADER_BYTES))
+            localPool = regionfile.RegionFilePool('region', storage=local)
+            remotePool = regionfile.RegionFilePool('region', storage=remote)
+            self.assertEqual(remotePool.listRegions(), {(0, 0)})
+            everything = [(x, z) for z in range(32) for x in range(32)]
+            self.assertEqual(remotePool.generatedChunks(everything), localPool.generatedChunks(everything))
+            for chunkX, chunkZ in CHUNKS:
+                self.assertEqual(remotePool.chunkTimestamp(chunkX, chunkZ), localPool.chunkTimestamp(chunkX, chunkZ))
+                self.assertEqual(bytes(remotePool.readSectors(chunkX, chunkZ)), bytes(localPool.readSectors(chunkX, chunkZ)))
+                self.assertEqual(len(regionfile.inflateChunk(remotePool.readSectors(chunkX, chunkZ))), CHUNKS[(chunkX, chunkZ)])
+            read = {(x, z): bytes(sectors) for x, z, sectors in remotePool.readChunks(list(CHUNKS))}
+            self.assertEqual(read, {chunk: bytes(localPool.readSectors(*chunk)) for chunk in CHUNKS})
+            remotePool.close()
+            localPool.close()
+
+    def testNoRangeSupport(self):
+        with worldstorage.HTTPStorage(self.serve(PlainHandler), blockBytes=4096) as remote:
+            self.assertEqual(remote.read('level.dat'), b'level')    #small enough to come whole
+            with self.assertRaises(OSError):
+                remote.read('region/r.0.0.mca', regionfile.HEADER_BYTES, 100)
+
+    def testNoContentLength(self):
+        with worldstorage.HTTPStorage(self.serve(NoLengthHandler)) as remote:
+            with self.assertRaises(OSError):
+                remote.stat('level.dat')
+            with self.assertRaises(OSError):
+                remote.read('level.dat')
+
+
+class HeaderPrefetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.world = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.world, 'region'))
+        writeRegion(os.path.join(self.world, 'region', 'r.0.0.mca'), randomChunks())
+
+    def tearDown(self):
+        shutil.rmtree(self.world)
+
+    def testCachedHeadersNotPrefetched(self):
+        cachePath = os.path.join(self.world, 'cache', 'region.idx')
+        everything = [(x, z) for z in range(32) for x in range(32)]
+        results = []
+        for run in range(2):
+            storage = LoggingStorage(self.world)
+            pool = regionfile.RegionFilePool('region', storage=storage, headerCache=regionfile.RegionHeaderCache(cachePath))
+            results.append(pool.generatedChunks(everything))
+            pool.close()
+            if run == 0:
+                self.assertEqual(storage.prefetches, [('region/r.0.0.mca', 0, regionfile.HEADER_BYTES)])
+            else:    #the header came from the cache: neither prefetched nor read
+                self.assertEqual(storage.prefetches, [])
+                self.assertEqual(storage.reads, [])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(sorted(results[0]), sorted(CHUNKS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# Voxel mesh module.
+# Turning the [x][y][z] voxel buffers of the new voxel approach into block positions:
+# the surface scan (hollowing away blocks surrounded by their own kind) and, for
+# updates of an earlier import, which blocks have to be rescanned and which old mesh
+# vertices replaced. No bpy in here.
+#
+# Hollowing looks at a block's six face neighbours, so it reaches one block into the
+# chunks either side of a chunk border: when a chunk changes, the facing border rows
+# of its neighbours have to be rescanned along with it (see rebuildMask).
+
+import numpy as npy
+
+
+def blockSurroundedBy(blockAry,blockGroupAry,x,y,z):
+    bl_u = blockAry[x][y][z+1]
+    if (bl_u in blockGroupAry):
+        bl_d = blockAry[x][y][z-1]
+        if (bl_d in blockGroupAry):
+            bl_l = blockAry[x-1][y][z]
+            if (bl_l in blockGroupAry):
+                bl_r = blockAry[x+1][y][z]
+                if (bl_r in blockGroupAry):
+                    bl_f = blockAry[x][y-1][z]
+                    if (bl_f in blockGroupAry):
+                        bl_b = blockAry[x][y+1][z]
+                        if (bl_b in blockGroupAry):
+                            return True
+    return False
+
+
+def surfaceBlocks(blockBuffer, rows, yMin, yMax, groups, hollow=True, hideSides=False, reporting=None):
+    """Yields (x, y, z, blockID) for each block to create in rows ((z, xs) pairs) between yMin and yMax.
+With hollow, a block in one of groups (sets of block ids, tried in order) that is surrounded by blocks
+of that group is dropped, and marked so in blockBuffer (negated, which the groups include).
+With hideSides, blocks on the sides and bottom of the buffer are left out.
+Dropped blocks are counted in reporting['blocksdropped'], if given."""
+    xMax = len(blockBuffer) - 1
+    zMax = len(blockBuffer[0][0]) - 1
+    for z, xs in rows:
+        for y in range(yMin, yMax+1):
+            for x in xs:
+                blockID = blockBuffer[x][y][z]
+                skipBlock = False
+                if hollow and 0 < x < xMax and yMin < y < yMax and 0 < z < zMax:
+                    for group in groups:
+                        if blockID in group:
+                            if blockSurroundedBy(blockBuffer, group, x, y, z):
+                                blockBuffer[x][y][z] = -1*blockID
+                                if reporting is not None:
+                                    reporting['blocksdropped'] += 1
+                                skipBlock = True
+                            break
+                if hideSides and (x == 0 or x == xMax or y == yMin or y == yMax or z == 0 or z == zMax):
+                    skipBlock = True
+                if not skipBlock and blockID > 0:
+                    yield x, y, z, blockID
+
+
+def rebuildMask(changedColumns, chunksPerSide):
+    """[x][z] block mask of what an update has to rescan: the changed chunk columns (x, z chunk
+indexes into the voxel buffers), and the blocks of neighbouring chunks that face them."""
+    changed = npy.zeros((chunksPerSide, chunksPerSide), dtype=bool)
+    for ix, iz in changedColumns:
+        changed[ix, iz] = True
+    blocks = npy.repeat(npy.repeat(changed, 16, axis=0), 16, axis=1)
+    mask = blocks.copy()
+    mask[1:, :] |= blocks[:-1, :]
+    mask[:-1, :] |= blocks[1:, :]
+    mask[:, 1:] |= blocks[:, :-1]
+    mask[:, :-1] |= blocks[:, 1:]
+    return mask
+
+
+def maskRows(mask):
+    """The (z, xs) rows of the blocks set in a [x][z] mask, for surfaceBlocks."""
+    return [(z, npy.flatnonzero(mask[:, z]).tolist()) for z in range(mask.shape[1]) if mask[:, z].any()]
+
+
+def keptVerts(coords, mask):
+    """The rows of coords (an (n, 3) array of mesh vertices, at voxel buffer (z, x, y) as
+createBlock places them) outside a [x][z] mask: what an update keeps of an earlier mesh."""
+    x = npy.clip(npy.floor(coords[:, 1]).astype(int), 0, mask.shape[0] - 1)
+    z = npy.clip(npy.floor(coords[:, 0]).astype(int), 0, mask.shape[1] - 1)
+    return coords[~mask[x, z]]
@@ -0,0 +1,300 @@
+# World storage module.
+# Where a world's files come from. The region readers get at region files through a
+# WorldStorage, by '/'-separated paths relative to the world directory, so a world
+# doesn't have to be on a local disk: HTTPStorage reads one from a web server or object
+# store with HTTP range requests, fetching only the header and chunk sectors an import
+# needs rather than whole multi-GB region sets. No bpy in here.
+#
+# HTTPStorage fetches in fixed-size blocks kept in a small LRU block cache. prefetch()
+# fetches many ranges (eg. every region header of a load, or the next few coalesced
+# chunk runs of a region) as concurrent requests on a thread pool, a bounded number
+# in flight at once; read() then assembles what it needs from the cache.
+
+import os, re, threading
+import urllib.error, urllib.parse, urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+
+BLOCK_BYTES = 64 * 1024    #HTTPStorage fetch and cache unit
+CACHE_BYTES = 32 * 1024 * 1024    #HTTPStorage block cache size
+CONNECTIONS = 8    #HTTPStorage requests in flight at once
+
+_HREF = re.compile(r'href="([^"?#]+)"', re.IGNORECASE)
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+def joinPath(*parts):
+    """Joins storage path parts with '/' (empty parts are skipped)."""
+    return '/'.join(part.strip('/') for part in parts if part and part.strip('/'))
+
+
+class WorldStorage:
+    """Read access to the files of one world, by '/'-separated paths relative to it. Subclasses
+provide location, stat, list and read; open, exists, prefetch and close have defaults."""
+
+    def location(self, path=''):
+        """A string identifying path, unique across storages (for cache keys)."""
+        raise NotImplementedError
+
+    def localPath(self, path=''):
+        """The local filesystem path of path, or None if it isn't on a local filesystem."""
+        return None
+
+    def stat(self, path):
+        """(size, modification time in ns or None if unknown) of a file. Raises FileNotFoundError."""
+        raise NotImplementedError
+
+    def list(self, path=''):
+        """Names of the entries of a directory. Raises FileNotFoundError."""
+        raise NotImplementedError
+
+    def read(self, path, offset=0, length=None):
+        """Bytes from offset in a file: length of them, or up to the end (fewer past the end)."""
+        raise NotImplementedError
+
+    def open(self, path):
+        """A read-only binary file object for path (seek, tell, read, close). Raises FileNotFoundError."""
+        self.stat(path)
+        return _StorageFile(self, path)
+
+    def exists(self, path):
+        try:
+            self.stat(path)
+            return True
+        except FileNotFoundError:
+            pass
+        try:
+            self.list(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def prefetch(self, requests):
+        """Hint that the (path, offset, length) ranges in requests will be read soon."""
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _StorageFile:
+    """File object over WorldStorage.read."""
+
+    def __init__(self, storage, path):
+        self.storage = storage
+        self.path = path
+        self.pos = 0
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self.pos
+        elif whence == 2:
+            pos += self.storage.stat(self.path)[0]
+        self.pos = pos
+        return pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        data = self.storage.read(self.path, self.pos, None if size < 0 else size)
+        self.pos += len(data)
+        return data
+
+    def close(self):
+        pass
+
+
+class LocalStorage(WorldStorage):
+    """A world in the local directory root."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def localPath(self, path=''):
+        return os.path.join(self.root, *[part for part in path.split('/') if part])
+
+    def location(self, path=''):
+        return self.localPath(path)
+
+    def open(self, path):
+        return open(self.localPath(path), 'rb')
+
+    def stat(self, path):
+        st = os.stat(self.localPath(path))
+        return st.st_size, st.st_mtime_ns
+
+    def list(self, path=''):
+        return os.listdir(self.localPath(path))
+
+    def read(self, path, offset=0, length=None):
+        with open(self.localPath(path), 'rb') as f:
+            f.seek(offset)
+            return f.read(-1 if length is None else length)
+
+
+class HTTPStorage(WorldStorage):
+    """A world served over HTTP at baseURL (the world directory's URL). The server must honour
+Range requests: if it doesn't, reads raise OSError (except of files small enough to come whole in the
+blocks asked for). Directories are listed
+from the links of their index pages. Up to cacheBytes of blockBytes blocks are cached, and up to
+connections requests made at once."""
+
+    def __init__(self, baseURL, blockBytes=BLOCK_BYTES, cacheBytes=CACHE_BYTES, connections=CONNECTIONS, timeout=30):
+        self.baseURL = baseURL if baseURL.endswith('/') else baseURL + '/'
+        self.blockBytes = blockBytes
+        self.maxBlocks = max(1, cacheBytes // blockBytes)
+        self.timeout = timeout
+        self.blocks = OrderedDict()    #(path, block index): bytes, least recently used first
+        self.stats = {}    #path: (size, mtime ns or None)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=connections)
+
+    def url(self, path):
+        return self.baseURL + urllib.parse.quote(path)
+
+    def location(self, path=''):
+        return self.url(path)
+
+    def _open(self, path, method='GET', headers={}):
+        request = urllib.request.Request(self.url(path), method=method, headers=headers)
+        with self._lock:
+            self.requests += 1
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code in (404, 410):
+                raise FileNotFoundError("%s not found" % self.url(path))
+            raise
+
+    @staticmethod
+    def _mtime(response):
+        modified = response.headers.get('Last-Modified')
+        if modified is None:
+            return None
+        try:
+            return int(parsedate_to_datetime(modified).timestamp()) * 1000000000
+        except (TypeError, ValueError):
+            return None
+
+    def stat(self, path):
+        stat = self.stats.get(path)
+        if stat is None:
+            with self._open(path, 'HEAD') as response:
+                length = response.headers.get('Content-Length')
+                if length is None:
+                    raise OSError("%s: the server doesn't report its size" % self.url(path))
+                stat = (int(length), self._mtime(response))
+            self.stats[path] = stat
+        return stat
+
+    def list(self, path=''):
+        with self._open(path + '/' if path else '') as response:
+            page = response.read().decode('utf-8', 'replace')
+        names = []
+        for href in _HREF.findall(page):
+            name = urllib.parse.unquote(href)
+            if name.startswith('./'):
+                name = name[2:]
+            name = name.rstrip('/')
+            if name and not name.startswith('.') and '/' not in name and ':' not in name and name not in names:
+                names.append(name)
+        return names
+
+    def _fetchBlocks(self, path, first, last):
+        """Fetches blocks first..last of a file with one range request, into the cache."""
+        start = first * self.blockBytes
+        end = (last + 1) * self.blockBytes
+        try:
+            response = self._open(path, headers={'Range': 'bytes=%d-%d' % (start, end - 1)})
+        except urllib.error.HTTPError as e:
+            if e.code == 416:    #starts past the end
+                return
+            raise
+        with response:
+            match = _CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+            if response.status == 206 and match:
+                data = response.read()
+                size = None if match.group(3) == '*' else int(match.group(3))
+            else:
+                #the server ignored the range and is sending the whole file: fine only if that's all that was asked
+                #for, else every block missed would download it all again
+                data = response.read(end - start + 1) if start == 0 else b''
+                if start > 0 or len(data) > end - start:
+                    raise OSError("%s: the server doesn't support range requests" % self.url(path))
+                size = len(data)
+            if size is not None:
+                self.stats.setdefault(path, (size, self._mtime(response)))
+        with self._lock:
+            for i in range(first, last + 1):
+                offset = (i - first) * self.blockBytes
+                self.blocks[(path, i)] = data[offset:offset + self.blockBytes]
+                self.blocks.move_to_end((path, i))
+            while len(self.blocks) > self.maxBlocks:
+                self.blocks.popitem(last=False)
+
+    def _missingRuns(self, requests):
+        """(path, first, last) of the runs of uncached blocks that requests cover."""
+        wanted = set()
+        for path, offset, length in requests:
+            if length > 0:
+                for i in range(offset // self.blockBytes, (offset + length - 1) // self.blockBytes + 1):
+                    wanted.add((path, i))
+        with self._lock:
+            missing = sorted(key for key in wanted if key not in self.blocks)
+        runs = []
+        for path, i in missing:
+            if runs and runs[-1][0] == path and runs[-1][2] == i - 1:
+                runs[-1][2] = i
+            else:
+                runs.append([path, i, i])
+        return runs
+
+    def _fetchRuns(self, runs):
+        """Fetches runs concurrently on the executor; returns the exceptions any of them raised."""
+        futures = [self._executor.submit(self._fetchBlocks, path, first, last) for path, first, last in runs]
+        wait(futures)
+        return [future.exception() for future in futures if future.exception() is not None]
+
+    def prefetch(self, requests):
+        runs = self._missingRuns(requests)
+        if runs:
+            #only a hint: failures are left for the read that needs the data to report
+            self._fetchRuns(runs)
+
+    def read(self, path, offset=0, length=None):
+        if length is None:
+            length = max(0, self.stat(path)[0] - offset)
+        runs = self._missingRuns([(path, offset, length)])
+        if runs:
+            errors = self._fetchRuns(runs)
+            if errors:
+                raise errors[0]
+        parts = []
+        first = offset // self.blockBytes
+        for i in range(first, (offset + length - 1) // self.blockBytes + 1 if length > 0 else first):
+            with self._lock:
+                block = self.blocks.get((path, i))
+                if block is not None:
+                    self.blocks.move_to_end((path, i))
+            if block is None:    #evicted already: the request was bigger than the cache
+                self._fetchBlocks(path, i, i)
+                with self._lock:
+                    block = self.blocks.get((path, i), b'')
+            parts.append(block)
+            if len(block) < self.blockBytes:
+                break    #end of file
+        data = b''.join(parts)
+        start = offset - first * self.blockBytes
+        return data[start:start + length]
+
+    def close(self):
+        self._executor.shutdown(wait=False)